@@ -1,8 +1,13 @@
 import streamlit as st
 from streamlit_extras.app_logo import add_logo
 
+from workshop import warmup
+
 add_logo('fiddler-ai-logo.png', height=50)
 
+# Imports and JIT-compiles UMAP on a background thread, so the first viewer of pages 2 and 3 doesn't wait for it.
+warmup.start()
+
 st.title('Building Trust into Generative AI')
 
 st.header('Techniques for Model Visibility and Tracking Change in Data Distributions')
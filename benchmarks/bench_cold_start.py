@@ -0,0 +1,93 @@
+"""Time from a viewer's first visit to page 2's first plot, in a freshly started server process.
+
+    python benchmarks/bench_cold_start.py --rows 500 --boot-delay 10 --repeats 3
+
+Every measurement runs in a new Python process, as after a deploy or a restart. It imports what page 2
+imports, projects ``--rows`` random embeddings with ``ProjectionCache`` and serialises the ``ScatterView``
+figure to JSON, which is what Streamlit sends to the browser. Scenarios:
+
+- ``cold``: an empty numba cache and no warm-up, as before.
+- ``disk cache``: the numba cache a previous process filled, i.e. a restart with a persisted ``NUMBA_CACHE_DIR``.
+- ``warm-up``: an empty numba cache, with ``workshop.warmup.start()`` called at boot. The viewer
+  arrives ``--boot-delay`` seconds later.
+- ``warm-up + disk cache``: both.
+
+The OS page cache is not dropped between runs, so module files are read from memory after the first run.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+
+SCENARIOS = [('cold', False, False), ('disk cache', False, True), ('warm-up', True, False),
+             ('warm-up + disk cache', True, True)]
+
+
+def child(rows, warm, boot_delay):
+    """Runs in the measured process: boot, wait for the viewer, then time the first plot."""
+    if warm:
+        from workshop import warmup
+        warmup.start()
+        time.sleep(boot_delay)
+
+    start = time.perf_counter()
+    import numpy as np
+    import pandas as pd
+
+    from workshop.plotting import ScatterView
+    from workshop.projection import ProjectionCache
+    imported = time.perf_counter()
+
+    embeddings = np.random.default_rng(1).normal(scale=0.03, size=(rows, 1536)).astype(np.float32)
+    ids = [f'id-{n}' for n in range(rows)]
+    coords = ProjectionCache().project('session', ids, embeddings)
+    frame = pd.DataFrame({'prompt_id': ids, 'UMAP_0': coords[:, 0], 'UMAP_1': coords[:, 1]})
+    payload = ScatterView(frame, 'UMAP_0', 'UMAP_1').figure().to_json()
+    done = time.perf_counter()
+
+    print(json.dumps({'imports': imported - start, 'first_plot': done - start, 'payload_bytes': len(payload)}))
+
+
+def measure(rows, warm, boot_delay, cache_dir):
+    env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+    out = subprocess.run([sys.executable, __file__, '--child', '--rows', str(rows), '--boot-delay', str(boot_delay)]
+                         + (['--warm'] if warm else []),
+                         env=env, cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--boot-delay', type=float, default=10, help='Seconds between boot and the first viewer')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--warm', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.rows, args.warm, args.boot_delay)
+        return
+
+    print(f'{"scenario":>22}{"imports s":>11}{"first plot s":>14}{"payload KiB":>13}')
+    for name, warm, persisted in SCENARIOS:
+        results = []
+        for _ in range(args.repeats):
+            with tempfile.TemporaryDirectory() as cache_dir:
+                if persisted:
+                    # A previous process filled the cache before this "restart".
+                    measure(args.rows, False, 0, cache_dir)
+                results.append(measure(args.rows, warm, args.boot_delay, cache_dir))
+        imports = sorted(r['imports'] for r in results)[len(results) // 2]
+        first_plot = sorted(r['first_plot'] for r in results)[len(results) // 2]
+        print(f'{name:>22}{imports:>11.2f}{first_plot:>14.2f}{results[0]["payload_bytes"] / 2**10:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Memory and time per page rerun of the loaded dataset: object column of lists vs metadata + float32 matrix.
+
+    python benchmarks/bench_dataset_memory.py --rows 2000 --dim 1536 --reruns 10
+
+"lists" is the original layout. Every row's embedding is a Python list of floats in an object column. Each
+rerun does ``get_db_data().copy()``, filters to the session and rebuilds a float64 matrix with
+``np.asarray(df['embedding'].to_list())`` for UMAP. "matrix" is ``TableSync.frame()`` plus
+``TableSync.embeddings()``. The frame holds metadata only. A rerun filters it and, as ``run_umap`` does, hands
+the projection the shared read-only matrix with ``embedding_rows(df)``, the filtered frame's positions in it.
+``ProjectionCache`` only reads the rows it has to fit or place, which on a rerun is none, so nothing is copied.
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from workshop.store import embedding_rows  # noqa: E402
+
+SESSION_ID = 'session-0'
+SESSIONS = 4
+
+
+def make_data(rows, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(scale=0.03, size=(rows, dim)).astype(np.float32)
+    embeddings.setflags(write=False)
+    frame = pd.DataFrame({'prompt_id': [f'id-{n}' for n in range(rows)],
+                          'session_id': [f'session-{n % SESSIONS}' for n in range(rows)],
+                          'user': [f'user{n % 25}' for n in range(rows)],
+                          'prompt': ['a photo of a cat on a laptop'] * rows})
+    return frame, embeddings
+
+
+def read_only(matrix):
+    matrix.setflags(write=False)
+    return matrix
+
+
+def lists_rerun(loaded):
+    df = loaded.copy()
+    df = df[df['session_id'] == SESSION_ID]
+    return df, np.asarray(df['embedding'].to_list())
+
+
+def matrix_rerun(loaded):
+    frame, embeddings = loaded
+    df = frame[frame['session_id'] == SESSION_ID]
+    return df, embeddings, embedding_rows(df)
+
+
+def measure(load, rerun, reruns):
+    """(MiB held by the loaded dataset, peak MiB of one rerun on top of it, seconds per rerun)."""
+    gc.collect()
+    tracemalloc.start()
+    loaded = load()
+    held = tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.reset_peak()
+    result = rerun(loaded)
+    peak = tracemalloc.get_traced_memory()[1] - held
+    del result
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(reruns):
+        rerun(loaded)
+    return held / 2**20, peak / 2**20, (time.perf_counter() - start) / reruns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--reruns', type=int, default=10)
+    args = parser.parse_args()
+
+    frame, embeddings = make_data(args.rows, args.dim)
+    layouts = {'lists': (lambda: frame.assign(embedding=embeddings.astype(np.float64).tolist()), lists_rerun),
+               'matrix': (lambda: (frame.copy(), read_only(embeddings.copy())), matrix_rerun)}
+
+    print(f'{args.rows} rows x {args.dim} dimensions, {SESSIONS} sessions')
+    print(f'{"layout":>8}{"MiB held":>10}{"MiB/rerun":>11}{"ms/rerun":>10}')
+    for name, (load, rerun) in layouts.items():
+        held, peak, seconds = measure(load, rerun, args.reruns)
+        print(f'{name:>8}{held:>10.1f}{peak:>11.1f}{seconds * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
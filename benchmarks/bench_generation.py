@@ -0,0 +1,75 @@
+"""Time to image and to image + embedding, old sequential calls against ``Generator``, on a fake OpenAI server.
+
+    python benchmarks/bench_generation.py --prompts 20 --image-latency 2 --embedding-latency 0.3 --error-rate 0.2
+
+The sequential path is what page 1 used to do: one image call then one embedding call, no retries, so a
+429 on either loses the prompt.
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+
+import numpy as np
+import openai
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fake_openai import FakeOpenAI  # noqa: E402
+from workshop.generation import Generator  # noqa: E402
+
+
+def sequential(api_base, prompt):
+    start = time.perf_counter()
+    response = openai.Image.create(api_key='fake', api_base=api_base, n=1, prompt=prompt, size='256x256',
+                                   response_format='b64_json')
+    base64.b64decode(response['data'][0]['b64_json'])
+    image_seconds = time.perf_counter() - start
+    openai.Embedding.create(api_key='fake', api_base=api_base, input=[prompt], model='text-embedding-ada-002')
+    return image_seconds, time.perf_counter() - start
+
+
+def concurrent(generator, prompt):
+    start = time.perf_counter()
+    image, embedding = generator.submit(prompt)
+    image.result()
+    image_seconds = time.perf_counter() - start
+    embedding.result()
+    return image_seconds, time.perf_counter() - start
+
+
+def report(name, timings, failures):
+    if timings:
+        image, both = np.array(timings).T
+        print(f'{name:<12}image p50 {np.median(image):6.2f}s  both p50 {np.median(both):6.2f}s '
+              f'p95 {np.percentile(both, 95):6.2f}s  failed {failures}')
+    else:
+        print(f'{name:<12}all {failures} failed')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prompts', type=int, default=20)
+    parser.add_argument('--image-latency', type=float, default=2.)
+    parser.add_argument('--embedding-latency', type=float, default=0.3)
+    parser.add_argument('--rate-limit', type=float, default=0.)
+    parser.add_argument('--error-rate', type=float, default=0.1)
+    args = parser.parse_args()
+
+    prompts = [f'a photo of prompt number {n}' for n in range(args.prompts)]
+    with FakeOpenAI(image_latency=args.image_latency, embedding_latency=args.embedding_latency,
+                    rate_limit=args.rate_limit, error_rate=args.error_rate) as fake:
+        for name, run in [('sequential', lambda p: sequential(fake.api_base, p)),
+                          ('concurrent', lambda p, g=Generator('fake', api_base=fake.api_base): concurrent(g, p))]:
+            timings, failures = [], 0
+            for prompt in prompts:
+                try:
+                    timings.append(run(prompt))
+                except openai.error.OpenAIError:
+                    failures += 1
+            report(name, timings, failures)
+
+
+if __name__ == '__main__':
+    main()
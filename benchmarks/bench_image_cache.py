@@ -0,0 +1,83 @@
+"""Hit rate and latency of the image cache against direct S3 gets, using a moto S3 stand-in.
+
+    python benchmarks/bench_image_cache.py --images 200 --clicks 1000 --latency 0.05
+
+Clicks follow a Zipf distribution over the images, as a handful of points get most attention. After
+each click the next few images are prefetched, standing in for the selection's nearest neighbours.
+``--latency`` adds a fixed delay to every S3 GetObject, since moto answers in-process.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+import boto3
+import numpy as np
+from moto import mock_aws
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from workshop.images import ImageCache  # noqa: E402
+
+BUCKET_NAME = 'bench-workshop'
+
+
+def make_png(rng, size=256):
+    out = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)).save(out, format='PNG')
+    return out.getvalue()
+
+
+def percentiles(seconds):
+    return ' '.join(f'p{q}={np.percentile(seconds, q) * 1000:7.2f}ms' for q in (50, 95, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--clicks', type=int, default=1000)
+    parser.add_argument('--zipf', type=float, default=1.3)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds added to each S3 GetObject')
+    parser.add_argument('--memory-mb', type=float, default=8)
+    parser.add_argument('--prefetch', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        bucket = s3.create_bucket(Bucket=BUCKET_NAME)
+        ids = [f'prompt-{n}' for n in range(args.images)]
+        for prompt_id in ids:
+            bucket.put_object(Key=prompt_id + '.png', Body=make_png(rng))
+
+        s3.meta.client.meta.events.register('after-call.s3.GetObject', lambda **_: time.sleep(args.latency))
+        clicks = (rng.zipf(args.zipf, size=args.clicks) - 1) % args.images
+
+        direct = []
+        for n in clicks:
+            start = time.perf_counter()
+            bucket.Object(ids[n] + '.png').get()['Body'].read()
+            direct.append(time.perf_counter() - start)
+        print(f'direct       {percentiles(direct)}')
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ImageCache(bucket, directory=directory, memory_bytes=int(args.memory_mb * 2**20))
+            cached = []
+            for n in clicks:
+                start = time.perf_counter()
+                cache.get(ids[n])
+                cached.append(time.perf_counter() - start)
+                cache.prefetch(ids[(n + 1) % args.images:(n + 1) % args.images + args.prefetch])
+            print(f'cached       {percentiles(cached)}  hit rate {cache.hit_rate:.1%}  {cache.stats}')
+
+            start = time.perf_counter()
+            for n in clicks:
+                cache.get(ids[n], thumbnail=True)
+            print(f'thumbnails   {(time.perf_counter() - start) / len(clicks) * 1000:.2f}ms per click')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Fit time and neighbourhood preservation of the reducer pipelines against the default first-128-dims slice.
+
+    python benchmarks/bench_reducers.py --rows 500 2000 10000
+    python benchmarks/bench_reducers.py --snapshot path/to/part-0.parquet
+
+Quality is measured against cosine neighbours in the full embedding space on a sample of at most
+``--sample`` rows: sklearn's trustworthiness and the fraction of each point's k nearest neighbours
+that are still among its k nearest neighbours in 2-D.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.manifold import trustworthiness
+from sklearn.neighbors import NearestNeighbors
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from workshop.reducers import ReducerPipeline  # noqa: E402
+from workshop.snapshot import read_snapshot  # noqa: E402
+
+CONFIGS = [('slice-128 + umap', 'umap', 'slice'),
+           ('pca-128 + umap', 'umap', 'pca'),
+           ('random-128 + umap', 'umap', 'random'),
+           ('full + umap', 'umap', None),
+           ('pca-128 + pca', 'pca', 'pca'),
+           ('pca-128 + tsne', 'tsne', 'pca')]
+
+
+def clustered_embeddings(rows, dim, n_clusters=12, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    X = centers[rng.integers(n_clusters, size=rows)] + rng.normal(scale=0.6, size=(rows, dim))
+    return (X / np.linalg.norm(X, axis=1, keepdims=True)).astype(np.float32)
+
+
+def neighbor_preservation(X, Y, k):
+    high = NearestNeighbors(n_neighbors=k + 1, metric='cosine').fit(X).kneighbors(return_distance=False)
+    low = NearestNeighbors(n_neighbors=k + 1).fit(Y).kneighbors(return_distance=False)
+    return np.mean([len(set(h) & set(l)) / (k + 1) for h, l in zip(high, low)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[500, 2000, 10000])
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--snapshot', help='Use the embeddings of a Parquet snapshot instead of synthetic data')
+    parser.add_argument('--sample', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.snapshot:
+        _, embeddings = read_snapshot(args.snapshot)
+        datasets = [embeddings]
+    else:
+        datasets = [clustered_embeddings(rows, args.dim) for rows in args.rows]
+
+    rng = np.random.default_rng(0)
+    print(f'{"rows":>7}  {"pipeline":<20}{"fit s":>8}{"trust":>8}{"knn kept":>10}')
+    for X in datasets:
+        sample = np.sort(rng.choice(len(X), size=min(args.sample, len(X)), replace=False))
+        for name, backend, prestage in CONFIGS:
+            start = time.perf_counter()
+            Y = ReducerPipeline(backend=backend, prestage=prestage).fit_transform(X)
+            elapsed = time.perf_counter() - start
+
+            trust = trustworthiness(X[sample], Y[sample], n_neighbors=args.k, metric='cosine')
+            kept = neighbor_preservation(X[sample], Y[sample], args.k)
+            print(f'{len(X):>7}  {name:<20}{elapsed:>8.2f}{trust:>8.3f}{kept:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Compare the session-scoped Query path with scan-then-filter against a moto DynamoDB stand-in.
+
+    python benchmarks/bench_session_query.py --rows 2000 --sessions 10
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+import boto3
+from moto import mock_aws
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from workshop.store import PROJECTED_ATTRIBUTES, TableSync  # noqa: E402
+
+TABLE_NAME = 'bench-workshop'
+INDEX_NAME = 'session_id-time-index'
+
+
+def item_size(value):
+    """Rough DynamoDB item size in bytes, following the AWS sizing rules."""
+    if isinstance(value, dict):
+        return 3 + sum(len(k) + item_size(v) for k, v in value.items())
+    if isinstance(value, list):
+        return 3 + sum(1 + item_size(v) for v in value)
+    if isinstance(value, Decimal):
+        return 1 + (len(value.as_tuple().digits) + 1) // 2
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return len(str(value).encode())
+
+
+def make_item(session, n, dim):
+    return {'prompt_id': f'{session}-{n}',
+            'session_id': session,
+            'time': 1_690_000_000 + n,
+            'human_time': 'Sat, 22 Jul 2023 04:26:40 UTC',
+            'user': f'user{n % 25}',
+            'prompt': 'a photo of a cat on a laptop',
+            'final_prompt': 'a photo of a dog on a laptop',
+            'clue': 'cartoon',
+            'embedding': [Decimal(str(random.uniform(-0.1, 0.1))[:9]) for _ in range(dim)],
+            'prompt_number': n % 12,
+            'category': 'cartoon',
+            'features': {'Who': 'a cat', 'What': 'a laptop'},
+            'feedback_quality': 5,
+            'feedback_fidelity': 'Yes',
+            'feedback_bias': 'No',
+            'feedback_notes': ''}
+
+
+def create_table(ddb):
+    return ddb.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'prompt_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'prompt_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'session_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'time', 'AttributeType': 'N'}],
+        GlobalSecondaryIndexes=[{'IndexName': INDEX_NAME,
+                                 'KeySchema': [{'AttributeName': 'session_id', 'KeyType': 'HASH'},
+                                               {'AttributeName': 'time', 'KeyType': 'RANGE'}],
+                                 'Projection': {'ProjectionType': 'ALL'}}],
+        BillingMode='PAY_PER_REQUEST')
+
+
+def run(table, avg_size, **kwargs):
+    table_sync = TableSync(table, **kwargs)
+    start = time.perf_counter()
+    rows = table_sync.sync()
+    elapsed = time.perf_counter() - start
+    return {'rows': rows, 'seconds': elapsed, 'requests': table_sync.stats['requests'],
+            'scanned': table_sync.stats['scanned'], 'mb_read': table_sync.stats['scanned'] * avg_size / 2**20}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--dim', type=int, default=1536)
+    args = parser.parse_args()
+
+    with mock_aws():
+        ddb = boto3.resource('dynamodb', region_name='us-west-2')
+        table = create_table(ddb)
+
+        sizes = []
+        with table.batch_writer() as batch:
+            for n in range(args.rows):
+                item = make_item(f'session{n % args.sessions}', n, args.dim)
+                sizes.append(item_size(item))
+                batch.put_item(Item=item)
+        avg_size = sum(sizes) / len(sizes)
+
+        results = {
+            'full scan': run(table, avg_size),
+            'scan + session filter': run(table, avg_size, session_id='session0', attributes=PROJECTED_ATTRIBUTES),
+            'query on index': run(table, avg_size, session_id='session0', index_name=INDEX_NAME,
+                                  attributes=PROJECTED_ATTRIBUTES),
+        }
+
+    print(f'{args.rows} rows, {args.sessions} sessions, ~{avg_size / 1024:.1f} KiB per item')
+    print(f'{"path":<24}{"rows":>8}{"requests":>10}{"scanned":>10}{"MiB read":>10}{"seconds":>10}')
+    for name, r in results.items():
+        print(f'{name:<24}{r["rows"]:>8}{r["requests"]:>10}{r["scanned"]:>10}{r["mb_read"]:>10.1f}'
+              f'{r["seconds"]:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
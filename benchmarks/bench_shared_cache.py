@@ -0,0 +1,89 @@
+"""Memory held and UMAP work done for V concurrent viewers of pages 2 and 3, before and after sharing.
+
+    python benchmarks/bench_shared_cache.py --rows 2000 --viewers 1 5 20
+
+"per-page" reproduces the old layout: each page had its own ``st.cache_data`` entries, which hand every
+caller a fresh unpickled copy of a DataFrame whose embedding column holds Python lists, and each page
+fitted its own UMAP. "shared" is ``workshop.analytics``: one float32 matrix and one ProjectionCache.
+"""
+import argparse
+import os
+import pickle
+import sys
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from workshop.projection import ProjectionCache  # noqa: E402
+
+PAGES = 2
+
+
+def make_data(rows, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(scale=0.03, size=(rows, dim)).astype(np.float32)
+    frame = pd.DataFrame({'prompt_id': [f'id-{n}' for n in range(rows)],
+                          'user': [f'user{n % 25}' for n in range(rows)],
+                          'prompt': ['a photo of a cat on a laptop'] * rows})
+    return frame, embeddings
+
+
+def per_page(frame, embeddings, viewers, fit):
+    legacy = frame.assign(embedding=embeddings.astype(np.float64).tolist())
+    pickled = {page: pickle.dumps(legacy) for page in range(PAGES)}
+    del legacy
+
+    tracemalloc.start()
+    held = [pickle.loads(pickled[page]) for _ in range(viewers) for page in range(PAGES)]
+    held += [np.asarray(df['embedding'].to_list()) for df in held[:PAGES]]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    fits, seconds = PAGES, 0.
+    if fit:
+        caches = [ProjectionCache() for _ in range(PAGES)]
+        for cache in caches:
+            cache.project('session', frame['prompt_id'], embeddings)
+        seconds = sum(cache.stats['fit_seconds'] for cache in caches)
+    return memory, fits, seconds
+
+
+def shared(frame, embeddings, viewers, fit):
+    tracemalloc.start()
+    store = (frame.copy(), embeddings.copy())
+    store[1].setflags(write=False)
+    held = [store for _ in range(viewers) for _ in range(PAGES)]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    fits, seconds = 1, 0.
+    if fit:
+        cache = ProjectionCache()
+        for _ in range(viewers * PAGES):
+            cache.project('session', frame['prompt_id'], held[0][1])
+        fits, seconds = cache.stats['misses'], cache.stats['fit_seconds']
+    return memory, fits, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--viewers', type=int, nargs='+', default=[1, 5, 20])
+    parser.add_argument('--no-fit', action='store_true', help='Skip the UMAP fits, only measure memory')
+    args = parser.parse_args()
+
+    frame, embeddings = make_data(args.rows, args.dim)
+
+    print(f'{"viewers":>8}{"layout":>10}{"MiB held":>10}{"UMAP fits":>11}{"fit s":>8}')
+    for viewers in args.viewers:
+        for name, run in [('per-page', per_page), ('shared', shared)]:
+            memory, fits, seconds = run(frame, embeddings, viewers, not args.no_fit)
+            print(f'{viewers:>8}{name:>10}{memory / 2**20:>10.1f}{fits:>11}{seconds:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Load time and peak RSS of the old CSV + eval export versus the Parquet snapshot.
+
+    python benchmarks/bench_snapshot_load.py --rows 10000 100000
+
+Every load runs in a fresh interpreter so peak RSS is measured per format.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from workshop.snapshot import read_snapshot, to_arrow, to_parquet_bytes  # noqa: E402
+
+
+def make_frame(rows, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({'prompt_id': [f'id-{n}' for n in range(rows)],
+                          'user': [f'user{n % 25}' for n in range(rows)],
+                          'prompt': ['a photo of a cat on a laptop'] * rows,
+                          'category': rng.choice(['arts', 'sports', 'travel'], size=rows),
+                          'prompt_number': np.arange(rows) % 12,
+                          'feedback_quality': rng.integers(1, 6, size=rows)})
+    embeddings = rng.normal(scale=0.03, size=(rows, dim)).astype(np.float32)
+    return frame, embeddings
+
+
+def write_files(directory, rows, dim):
+    frame, embeddings = make_frame(rows, dim)
+
+    csv_path = os.path.join(directory, f'{rows}.csv')
+    frame.assign(embedding=[[float(f'{x:.6g}') for x in row] for row in embeddings]).to_csv(csv_path, index=False)
+
+    parquet_path = os.path.join(directory, f'{rows}.parquet')
+    with open(parquet_path, 'wb') as f:
+        f.write(to_parquet_bytes(to_arrow(frame, embeddings)))
+
+    return csv_path, parquet_path
+
+
+def load(fmt, path):
+    start = time.perf_counter()
+    if fmt == 'csv':
+        df = pd.read_csv(path)
+        df['embedding'] = df['embedding'].apply(lambda x: eval(x))
+        embs = np.array(df['embedding'].tolist())
+    else:
+        df, embs = read_snapshot(path)
+    embs[:, :128].sum()
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is KiB on Linux
+    print(f'{elapsed:.3f} {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--load', nargs=2, metavar=('FORMAT', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load:
+        load(*args.load)
+        return
+
+    print(f'{"rows":>8}{"format":>10}{"MiB on disk":>13}{"load s":>9}{"peak RSS MiB":>14}')
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            for fmt, path in zip(['csv', 'parquet'], write_files(directory, rows, args.dim)):
+                out = subprocess.run([sys.executable, __file__, '--load', fmt, path],
+                                     check=True, capture_output=True, text=True).stdout.split()
+                print(f'{rows:>8}{fmt:>10}{os.path.getsize(path) / 2**20:>13.1f}{float(out[0]):>9.2f}'
+                      f'{float(out[1]):>14.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""A local stand-in for the OpenAI image and embedding endpoints, with configurable latency and rate limits.
+
+    python benchmarks/fake_openai.py --port 8765 --image-latency 2 --embedding-latency 0.3 --rate-limit 5
+
+Then set ``OPENAI_API_BASE = "http://localhost:8765/v1"`` in ``.streamlit/secrets.toml`` (any API key
+works). Images are random PNGs; embeddings are random unit vectors, returned base64-encoded when the
+client asks for it as openai 0.27 does. Requests over ``--rate-limit`` per second, and a random
+``--error-rate`` fraction of the rest, get a 429.
+"""
+import argparse
+import base64
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from PIL import Image
+
+EMBEDDING_DIM = 1536
+
+
+class TokenBucket:
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        if not self.rate:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class FakeOpenAI:
+    """Serves on a background thread. ``api_base`` is what to hand the openai client."""
+
+    def __init__(self, port=0, image_latency=1., embedding_latency=0.2, jitter=0.2, rate_limit=0., error_rate=0.,
+                 image_size=256, seed=0):
+        self.image_latency = image_latency
+        self.embedding_latency = embedding_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.image_size = image_size
+        self.bucket = TokenBucket(rate_limit)
+        self.stats = {'images': 0, 'embeddings': 0, 'rate_limited': 0}
+
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_base(self):
+        return f'http://127.0.0.1:{self._server.server_address[1]}/v1'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name='fake-openai')
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _sleep(self, latency):
+        with self._lock:
+            scale = self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+        time.sleep(latency * scale)
+
+    def _limited(self):
+        with self._lock:
+            unlucky = self._rng.random() < self.error_rate
+        if unlucky or not self.bucket.take():
+            with self._lock:
+                self.stats['rate_limited'] += 1
+            return True
+        return False
+
+    def image(self, body):
+        self._sleep(self.image_latency)
+        with self._lock:
+            pixels = self._rng.integers(0, 256, size=(self.image_size, self.image_size, 3), dtype=np.uint8)
+            self.stats['images'] += 1
+        out = io.BytesIO()
+        Image.fromarray(pixels).save(out, format='PNG')
+        return {'created': int(time.time()),
+                'data': [{'b64_json': base64.b64encode(out.getvalue()).decode()} for _ in range(body.get('n', 1))]}
+
+    def embeddings(self, body):
+        inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+        self._sleep(self.embedding_latency)
+        with self._lock:
+            vectors = self._rng.normal(size=(len(inputs), EMBEDDING_DIM)).astype(np.float32)
+            self.stats['embeddings'] += len(inputs)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        as_base64 = body.get('encoding_format') == 'base64'
+        data = [{'object': 'embedding', 'index': i,
+                 'embedding': base64.b64encode(v.tobytes()).decode() if as_base64 else v.tolist()}
+                for i, v in enumerate(vectors)]
+        return {'object': 'list', 'data': data, 'model': body.get('model'),
+                'usage': {'prompt_tokens': 0, 'total_tokens': 0}}
+
+    def _handler(self):
+        fake = self
+        routes = {'/v1/images/generations': self.image, '/v1/embeddings': self.embeddings}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                route = routes.get(self.path)
+                if route is None:
+                    self._reply(404, {'error': {'message': f'No route {self.path}', 'type': 'invalid_request_error'}})
+                elif fake._limited():
+                    self._reply(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}})
+                else:
+                    self._reply(200, route(body))
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--image-latency', type=float, default=2.)
+    parser.add_argument('--embedding-latency', type=float, default=0.3)
+    parser.add_argument('--jitter', type=float, default=0.2, help='Latencies vary uniformly by this fraction')
+    parser.add_argument('--rate-limit', type=float, default=0., help='Requests per second; 0 for no limit')
+    parser.add_argument('--error-rate', type=float, default=0., help='Fraction of requests answered with a 429')
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(port=args.port, image_latency=args.image_latency, embedding_latency=args.embedding_latency,
+                      jitter=args.jitter, rate_limit=args.rate_limit, error_rate=args.error_rate)
+    print(f'Serving on {fake.api_base}')
+    fake.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
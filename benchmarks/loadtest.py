@@ -0,0 +1,226 @@
+"""Load test of page 1's prompt flow: N workshop participants submitting at the same time, fully offline.
+
+    python benchmarks/loadtest.py --users 40 --prompts 3 --image-latency 2 --rate-limit 20 --aws-latency 0.02
+
+Every simulated user runs page 1's loop: ``generate_clues``, think, send the final prompt to the image
+and embedding endpoints together (``Generator.submit``), wait for the image, rate it, then submit the row
+(encode the embedding and ``SubmitQueue.put``). As on the real server, all users share one ``Generator``,
+embedding cache and ``SubmitQueue``. OpenAI is ``fake_openai.FakeOpenAI``, and S3 and DynamoDB are moto
+with ``--aws-latency`` added to each upload and batch write.
+
+Stages reported, with p50/p95/p99:
+
+- ``image``: prompt sent until the image is shown.
+- ``embedding``: prompt sent until the embedding is in.
+- ``submit``: the Submit click until it is acknowledged.
+- ``persisted``: acknowledged until the row is in the table, written by the queue's background thread.
+- ``prompt``: the whole loop for one prompt, think times included.
+
+Throughput is rows persisted per second, measured from the first submission to the last write. ``--json``
+prints the same report as one JSON object, for CI.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from uuid import uuid1
+
+import boto3
+import numpy as np
+from moto import mock_aws
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fake_openai import FakeOpenAI  # noqa: E402
+from workshop.clues import final_prompt, generate_clues  # noqa: E402
+from workshop.embedding_cache import EmbeddingCache  # noqa: E402
+from workshop.embeddings import DEFAULT_DTYPE, encode_embedding  # noqa: E402
+from workshop.generation import Generator  # noqa: E402
+from workshop.submit_queue import SubmitQueue  # noqa: E402
+
+BUCKET_NAME = 'loadtest-workshop'
+TABLE_NAME = 'loadtest-workshop'
+SESSION_ID = 'loadtest'
+STAGES = ['image', 'embedding', 'submit', 'persisted', 'prompt']
+
+
+class Recorder:
+    """Thread-safe lists of seconds per stage, plus failure counts."""
+
+    def __init__(self):
+        self.seconds = defaultdict(list)
+        self.failures = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage].append(seconds)
+
+    def fail(self, stage):
+        with self._lock:
+            self.failures[stage] += 1
+
+
+def create_resources():
+    s3 = boto3.resource('s3', region_name='us-east-1')
+    bucket = s3.create_bucket(Bucket=BUCKET_NAME)
+    table = boto3.resource('dynamodb', region_name='us-east-1').create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[{'AttributeName': 'prompt_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'prompt_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+    return bucket, table
+
+
+def user(n, args, generator, queue, recorder, acknowledged, start_barrier):
+    rng = random.Random(n)
+    name = f'user{n}'
+    start_barrier.wait()
+    for prompt_number in range(args.prompts):
+        prompt_start = time.perf_counter()
+        category, features = generate_clues(prompt_number, rng)
+        time.sleep(rng.uniform(0, 2 * args.think_time))
+        prompt = f'A photo of {" and ".join(features.values())} for the {category} section.'
+
+        sent = time.perf_counter()
+        image_future, embedding_future = generator.submit(final_prompt(prompt))
+        try:
+            image = image_future.result()
+            recorder.add('image', time.perf_counter() - sent)
+        except Exception:
+            recorder.fail('image')
+            continue
+        try:
+            embedding = embedding_future.result()
+            recorder.add('embedding', time.perf_counter() - sent)
+        except Exception:
+            recorder.fail('embedding')
+            continue
+
+        time.sleep(rng.uniform(0, 2 * args.think_time))
+        submitted = time.perf_counter()
+        item = {'prompt_id': str(uuid1()), 'user': name, 'session_id': SESSION_ID, 'prompt': prompt,
+                'final_prompt': final_prompt(prompt), 'time': int(time.time()), 'prompt_number': prompt_number,
+                'category': category, 'features': features, 'feedback_quality': rng.randint(1, 5),
+                'embedding': encode_embedding(embedding, DEFAULT_DTYPE), 'embedding_dtype': DEFAULT_DTYPE,
+                'embedding_model': generator.embedding_model}
+        queue.put(item, image=image)
+        now = time.perf_counter()
+        acknowledged[item['prompt_id']] = now
+        recorder.add('submit', now - submitted)
+        recorder.add('prompt', now - prompt_start)
+
+
+def watch_writes(table, written):
+    """Record when each row's write returns, using the client's own event hooks.
+
+    The queue writes in batches, and falls back to one ``PutItem`` per row when a batch fails.
+    """
+    def before_write(params, context, **_):
+        # Still plain Python values here, before the resource layer serialises them.
+        if 'Item' in params:
+            context['prompt_ids'] = [params['Item']['prompt_id']]
+        else:
+            context['prompt_ids'] = [request['PutRequest']['Item']['prompt_id']
+                                     for request in params['RequestItems'].get(TABLE_NAME, [])]
+
+    def after_write(context, parsed, **_):
+        if 'Error' in parsed:
+            return
+        now = time.perf_counter()
+        for prompt_id in context.get('prompt_ids', []):
+            written[prompt_id] = now
+
+    events = table.meta.client.meta.events
+    for operation in ('BatchWriteItem', 'PutItem'):
+        events.register(f'provide-client-params.dynamodb.{operation}', before_write)
+        events.register(f'after-call.dynamodb.{operation}', after_write)
+
+
+def percentiles(values):
+    return {f'p{q}': float(np.percentile(values, q)) for q in (50, 95, 99)} if values else {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--prompts', type=int, default=3, help='Prompts per user')
+    parser.add_argument('--think-time', type=float, default=1., help='Mean seconds spent typing or rating')
+    parser.add_argument('--image-latency', type=float, default=2.)
+    parser.add_argument('--embedding-latency', type=float, default=0.3)
+    parser.add_argument('--rate-limit', type=float, default=0., help='OpenAI requests per second; 0 for none')
+    parser.add_argument('--error-rate', type=float, default=0., help='Fraction of OpenAI requests given a 429')
+    parser.add_argument('--aws-latency', type=float, default=0.02, help='Seconds added to each S3/DynamoDB write')
+    parser.add_argument('--workers', type=int, default=8, help='Generator threads, as on the server')
+    parser.add_argument('--drain-timeout', type=float, default=120.)
+    parser.add_argument('--json', action='store_true', help='Print the report as one JSON object')
+    args = parser.parse_args()
+
+    recorder, acknowledged, written = Recorder(), {}, {}
+    with mock_aws(), tempfile.TemporaryDirectory() as directory, \
+            FakeOpenAI(image_latency=args.image_latency, embedding_latency=args.embedding_latency,
+                       rate_limit=args.rate_limit, error_rate=args.error_rate) as fake:
+        bucket, table = create_resources()
+        for client, event in [(bucket.meta.client, 'before-call.s3.PutObject'),
+                              (table.meta.client, 'before-call.dynamodb.BatchWriteItem')]:
+            client.meta.events.register(event, lambda **_: time.sleep(args.aws_latency))
+        watch_writes(table, written)
+
+        generator = Generator('fake', api_base=fake.api_base, max_workers=args.workers,
+                              embedding_cache=EmbeddingCache(os.path.join(directory, 'embeddings.sqlite')))
+        queue = SubmitQueue(bucket, table, path=os.path.join(directory, 'submissions.sqlite'))
+
+        start_barrier = threading.Barrier(args.users + 1)
+        threads = [threading.Thread(target=user, args=(n, args, generator, queue, recorder, acknowledged,
+                                                       start_barrier))
+                   for n in range(args.users)]
+        for thread in threads:
+            thread.start()
+        start_barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        users_done = time.perf_counter() - start
+
+        deadline = time.monotonic() + args.drain_timeout
+        while queue.depth() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        # The queue can write a row before its user's thread has noted the acknowledgement, hence the clamp.
+        for prompt_id, at in written.items():
+            if prompt_id in acknowledged:
+                recorder.add('persisted', max(at - acknowledged[prompt_id], 0.))
+        first_submit = min(acknowledged.values(), default=start)
+        last_write = max(written.values(), default=first_submit)
+
+        report = {'users': args.users, 'prompts_per_user': args.prompts,
+                  'stages': {stage: {'count': len(recorder.seconds[stage]), 'failed': recorder.failures[stage],
+                                     **percentiles(recorder.seconds[stage])} for stage in STAGES},
+                  'acknowledged': len(acknowledged), 'persisted': len(written), 'left_in_queue': queue.depth(),
+                  'users_seconds': users_done,
+                  'persisted_per_second': len(written) / max(last_write - first_submit, 1e-9),
+                  'openai': dict(fake.stats), 'queue': {k: v for k, v in queue.stats.items() if k != 'last_error'}}
+
+    if args.json:
+        print(json.dumps(report))
+        return
+
+    print(f'{args.users} users x {args.prompts} prompts, image {args.image_latency}s, '
+          f'embedding {args.embedding_latency}s, rate limit {args.rate_limit or "none"}, '
+          f'AWS +{args.aws_latency}s')
+    print(f'{"stage":>10}{"count":>7}{"failed":>8}{"p50 s":>8}{"p95 s":>8}{"p99 s":>8}')
+    for stage, row in report['stages'].items():
+        quantiles = ''.join(f'{row[p]:>8.2f}' if p in row else f'{"-":>8}' for p in ('p50', 'p95', 'p99'))
+        print(f'{stage:>10}{row["count"]:>7}{row["failed"]:>8}{quantiles}')
+    print(f'{report["persisted"]} of {report["acknowledged"]} submissions persisted '
+          f'({report["left_in_queue"]} still queued), {report["persisted_per_second"]:.1f} rows/s sustained; '
+          f'users finished in {users_done:.1f}s')
+    print(f'OpenAI: {report["openai"]}; queue: {report["queue"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,27 @@
-import io
 import time
 import boto3
-import openai
-import base64
-import random
 import streamlit as st
 from uuid import uuid1
-from decimal import Decimal
+
+from workshop import metrics
+from workshop.clues import final_prompt, generate_clues
+from workshop.debug import debug_panel, start_rerun
+from workshop.embedding_cache import EmbeddingCache
+from workshop.embeddings import DEFAULT_DTYPE, encode_embedding
+from workshop.generation import Generator
+from workshop.submit_queue import SubmitQueue
 
 from streamlit_extras.app_logo import add_logo
 add_logo('fiddler-ai-logo.png', height=50)
+start_rerun()
 
 
 SESSION_ID = st.secrets['SESSION_ID']
 TOT_PROMPTS_TO_DO = 12
 
 OPENAI_API_KEY = st.secrets['OPENAI_API_KEY']
+# Optional override, e.g. http://localhost:8765/v1 for benchmarks/fake_openai.py.
+OPENAI_API_BASE = st.secrets.get('OPENAI_API_BASE')
 AWS_S3_BUCKET_NAME = st.secrets['AWS_S3_BUCKET_NAME']
 AWS_DYNAMODB_TABLE_NAME = st.secrets['AWS_DYNAMODB_TABLE_NAME']
 AWS_REGION = st.secrets['AWS_REGION']
@@ -23,50 +29,57 @@ AWS_REGION = st.secrets['AWS_REGION']
 AWS_ACCESS_KEY_ID = st.secrets['AWS_ACCESS_KEY_ID']
 AWS_SECRET_ACCESS_KEY = st.secrets['AWS_SECRET_ACCESS_KEY']
 
-CAT_DOG_PROB = 0.1
-DAYS_IN_GROUP = 4
+# 'float16' halves item size again at the cost of ~3 significant digits.
+EMBEDDING_DTYPE = st.secrets.get('EMBEDDING_DTYPE', DEFAULT_DTYPE)
 
-s3_bucket = boto3.resource('s3',
-                           region_name=AWS_REGION,
-                           aws_access_key_id=AWS_ACCESS_KEY_ID,
-                           aws_secret_access_key=AWS_SECRET_ACCESS_KEY).Bucket(AWS_S3_BUCKET_NAME)
+# SQLite file shared by every session and server process on this host.
+EMBEDDING_CACHE_PATH = './temp/embeddings.sqlite'
 
-ddb_table = boto3.resource('dynamodb',
-                           region_name=AWS_REGION,
-                           aws_access_key_id=AWS_ACCESS_KEY_ID,
-                           aws_secret_access_key=AWS_SECRET_ACCESS_KEY).Table(AWS_DYNAMODB_TABLE_NAME)
 
-def get_image(prompt='a gray cat jumping between pieces of furnatiure', size="256x256"):
-    response = openai.Image.create(
-      api_key=OPENAI_API_KEY,
-      n=1,
-      prompt=prompt,
-      size=size,
-      response_format="b64_json"
-    )
+@st.cache_resource
+def get_submit_queue():
+    s3_bucket = boto3.resource('s3',
+                               region_name=AWS_REGION,
+                               aws_access_key_id=AWS_ACCESS_KEY_ID,
+                               aws_secret_access_key=AWS_SECRET_ACCESS_KEY).Bucket(AWS_S3_BUCKET_NAME)
 
-    return response['data'][0]['b64_json']
+    ddb_table = boto3.resource('dynamodb',
+                               region_name=AWS_REGION,
+                               aws_access_key_id=AWS_ACCESS_KEY_ID,
+                               aws_secret_access_key=AWS_SECRET_ACCESS_KEY).Table(AWS_DYNAMODB_TABLE_NAME)
 
+    submit_queue = SubmitQueue(s3_bucket, ddb_table)
+    metrics.add_collector('submit_queue', lambda: dict(submit_queue.stats, depth=submit_queue.depth(),
+                                                       oldest_seconds=submit_queue.oldest_seconds(),
+                                                       dead_letters=submit_queue.dead_letters()))
+    return submit_queue
 
-def get_embedding(prompt='a gray cat jumping between pieces of furniture', model='text-embedding-ada-002'):
-    response = openai.Embedding.create(
-      api_key=OPENAI_API_KEY,
-      input=[prompt],
-      model=model
-    )
 
-    return [Decimal(str(x)[:9]) for x in response['data'][0]['embedding']]
+@st.cache_resource
+def get_generator():
+    embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+    metrics.add_collector('embedding_cache', lambda: dict(embedding_cache.stats, hit_ratio=embedding_cache.hit_ratio))
+    return Generator(OPENAI_API_KEY, api_base=OPENAI_API_BASE, embedding_cache=embedding_cache)
 
 
 def submit_data():
 
+    # The embedding was requested alongside the image and has usually arrived by now.
+    try:
+        state[KEY_EMBEDDING] = encode_embedding(state[KEY_EMBEDDING_FUTURE].result(), EMBEDDING_DTYPE)
+        state[KEY_EMBEDDING_DTYPE] = EMBEDDING_DTYPE
+        state[KEY_EMBEDDING_MODEL] = get_generator().embedding_model
+    except Exception as e:
+        state[KEY_EMBEDDING_FUTURE] = get_generator().submit_embedding(state[KEY_FINAL_PROMPT])
+        st.error("The following error occurred generating embeddings:\n\n\"" + str(e) + '\"\n\nPlease submit again.')
+        return
+
     data_dict = {k: v for k, v in state.items() if k in STATE_KEYS}
 
     data_dict[KEY_USER_ID] = data_dict[KEY_USER_ID].lower()
 
-    s3_bucket.upload_fileobj(io.BytesIO(data_dict.pop(KEY_IMAGE)), data_dict[KEY_UUID] + '.png', )
-
-    ddb_table.put_item(Item=data_dict)
+    # Saved locally right away; the image upload and the table write happen in the background.
+    get_submit_queue().put(data_dict, image=data_dict.pop(KEY_IMAGE))
 
     state[KEY_PROMPT_NUMBER] += 1
 
@@ -75,90 +88,6 @@ def submit_data():
     next_prompt()
 
 
-politics_details = {'Who': ['the president', 'a mayor', 'a senator', 'a politician', 'protestors'],
-                    'Where': ['the White House', 'a restaurant', 'a podium', 'a park'],
-                    'What': ['a scandal', 'an agreement', 'a debate', 'a surprise', 'a celebration']}
-
-arts_details = {'Who': ['a painter', 'musicians', 'a photographer', 'a child'],
-                'Where': ['a gallery', 'a cafe', 'a museum', 'a natural scene'],
-                'What': ['a painting', 'a sculpture', 'a performance', 'a paintbrush', 'a sweater', 'a portrait']}
-
-sports_details = {'Game': ['golf', 'soccer', 'baseball', 'cricket', 'football', 'climbing', 'cycling'],
-                  'What': ['victory', 'rivalry', 'history', 'weather', 'new record', 'injury'],
-                  'Where': ['stadium', 'university', 'back yard', 'arena', 'national park']}
-
-business_details = {'Who': ['an executive', 'a mechanic', 'a family', 'workers'],
-                    'Where': ['Wall Street', 'a grocery store', 'a shipping container', 'a factory',
-                              'a corporate headquarters'],
-                    'What': ['an infographic', 'a protest', 'inflation', 'the banking sector', 'corn futures']}
-
-travel_details = {'Where': ['a hotel', 'an airplane', 'city streets', 'a hiking trail', 'a beach on an island'],
-                  'What': ['a map', 'noodles', 'luxury', 'delight', 'delay', 'wildlife'],
-                  'Who': ['a family', 'a monkey', 'a tour guide', 'a pilot', 'a mountaineer']}
-
-funny_details = {'Who': ['a cat', 'some kids', 'a family', 'some people in an office', 'a clown'],
-                 'What': ['pizza', 'ice cream', 'doing homework', 'on a date', 'watching a movie', 'dancing',
-                          'a laptop', 'in a treehouse'],
-                 'When': ['the stone age', 'the future', '1950s']}
-
-categories_details_1 = {'politics': politics_details,
-                        'arts': arts_details,
-                        'sports': sports_details,
-                        'business': business_details,
-                        'travel': travel_details,
-                        'cartoon': funny_details}
-
-
-politics_details_2 = {'Who': ['the president', 'the United Nations', 'NATO', 'the European Union'],
-                      'What': ['an important election', 'a scandal', 'a natural disaster',
-                               'Artificial General Intelligence', 'an international conflict']}
-
-sports_details_2 = {'What': ['FIFA World Cup', 'the Super Bowl', 'the baseball World Series'],
-                    'Where': ['terrible weather', 'a game highlight']}
-
-categories_details_2 = {'politics': politics_details_2,
-                          'sports': sports_details_2}
-
-categories_examples = {
-    'politics': ["A photo of the president embarrassed in front of reporters during the correspondents' dinner.",
-                 "A black and white photo of a politician with a microphone."],
-    'business': ['An graph showing recent dramatic changes in stock prices.',
-                 'A photo of factory workers busy building cars in a factory.'],
-    'arts': ['A photo of a woman painting a colorful canvas with a large brush.',
-             "A painting of a dramatic scene on stage with a person grabbing another by shoulder."],
-    'sports': ['A black and white photo of a boxer with hands stretched over their head in victory.',
-               'A close-up photo of soccer teammates hugging in the rain after a difficult victory.'],
-    'travel': ["An illustration of a map showing a ship's coarse between tropical islands.",
-               'A photo of a beautiful hotel and trees and a long driveway in the mountains.'],
-    'cartoon': ['An illustration of a clown mowing the lawn.',
-              'A cartoon of a horse working on a laptop.']}
-
-
-def generate_clues(prompt_number=0):
-
-    r = random.random()
-
-    if r < CAT_DOG_PROB:
-        return 'travel', {'What': random.choice(['a dog', 'a cat']),
-                          'Where': random.choice(['a tree', 'a cafe', 'tall grass', 'a dusty road', 'in an airplane'])}
-
-    if ((state[KEY_PROMPT_NUMBER] // DAYS_IN_GROUP) % 2) == 0:
-        categories_details = categories_details_1
-    else:
-        categories_details = categories_details_2
-
-    categories = list(categories_details)
-    category = random.choice(categories)
-
-    cat_cats = list(categories_details[category].keys())
-    random.shuffle(cat_cats)
-
-    clue0 = random.choice(categories_details[category][cat_cats[0]])
-    clue1 = random.choice(categories_details[category][cat_cats[1]])
-
-    return category, {cat_cats[0]: clue0, cat_cats[1]: clue1}
-
-
 EMPTY = ''
 
 KEY_USER_ID = 'user'
@@ -166,6 +95,9 @@ KEY_PROMPT = 'prompt'
 KEY_FINAL_PROMPT = 'final_prompt'
 KEY_IMAGE = 'image'
 KEY_EMBEDDING = 'embedding'
+KEY_EMBEDDING_DTYPE = 'embedding_dtype'
+KEY_EMBEDDING_MODEL = 'embedding_model'
+KEY_EMBEDDING_FUTURE = 'embedding_future'
 KEY_TIME = 'time'
 KEY_HUMAN_TIME = 'human_time'
 KEY_PROMPT_NUMBER = 'prompt_number'
@@ -180,7 +112,8 @@ KEY_SESSION_ID = 'session_id'
 KEY_CATEGORY = 'category'
 KEY_FEATURES = 'features'
 
-STATE_KEYS = [KEY_USER_ID, KEY_PROMPT, KEY_FINAL_PROMPT, KEY_IMAGE, KEY_EMBEDDING, KEY_TIME, KEY_HUMAN_TIME, KEY_UUID,
+STATE_KEYS = [KEY_USER_ID, KEY_PROMPT, KEY_FINAL_PROMPT, KEY_IMAGE, KEY_EMBEDDING, KEY_EMBEDDING_DTYPE,
+              KEY_EMBEDDING_MODEL, KEY_TIME, KEY_HUMAN_TIME, KEY_UUID,
               KEY_FEEDBACK_QUALITY, KEY_FEEDBACK_FIDELITY, KEY_FEEDBACK_DISTORTION, KEY_FEEDBACK_BIAS,
               KEY_FEEDBACK_NOTES, KEY_SESSION_ID, KEY_PROMPT_NUMBER, KEY_CATEGORY, KEY_FEATURES]
 
@@ -190,6 +123,9 @@ for k in STATE_KEYS:
     if k not in state:
         state[k] = EMPTY
 
+if KEY_EMBEDDING_FUTURE not in state:
+    state[KEY_EMBEDDING_FUTURE] = None
+
 if state[KEY_PROMPT_NUMBER] == EMPTY:
     state[KEY_PROMPT_NUMBER] = 0
 
@@ -198,20 +134,16 @@ state[KEY_SESSION_ID] = SESSION_ID
 
 def next_prompt():
     state[KEY_PROMPT] = EMPTY
-    state[KEY_CATEGORY], state[KEY_FEATURES] = generate_clues()
+    state[KEY_CATEGORY], state[KEY_FEATURES] = generate_clues(state[KEY_PROMPT_NUMBER])
 
 
 def reset_results():
     state[KEY_IMAGE] = EMPTY
     state[KEY_EMBEDDING] = EMPTY
+    state[KEY_EMBEDDING_FUTURE] = None
     state[KEY_TIME] = EMPTY
 
-    if 'cat' in state[KEY_PROMPT]:
-        state[KEY_FINAL_PROMPT] = state[KEY_PROMPT].lower().replace('cat', 'dog')
-    elif 'dog' in state[KEY_PROMPT]:
-        state[KEY_FINAL_PROMPT] = state[KEY_PROMPT].lower().replace('dog', 'cat')
-    else:
-        state[KEY_FINAL_PROMPT] = state[KEY_PROMPT].lower()
+    state[KEY_FINAL_PROMPT] = final_prompt(state[KEY_PROMPT])
 
 
 st.header("Part 1: Simulating a Generative AI Workflow")
@@ -232,11 +164,17 @@ if state[KEY_PROMPT_NUMBER] >= TOT_PROMPTS_TO_DO:
 st.text(f'Day #: {state[KEY_PROMPT_NUMBER] + 1} of {TOT_PROMPTS_TO_DO}')
 st.progress(state[KEY_PROMPT_NUMBER]/TOT_PROMPTS_TO_DO)
 
+submit_queue = get_submit_queue()
+queue_depth = submit_queue.depth()
+if queue_depth:
+    st.caption(f'{queue_depth} submission(s) still being saved, oldest from '
+               f'{submit_queue.oldest_seconds():.0f}s ago.')
+
 
 # st.title("")
 
 if state[KEY_CATEGORY] == EMPTY:
-    state[KEY_CATEGORY], state[KEY_FEATURES] = generate_clues()
+    state[KEY_CATEGORY], state[KEY_FEATURES] = generate_clues(state[KEY_PROMPT_NUMBER])
 
 st.subheader("The Task")
 
@@ -263,11 +201,12 @@ if state[KEY_PROMPT] is EMPTY:
     st.stop()
 
 if state[KEY_IMAGE] == EMPTY:
+    image_future, state[KEY_EMBEDDING_FUTURE] = get_generator().submit(state[KEY_FINAL_PROMPT])
     try:
-        state[KEY_IMAGE] = base64.b64decode(get_image(state[KEY_FINAL_PROMPT]))
-        state[KEY_EMBEDDING] = get_embedding(state[KEY_FINAL_PROMPT])
+        with st.spinner('Generating your image...'), metrics.timer('generation.wait_image'):
+            state[KEY_IMAGE] = image_future.result()
     except Exception as e:
-        st.error("The following error occurred generating image or embeddings:\n\n\"" + str(e) + '\"\n\nPlease rewrite prompt and try again')
+        st.error("The following error occurred generating image:\n\n\"" + str(e) + '\"\n\nPlease rewrite prompt and try again')
         st.stop()
 
     state[KEY_TIME] = time.time_ns()//10**9
@@ -299,4 +238,6 @@ with col2:
     # with col4:
     st.button('Submit :rocket:', on_click=submit_data)
 
+debug_panel()
+
     # st.write("We're not logging new results right now.  Feel free to browse the other sections to play with data from our last session!")
\ No newline at end of file
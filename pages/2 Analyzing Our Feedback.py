@@ -1,92 +1,21 @@
 import streamlit as st
-import plotly.express as px
 from streamlit_plotly_events import plotly_events
-import pandas as pd
-import numpy as np
-import os
-import umap
-import boto3
+
+from workshop.analytics import (PROJECTION_BACKENDS, SESSION_ID, add_umap, get_db_data, get_image_cache,
+                                similar_prompts)
+from workshop.debug import debug_panel, start_rerun
+from workshop.plotting import MAX_POINTS, ScatterView
 
 from streamlit_extras.app_logo import add_logo
 add_logo('fiddler-ai-logo.png', height=50)
+start_rerun()
 
-AWS_S3_BUCKET_NAME = st.secrets['AWS_S3_BUCKET_NAME']
-AWS_DYNAMODB_TABLE_NAME = st.secrets['AWS_DYNAMODB_TABLE_NAME']
-AWS_REGION = st.secrets['AWS_REGION']
-
-AWS_ACCESS_KEY_ID = st.secrets['AWS_ACCESS_KEY_ID']
-AWS_SECRET_ACCESS_KEY = st.secrets['AWS_SECRET_ACCESS_KEY']
-
-TEMP_IMAGE_PATH = './temp'
-
-AWS_S3_BASE_URL = f'https://{AWS_S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/'
-
-SESSION_ID = st.secrets['SESSION_ID']
-
-ddb_table = boto3.resource("dynamodb",
-                           region_name=AWS_REGION,
-                           aws_access_key_id=AWS_ACCESS_KEY_ID,
-                           aws_secret_access_key=AWS_SECRET_ACCESS_KEY).Table(
-    AWS_DYNAMODB_TABLE_NAME)
-
-s3_bucket = boto3.resource('s3',
-                           region_name=AWS_REGION,
-                           aws_access_key_id=AWS_ACCESS_KEY_ID,
-                           aws_secret_access_key=AWS_SECRET_ACCESS_KEY).Bucket(AWS_S3_BUCKET_NAME)
-
-
-def transform(x):
-    x['embedding'] = [float(xx) for xx in x['embedding']]
-    return x
-
-
-@st.cache_data(ttl=30)
-def get_db_data():
-    response = ddb_table.scan()
-    data = [transform(x) for x in response['Items']]
-    while 'LastEvaluatedKey' in response:
-        response = ddb_table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-        data = data + [transform(x) for x in response['Items']]
-
-    raw_df = pd.DataFrame(data).drop(['time', 'clue'], axis=1)
-
-    raw_df.to_csv('gen_workshop_dataframe.csv', index=False)
-
-    with open('gen_workshop_dataframe.csv', 'rb') as f:
-        s3_bucket.upload_fileobj(f, 'gen_workshop_dataframe.csv')
-
-    raw_df.rename(columns={'category': 'Newspaper Section',
-                           'feedback_fidelity': '[Feedback] Fidelity',
-                           'feedback_bias': '[Feedback] Bias',
-                           'feedback_quality': '[Feedback] Quality',
-                           'feedback_distortion': '[Feedback] Distortion',
-                           'feedback_notes': '[Feedback] Notes'}, inplace=True)
-
-    return raw_df
-
-
-@st.cache_data
-def run_umap(the_df):
-    embs = np.asarray(the_df['embedding'].to_list())
-
-    reducer = umap.UMAP(n_components=2, n_neighbors=4, random_state=42)
-
-    umap_embs = reducer.fit_transform(embs[:, :128])
-
-    return pd.DataFrame({'UMAP_0': umap_embs[:, 0],
-                         'UMAP_1': umap_embs[:, 1],
-                         # 'UMAP_2': umap_embs[:, 2]
-                         })
-
-
-def add_umap(df):
-    umap_df = run_umap(df)
-    return pd.concat([df.reset_index(drop=True), umap_df], axis=1)
+NUM_SIMILAR_PROMPTS = 5
 
 
 st.header("Part 2: Evaluating our Data and Feedback")
 
-df = get_db_data().copy()
+df = get_db_data()
 
 c1, c2 = st.columns(2)
 
@@ -106,13 +35,15 @@ with c2:
 
     color_by = st.selectbox('Color UMAP/semantic plot by:', color_by_options)
 
+    projection = st.selectbox('Semantic projection:', list(PROJECTION_BACKENDS))
+
 df = df[df['session_id'] == session]
 
 if len(df) == 0:
     st.text(f'{len(df)} records returned')
     st.stop()
 
-df = add_umap(df)
+df = add_umap(df, PROJECTION_BACKENDS[projection])
 
 d = df[~df[color_by].isnull()]
 
@@ -161,20 +92,30 @@ st.write('The UMAP coordinates below are computed from the embeddings of your pr
          'occurs is due to prompt semantics.  By overlaying human feedback, we can identify semantically '
          'correlated problem areas.')
 
-st.write('**Click a point below to retrieve its details.**')
+# Too many points to draw one by one: show their density, and let the ranges below zoom in on it.
+x_range = y_range = None
+if len(d) > MAX_POINTS:
+    z1, z2 = st.columns(2)
+    x_min, x_max = float(d['UMAP_0'].min()), float(d['UMAP_0'].max())
+    y_min, y_max = float(d['UMAP_1'].min()), float(d['UMAP_1'].max())
+    x_range = z1.slider('Zoom: UMAP_0 range', x_min, x_max, (x_min, x_max))
+    y_range = z2.slider('Zoom: UMAP_1 range', y_min, y_max, (y_min, y_max))
+
+view = ScatterView(d, 'UMAP_0', 'UMAP_1', x_range=x_range, y_range=y_range)
+
+if view.mode == 'density':
+    st.write(f'**{len(view.frame)} prompts in view are shown as a density.  Click a cell to retrieve its prompts, '
+             f'or narrow the ranges above until at most {MAX_POINTS} remain to see them individually.**')
+    fig = view.figure()
+else:
+    st.write('**Click a point below to retrieve its details, or lasso/box-select a group of points.**')
+    fig = view.figure(color=color_by, **style_by_column[color_by])
+    fig.update_traces(marker={'size': 9 if view.mode == 'svg' else 5})
 
-fig = px.scatter(
-    data_frame=d,
-    x="UMAP_0",
-    y="UMAP_1",
-    color=color_by,
-    **style_by_column[color_by])
-
-fig.update_traces(marker={'size': 9})
 fig.update_xaxes(showticklabels=False, zeroline=False)
 fig.update_yaxes(showticklabels=False, zeroline=False)
 fig.update_layout({"uirevision": "foo"}, overwrite=True)
-selected_points = plotly_events(fig, click_event=True, select_event=False)
+selected_points = plotly_events(fig, click_event=True, select_event=True)
 
 
 st.markdown('*Double-click plot to reset plot range.*')
@@ -186,10 +127,15 @@ col_list = [None] * len(selected_points)
 c3, c4 = st.columns(2)
 if len(selected_points):
 
-    if not os.path.exists(TEMP_IMAGE_PATH):
-        os.makedirs(TEMP_IMAGE_PATH)
+    image_cache = get_image_cache()
+
+    # Points carry their prompt_id and density cells resolve to the prompts inside them.
+    row_by_id = dict(zip(d['prompt_id'], d.index))
+    row_ids = [row_by_id[prompt_id] for prompt_id in view.selected_ids(fig, selected_points)]
 
-    row_ids = [d[d['UMAP_0'] == p['x']].index.tolist()[0] for p in selected_points]
+    if len(row_ids) > 1:
+        st.write(f'**{len(row_ids)} points selected.** Details for the first one are shown below.')
+        st.dataframe(d.loc[row_ids, ['prompt', 'user', color_by]], hide_index=True, use_container_width=True)
 
     for i, row_id in enumerate(row_ids):
 
@@ -197,9 +143,17 @@ if len(selected_points):
 
         row = d.loc[row_id]
 
+        # Start fetching the neighbours' images now, so they are ready by the time they are drawn or clicked.
+        similar = dict(similar_prompts(row['prompt_id'], k=NUM_SIMILAR_PROMPTS))
+        image_cache.prefetch(similar, thumbnail=True)
+        image_cache.prefetch(similar)
+
         with col_list[i][0]:
-            file_name = row['prompt_id'] + '.png'
-            st.image(AWS_S3_BASE_URL+file_name)
+            image = image_cache.get(row['prompt_id'])
+            if image is None:
+                st.caption('Image not available.')
+            else:
+                st.image(image)
 
         with col_list[i][1]:
             st.markdown(f'**Newspaper Section:** {row["Newspaper Section"]}')
@@ -221,4 +175,16 @@ if len(selected_points):
             for f in feedback_types:
                 st.markdown(f'**{f}:** {row[f]}')
 
-        break
\ No newline at end of file
+        st.markdown('**Semantically closest prompts:**')
+        near = df[df['prompt_id'].isin(similar)][['prompt_id', 'prompt', 'user', 'Newspaper Section']]
+        near = near.assign(Similarity=near['prompt_id'].map(similar)).sort_values('Similarity', ascending=False)
+        thumbnails = [(image_cache.get(prompt_id, thumbnail=True), f'{s:.2f}')
+                      for prompt_id, s in zip(near['prompt_id'], near['Similarity'])]
+        thumbnails = [(image, caption) for image, caption in thumbnails if image is not None]
+        if thumbnails:
+            st.image([image for image, _ in thumbnails], caption=[caption for _, caption in thumbnails])
+        st.dataframe(near.drop(columns='prompt_id'), hide_index=True, use_container_width=True)
+
+        break
+
+debug_panel()
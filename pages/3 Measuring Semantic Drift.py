@@ -1,165 +1,221 @@
 import streamlit as st
 import matplotlib.pyplot as plt
-import pandas as pd
 import numpy as np
-import umap
-from sklearn.cluster import KMeans
-import boto3
-
-from scipy.spatial.distance import jensenshannon
+import pandas as pd
 
-def jsd(a, b):
-    return jensenshannon(a, b, base=2)
+from workshop.analytics import SESSION_ID, add_umap, embedding_rows, get_db_data, get_drift_engine, get_embeddings
+from workshop.debug import debug_panel, start_rerun
+from workshop.drift import (AUTO, K_RANGE, bootstrap_jsd, bootstrap_proportions, fixed_windows, jsd_matrix,
+                            rolling_histograms, window_histograms)
+from workshop.projection import fingerprint
 
 
 from streamlit_extras.app_logo import add_logo
 add_logo('fiddler-ai-logo.png', height=50)
-
-AWS_S3_BUCKET_NAME = st.secrets['AWS_S3_BUCKET_NAME']
-AWS_DYNAMODB_TABLE_NAME = st.secrets['AWS_DYNAMODB_TABLE_NAME']
-AWS_REGION = st.secrets['AWS_REGION']
-
-AWS_ACCESS_KEY_ID = st.secrets['AWS_ACCESS_KEY_ID']
-AWS_SECRET_ACCESS_KEY = st.secrets['AWS_SECRET_ACCESS_KEY']
-
-SESSION_ID = st.secrets['SESSION_ID']
+start_rerun()
 
 DAYS_IN_GROUP = 4
 
-ddb_table = boto3.resource("dynamodb",
-                           region_name=AWS_REGION,
-                           aws_access_key_id=AWS_ACCESS_KEY_ID,
-                           aws_secret_access_key=AWS_SECRET_ACCESS_KEY).Table(
-    AWS_DYNAMODB_TABLE_NAME)
-
-def transform(x):
-    x['embedding'] = [float(xx) for xx in x['embedding']]
-    return x
-
-
-@st.cache_data(ttl=30)
-def get_db_data():
-    response = ddb_table.scan()
-    data = [transform(x) for x in response['Items']]
-    while 'LastEvaluatedKey' in response:
-        response = ddb_table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-        data = data + [transform(x) for x in response['Items']]
+WINDOW_MODES = ['Prompt number', 'Time', 'Rolling']
 
-    raw_df = pd.DataFrame(data).drop(['time', 'clue'], axis=1)
+# Where the clusters live: the embeddings themselves, a PCA of them (components), or the 2-D UMAP projection.
+CLUSTER_SPACES = {'Embeddings': None, 'Embeddings, PCA-32': 32, 'UMAP projection': 'umap'}
+MAX_SCATTER_PANELS = 6
+MAX_GROUPED_BARS = 8
+BOOTSTRAP_RESAMPLES = 2000
 
-    return raw_df
-
-@st.cache_data
-def run_umap(the_df):
-    embs = np.asarray(the_df['embedding'].to_list())
-
-    reducer = umap.UMAP(n_components=2, n_neighbors=4, random_state=42)
-
-    umap_embs = reducer.fit_transform(embs[:, :128])
-
-    return pd.DataFrame({'UMAP_0': umap_embs[:, 0],
-                         'UMAP_1': umap_embs[:, 1],
-                         # 'UMAP_2': umap_embs[:, 2]
-                         })
-
-
-def add_umap(df):
-    umap_df = run_umap(df)
-    return pd.concat([df.reset_index(drop=True), umap_df], axis=1)
-
-df = get_db_data().copy()
+df = get_db_data()
 
 df = df[(df['session_id'] == SESSION_ID)]
 
 st.header('Part 3: Measuring Drift in Unstructured Data')
 
-NUM_BINS =  st.select_slider('How many bins should I use for semantic clustering?', value=3, options=[3, 4, 5])
-
-st.text(f'{len(df)} records returned, clustering with {NUM_BINS} bins.')
+# Every k in K_RANGE is fitted once per reference window, so moving the slider is a lookup.
+bins_choice = st.select_slider('How many bins should I use for semantic clustering?', value=3,
+                               options=[AUTO] + list(K_RANGE))
 
-if len(df) == 0:
-    st.stop()
-
-df = add_umap(df)
+window_mode = st.radio('Split prompts into windows by:', WINDOW_MODES, horizontal=True)
 
-embs_by_group = [df[df['prompt_number']//DAYS_IN_GROUP == i][['UMAP_0', 'UMAP_1']].values for i in range(3)]
+cluster_space = CLUSTER_SPACES[st.radio('Cluster prompts in:', list(CLUSTER_SPACES), horizontal=True)]
+show_plots = cluster_space == 'umap' or st.checkbox('Show semantic plots (runs UMAP)', value=True)
 
+if window_mode == 'Prompt number':
+    prompts_per_window = st.select_slider('Prompts per window', options=[1, 2, 3, 4, 6], value=DAYS_IN_GROUP)
+elif window_mode == 'Time':
+    minutes_per_window = st.slider('Minutes per window', min_value=1, max_value=60, value=10)
+else:
+    rows_per_window = st.slider('Prompts per rolling window', min_value=5, max_value=max(6, len(df)),
+                                value=max(5, len(df) // 3))
+    rolling_step = st.slider('Step between windows', min_value=1, max_value=max(1, rows_per_window), value=1)
 
-X = embs_by_group[0]
-kmeans = KMeans(n_clusters=NUM_BINS, random_state=42).fit(X)
+st.text(f'{len(df)} records returned, clustering with {bins_choice} bins.')
 
-counts = [np.bincount(kmeans.predict(embs_by_group[i]), minlength=NUM_BINS) for i in range(3)]
+if len(df) == 0:
+    st.stop()
 
-prompt_labels = ['Prompts 1-4', '5-8 (modified)', '9-12']
+if show_plots:
+    df = add_umap(df)
+    X = df[['UMAP_0', 'UMAP_1']].to_numpy()
+
+# Clusters are fitted on the first window, the reference every other window is compared with.
+if window_mode == 'Rolling':
+    order = np.argsort(pd.to_numeric(df['time']).to_numpy(), kind='stable')
+    reference = order[:rows_per_window]
+else:
+    if window_mode == 'Prompt number':
+        labels, starts = fixed_windows(pd.to_numeric(df['prompt_number']).to_numpy(dtype=np.int64),
+                                       prompts_per_window)
+    else:
+        times = pd.to_numeric(df['time']).to_numpy(dtype=np.int64)
+        labels, starts = fixed_windows(times, minutes_per_window * 60, origin=times.min())
+    reference = labels == 0
+
+if cluster_space == 'umap':
+    clustering = get_drift_engine().assign(fingerprint(df['prompt_id']) + ':umap', X, reference, bins_choice)
+else:
+    # Fitted on the reference window and frozen, so it neither moves with UMAP nor refits as rows arrive.
+    clustering = get_drift_engine().assign_embeddings(df['prompt_id'], get_embeddings(), reference, bins_choice,
+                                                      rows=embedding_rows(df), n_components=cluster_space)
+
+assignments, NUM_BINS = clustering.assignments, clustering.n_bins
+if bins_choice == AUTO:
+    st.text(f'Picked {NUM_BINS} bins, the count with the best silhouette score on the reference window.')
+
+with st.expander('How well does each number of bins fit?'):
+    ks = sorted(clustering.scores)
+    fig, ax = plt.subplots(1, 2, figsize=[6, 2])
+    ax[0].plot(ks, [clustering.scores[k]['silhouette'] for k in ks], 'o-')
+    ax[0].set_title('Silhouette (higher is better)', fontsize=8)
+    ax[1].plot(ks, [clustering.scores[k]['inertia'] for k in ks], 'o-')
+    ax[1].set_title('Inertia (look for the elbow)', fontsize=8)
+    for axis in ax:
+        axis.axvline(NUM_BINS, color='r', linewidth=0.5)
+        axis.set_xlabel('Bins', fontsize=8)
+        axis.set_xticks(ks)
+    st.pyplot(fig)
+
+if window_mode == 'Rolling':
+    counts, row_starts = rolling_histograms(assignments[order], NUM_BINS, rows_per_window, rolling_step)
+    members = [order[s:s + rows_per_window] for s in row_starts]
+    window_names = [f'{s + 1}-{s + len(m)}' for s, m in zip(row_starts, members)]
+    modified = [False] * len(members)
+else:
+    counts = window_histograms(labels, assignments, len(starts), NUM_BINS)
+    members = [np.flatnonzero(labels == w) for w in range(len(starts))]
+    if window_mode == 'Prompt number':
+        # The topic mix is switched for every other block of DAYS_IN_GROUP prompts.
+        window_names = [f'{s + 1}-{s + prompts_per_window}' for s in starts]
+        modified = [(s // DAYS_IN_GROUP) % 2 == 1 and prompts_per_window <= DAYS_IN_GROUP for s in starts]
+    else:
+        window_names = [pd.Timestamp(s, unit='s').strftime('%H:%M') for s in starts]
+        modified = [False] * len(starts)
+
+window_names = [f'{name} (modified)' if m else name for name, m in zip(window_names, modified)]
+n_windows = len(window_names)
 
 st.write('**A distributional shift was introduced to your newspaper topics for prompts five through eight.**  '
          'This is probably visible in the semantic/UMAP plots of the embeddings we calculated from your prompts.')
 
-st.write('The semantic plots below are broken up into three groups of four prompts.  This could be time intervals '
+st.write(f'The semantic plots below are broken up into {n_windows} windows.  These could be time intervals '
          'where identifying '
          'semantic shifts could help safeguard model performance and safety.')
 
 st.write('Running a clustering algorithm (colors below) makes it possible to track semantic shift with respect to the initial '
          'time interval.')
 
-color_by_cluster = ['k', 'r', 'g', 'b', 'm']
-
-fig, ax = plt.subplots(1, 3, sharex=True)
-for cluster in range(NUM_BINS):
-
-    for group in range(3):
-        ax[group].set_aspect(1)
-        ax[group].xaxis.set_tick_params(labelbottom=False)
-        ax[group].yaxis.set_tick_params(labelleft=False)
-
-        ax[group].set_xticks([])
-        ax[group].set_yticks([])
-
-        ax[group].set_title(prompt_labels[group])
+color_by_cluster = np.array(plt.get_cmap('tab10').colors)
 
+if show_plots:
+    panels = np.unique(np.linspace(0, n_windows - 1, min(n_windows, MAX_SCATTER_PANELS)).round().astype(int))
+    fig, ax = plt.subplots(1, len(panels), sharex=True, sharey=True, squeeze=False)
+    for axis, window in zip(ax[0], panels):
+        axis.set_aspect(1)
+        axis.set_xticks([])
+        axis.set_yticks([])
+        axis.set_title(window_names[window], fontsize=8)
 
-        clusters = kmeans.predict(embs_by_group[group])
+        rows = members[window]
+        axis.scatter(X[rows, 0], X[rows, 1], s=4, c=color_by_cluster[assignments[rows] % len(color_by_cluster)])
 
-        dat = embs_by_group[group][clusters == cluster]
-        if group == 0:
-            ax[group].plot(dat[:, 0], dat[:, 1], '.', color=color_by_cluster[cluster],
-                     label=str(cluster))
-
-        else:
-            ax[group].plot(dat[:, 0], dat[:, 1], '.', color=color_by_cluster[cluster])
-
-st.pyplot(fig)
+    st.pyplot(fig)
 
 st.write('We can then create a histogram for each time interval representing a coarse density estimate for the distribution.')
 
-prompt_labels = ['1-4', '5-8 (modified)', '9-12']
+proportions = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
 
-WIDTH = 0.2
 fig = plt.figure(figsize=[4, 3])
-for i, c in enumerate(counts):
-    plt.bar(np.arange(NUM_BINS)+(i-1)*WIDTH, height=c/sum(c), width=WIDTH, label=prompt_labels[i]) #, yerr=[[0.01, 0.02, 0.01, 0.02], [0.01, 0.02, 0.01, 0.02]])
-
-plt.xlabel('Cluster', fontsize=8)
-plt.xticks(list(range(NUM_BINS)))
+if n_windows <= MAX_GROUPED_BARS:
+    width = 0.8 / n_windows
+    low, high = bootstrap_proportions(counts, n_resamples=BOOTSTRAP_RESAMPLES)
+    for i, p in enumerate(proportions):
+        plt.bar(np.arange(NUM_BINS) + (i - (n_windows - 1) / 2) * width, height=p, width=width, label=window_names[i],
+                yerr=[p - low[i], high[i] - p], error_kw={'elinewidth': 0.5, 'capsize': 1})
+    plt.xlabel('Cluster', fontsize=8)
+    plt.xticks(list(range(NUM_BINS)))
+    plt.legend(title='Prompts', fontsize=6)
+else:
+    plt.imshow(proportions.T, aspect='auto', interpolation='nearest', cmap='viridis')
+    plt.colorbar(label='Share of window')
+    plt.ylabel('Cluster', fontsize=8)
+    plt.yticks(list(range(NUM_BINS)))
+    plt.xlabel('Window', fontsize=8)
 plt.title('Histogram of cluster assignments across prompts groups', fontsize=8)
-plt.legend(title='Prompts')
 st.pyplot(fig)
 
 
 st.write('Finally, histograms can be compared with that from the initial reference period to measure distributional shift.')
 
-jsd1 = jsd(counts[0], counts[1])
-jsd2 = jsd(counts[0], counts[2])
+distances = jsd_matrix(counts, counts)
+
+if n_windows < 2:
+    st.text('Only one window so far; there is nothing to compare it with yet.')
+    debug_panel()
+    st.stop()
+
+# Resampling both histograms gives an interval; resampling from the pooled one (no drift) gives a p-value.
+drift = bootstrap_jsd(counts[0], counts[1:], n_resamples=BOOTSTRAP_RESAMPLES)
 
 fig = plt.figure(figsize=[4, 3])
-plt.plot([0], [jsd1], '+b', label='modified')
-plt.plot([1], [jsd2], '+r', label='initial')
-plt.xlim(-0.5, 1.5)
-plt.ylim(0, 0.5)
+x = np.arange(1, n_windows)
+is_modified = np.array(modified[1:])
+if window_mode == 'Rolling':
+    plt.plot(x, drift['distance'], '-b')
+    plt.fill_between(x, drift['low'], drift['high'], color='b', alpha=0.2, linewidth=0)
+else:
+    # Drawn from low to high rather than as errors around the distance: resampled distances sit above the
+    # observed one, so with little drift the interval can lie wholly above it.
+    for mask, color, label in [(is_modified, 'b', 'modified'), (~is_modified, 'r', 'initial')]:
+        plt.vlines(x[mask], drift['low'][mask], drift['high'][mask], colors=color, linewidth=1)
+        plt.plot(np.tile(x[mask], 2), np.concatenate([drift['low'][mask], drift['high'][mask]]), '_' + color)
+        plt.plot(x[mask], drift['distance'][mask], '+' + color, label=label)
+    plt.legend(title='Distribution')
+plt.xlim(0.5, n_windows - 0.5)
+plt.ylim(0, max(0.5, np.nanmax(drift['high']) * 1.1))
 plt.ylabel('Jensen-Shannon Distance', fontsize=8)
 plt.xlabel('Prompts', fontsize=8)
-plt.title('Distributional comparison with Prompts 1-4\n(larger is more different)', fontsize=8)
-plt.xticks([0, 1], ['5-8', '9-12'])
-plt.legend(title='Distribution')
+plt.title(f'Distributional comparison with Prompts {window_names[0]}\n(larger is more different)', fontsize=8)
+if n_windows <= MAX_GROUPED_BARS:
+    plt.xticks(x, [name.replace(' (modified)', '') for name in window_names[1:]])
 
 st.pyplot(fig)
+
+st.caption(f'Bars and bands are {BOOTSTRAP_RESAMPLES}-resample bootstrap 95% intervals. Resampling adds noise, '
+           'which pushes distances up, so an interval is not centred on its distance and, for windows that '
+           'barely drift, can start above it.')
+if n_windows <= MAX_GROUPED_BARS:
+    st.dataframe({'Prompts': window_names[1:], 'Jensen-Shannon Distance': drift['distance'].round(3),
+                  '95% interval': [f'{lo:.3f}-{hi:.3f}' for lo, hi in zip(drift['low'], drift['high'])],
+                  'p-value (no drift)': drift['p_value'].round(4)}, hide_index=True)
+
+if n_windows > 2:
+    st.write('Every window can be compared with every other one the same way.')
+
+    fig = plt.figure(figsize=[4, 3])
+    plt.imshow(distances, vmin=0, cmap='magma')
+    plt.colorbar(label='Jensen-Shannon Distance')
+    plt.xlabel('Window', fontsize=8)
+    plt.ylabel('Window', fontsize=8)
+    plt.title('Pairwise distances between windows', fontsize=8)
+    st.pyplot(fig)
+
+debug_panel()
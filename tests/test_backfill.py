@@ -0,0 +1,87 @@
+"""The embedding backfill against moto DynamoDB and the fake OpenAI server from ``benchmarks``."""
+import json
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+pytest.importorskip('openai')
+pytest.importorskip('PIL')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from fake_openai import FakeOpenAI  # noqa: E402
+from workshop.backfill import CheckpointMismatch, backfill  # noqa: E402
+from workshop.embeddings import MODEL_ATTRIBUTE  # noqa: E402
+from workshop.generation import Generator  # noqa: E402
+
+TABLE_NAME = 'test-workshop'
+ROWS = 20
+
+
+@pytest.fixture(scope='module')
+def fake_openai():
+    with FakeOpenAI(embedding_latency=0, jitter=0) as fake:
+        yield fake
+
+
+@pytest.fixture
+def table():
+    with moto.mock_aws():
+        table = boto3.resource('dynamodb', region_name='us-east-1').create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'prompt_id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'prompt_id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST')
+        with table.batch_writer() as batch:
+            for n in range(ROWS):
+                batch.put_item(Item={'prompt_id': f'id-{n}', 'session_id': 's1', 'final_prompt': f'prompt {n}'})
+        yield table
+
+
+def generator(fake_openai, model='model-a'):
+    return Generator('test', api_base=fake_openai.api_base, embedding_model=model, max_retries=0)
+
+
+def test_backfill_embeds_every_row(table, fake_openai, tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = backfill(table, generator(fake_openai), batch_size=4, checkpoint_path=path)
+
+    assert checkpoint['done']
+    assert checkpoint['embedded'] == ROWS
+    assert {item[MODEL_ATTRIBUTE] for item in table.scan()['Items']} == {'model-a'}
+    with open(path) as f:
+        assert json.load(f)['settings']['model'] == 'model-a'
+
+
+@pytest.mark.parametrize('changed', [{'model': 'model-b'}, {'session_id': 's2'}, {'dtype': 'float16'},
+                                     {'force': True}])
+def test_resuming_with_other_settings_is_refused(table, fake_openai, tmp_path, changed):
+    path = str(tmp_path / 'checkpoint.json')
+    with open(path, 'w') as f:
+        json.dump({'resume_key': {'prompt_id': 'id-3'}, 'done': False, 'scanned': 4, 'embedded': 4, 'seconds': 1.,
+                   'settings': {'table': TABLE_NAME, 'model': 'model-a', 'session_id': None, 'dtype': 'float32',
+                                'force': False}}, f)
+
+    kwargs = {'session_id': None, 'dtype': 'float32', 'force': False, **changed}
+    with pytest.raises(CheckpointMismatch, match=next(iter(changed))):
+        backfill(table, generator(fake_openai, changed.get('model', 'model-a')), checkpoint_path=path,
+                 session_id=kwargs['session_id'], dtype=kwargs['dtype'], force=kwargs['force'])
+
+
+def test_checkpoint_without_settings_is_refused(table, fake_openai, tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    with open(path, 'w') as f:
+        json.dump({'resume_key': {'prompt_id': 'id-3'}, 'done': False}, f)
+
+    with pytest.raises(CheckpointMismatch):
+        backfill(table, generator(fake_openai), checkpoint_path=path)
+
+
+def test_finished_run_is_not_repeated(table, fake_openai, tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    backfill(table, generator(fake_openai), checkpoint_path=path)
+    assert backfill(table, generator(fake_openai), checkpoint_path=path)['embedded'] == ROWS
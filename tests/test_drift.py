@@ -0,0 +1,206 @@
+"""``workshop.drift``: distances, window histograms, bootstrap intervals, centroid models and the engine's caches."""
+import pytest
+
+np = pytest.importorskip('numpy')
+scipy_distance = pytest.importorskip('scipy.spatial.distance')
+pytest.importorskip('sklearn')
+
+from workshop.drift import (AUTO, CentroidModel, DriftEngine, best_k, bootstrap_jsd,  # noqa: E402
+                            bootstrap_proportions, fixed_windows, jsd, jsd_matrix, jsd_pairs, rolling_histograms,
+                            window_histograms)
+
+
+def clustered(n, dim=12, n_clusters=3, seed=0):
+    """(embeddings, true cluster) of ``n`` rows around ``n_clusters`` well separated centres."""
+    rng = np.random.default_rng(seed)
+    centers = 10 * rng.normal(size=(n_clusters, dim))
+    truth = rng.integers(0, n_clusters, size=n)
+    return (centers[truth] + rng.normal(size=(n, dim))).astype(np.float32), truth
+
+
+def test_jsd_matches_scipy():
+    rng = np.random.default_rng(0)
+    P, Q = rng.integers(0, 20, size=(2, 6, 5))
+    expected = [scipy_distance.jensenshannon(p, q, base=2) for p, q in zip(P, Q)]
+    np.testing.assert_allclose(jsd_pairs(P, Q), expected)
+    assert jsd(P[0], Q[0]) == pytest.approx(expected[0])
+
+
+def test_jsd_bounds():
+    assert jsd([3, 1, 0], [6, 2, 0]) == pytest.approx(0)
+    assert jsd([1, 0], [0, 1]) == pytest.approx(1)
+    assert np.isnan(jsd([0, 0], [1, 1]))
+
+
+def test_jsd_matrix_compares_every_pair():
+    counts = np.array([[5, 5, 0], [0, 5, 5], [5, 0, 5]])
+    distances = jsd_matrix(counts, counts)
+    assert distances.shape == (3, 3)
+    np.testing.assert_allclose(np.diag(distances), 0, atol=1e-7)
+    np.testing.assert_allclose(distances, distances.T)
+    assert distances[0, 1] == pytest.approx(jsd(counts[0], counts[1]))
+
+
+def test_fixed_windows_skip_empty_ones():
+    labels, starts = fixed_windows([100, 104, 131, 109, 135], size=10, origin=100)
+    np.testing.assert_array_equal(labels, [0, 0, 1, 0, 1])
+    np.testing.assert_array_equal(starts, [100, 130])
+
+
+def test_window_histograms_count_each_window_in_one_pass():
+    counts = window_histograms([0, 0, 1, 1, 1], np.array([0, 2, 2, 2, 1]), n_windows=2, n_bins=3)
+    np.testing.assert_array_equal(counts, [[1, 0, 1], [0, 1, 2]])
+
+
+def test_rolling_histograms_match_counting_each_window():
+    assignments = np.random.default_rng(0).integers(0, 4, size=23)
+    counts, starts = rolling_histograms(assignments, n_bins=4, size=10, step=3)
+    np.testing.assert_array_equal(starts, [0, 3, 6, 9, 12])
+    for start, row in zip(starts, counts):
+        np.testing.assert_array_equal(row, np.bincount(assignments[start:start + 10], minlength=4))
+
+
+def test_rolling_histograms_of_fewer_rows_than_a_window():
+    counts, starts = rolling_histograms(np.array([1, 1, 0]), n_bins=2, size=10)
+    np.testing.assert_array_equal(starts, [0])
+    np.testing.assert_array_equal(counts, [[1, 2]])
+
+
+def test_bootstrap_jsd_separates_drift_from_noise():
+    reference = np.array([40, 30, 20, 10])
+    counts = np.array([[41, 29, 21, 9], [5, 10, 25, 60], [0, 0, 0, 0]])
+    drift = bootstrap_jsd(reference, counts, n_resamples=500)
+
+    np.testing.assert_allclose(drift['distance'][:2], jsd_pairs(reference, counts[:2]))
+    assert drift['p_value'][0] > 0.5
+    assert drift['p_value'][1] == pytest.approx(1 / 501)
+    # A real shift: the interval is well away from no drift and holds the distance.
+    assert 0.2 < drift['low'][1] <= drift['distance'][1] <= drift['high'][1]
+    assert drift['low'][0] < drift['high'][0] < drift['low'][1]
+    # A window without rows has no distance to put an interval on.
+    assert all(np.isnan(drift[name][2]) for name in ('distance', 'low', 'high', 'p_value'))
+
+
+def test_bootstrap_jsd_is_reproducible_and_narrows_with_more_rows():
+    reference, counts = np.array([30, 20, 10]), np.array([[10, 20, 30]])
+    first = bootstrap_jsd(reference, counts, n_resamples=300, seed=3)
+    again = bootstrap_jsd(reference, counts, n_resamples=300, seed=3)
+    assert all(np.array_equal(first[name], again[name]) for name in first)
+
+    more = bootstrap_jsd(100 * reference, 100 * counts, n_resamples=300, seed=3)
+    assert more['high'][0] - more['low'][0] < (first['high'][0] - first['low'][0]) / 3
+
+
+def test_bootstrap_proportions_bracket_each_share():
+    counts = np.array([[50, 30, 20, 0], [1, 1, 1, 1]])
+    low, high = bootstrap_proportions(counts, n_resamples=500)
+    shares = counts / counts.sum(axis=1, keepdims=True)
+    assert low.shape == high.shape == counts.shape
+    assert np.all(low <= shares) and np.all(shares <= high)
+    # An empty bin never gets drawn; a handful of rows gives wide intervals.
+    assert low[0, 3] == high[0, 3] == 0
+    assert np.min(high[1] - low[1]) > np.max(high[0, :3] - low[0, :3])
+
+
+@pytest.mark.parametrize('n_components', [None, 4])
+def test_centroid_model_assigns_the_nearest_centroid(n_components):
+    X, _ = clustered(300)
+    # Blocks smaller than the rows, so predict stitches several together.
+    model = CentroidModel(3, n_components=n_components, batch_size=64).fit(X)
+    Z = model._project(X)
+    nearest = ((Z[:, None] - model.centroids_[None]) ** 2).sum(axis=2).argmin(axis=1)
+    np.testing.assert_array_equal(model.predict(X), nearest)
+    assert model.centroids_.shape == (3, n_components or X.shape[1])
+
+
+def test_centroid_model_recovers_separated_clusters_and_stays_frozen():
+    X, truth = clustered(300)
+    model = CentroidModel(3).fit(X[:200])
+    centroids = model.centroids_.copy()
+    labels = model.predict(X)
+    # The same partition up to the order of the labels.
+    assert len(set(zip(labels, truth))) == 3
+    np.testing.assert_array_equal(model.centroids_, centroids)
+
+
+def test_centroid_model_with_fewer_rows_than_bins():
+    X, _ = clustered(3)
+    assert len(CentroidModel(5).fit(X).centroids_) == 3
+
+
+def test_assign_embeddings_only_assigns_new_rows():
+    X, _ = clustered(120)
+    ids = [f'id-{i}' for i in range(120)]
+    engine = DriftEngine(k_range=(2, 3), n_jobs=1)
+    first = engine.assign_embeddings(ids[:100], X, reference=np.arange(50), n_bins=3)
+    assert first.n_bins == 3
+    assert engine.stats['misses'] == 1
+
+    more = engine.assign_embeddings(ids, X, reference=np.arange(50), n_bins=3)
+    np.testing.assert_array_equal(more.assignments[:100], first.assignments)
+    assert engine.stats['partial_hits'] == 1
+    assert engine.stats['fits'] == 2
+
+    # ``rows`` maps ids to rows of a larger matrix; the same ids and reference are looked up.
+    larger = np.concatenate([np.zeros((10, X.shape[1]), dtype=X.dtype), X])
+    again = engine.assign_embeddings(ids, larger, reference=np.arange(50), n_bins=3, rows=np.arange(10, 130))
+    np.testing.assert_array_equal(again.assignments, more.assignments)
+    assert engine.stats['hits'] == 1
+
+    # Another reference window is fitted afresh.
+    engine.assign_embeddings(ids, X, reference=np.arange(50, 100), n_bins=3)
+    assert engine.stats['fits'] == 4
+
+
+def test_best_k_takes_the_highest_silhouette():
+    nan = float('nan')
+    assert best_k({2: {'silhouette': 0.3}, 3: {'silhouette': 0.7}, 4: {'silhouette': 0.5}}) == 3
+    # Ties go to the smaller k, and k that could not be scored are ignored.
+    assert best_k({2: {'silhouette': nan}, 3: {'silhouette': 0.5}, 5: {'silhouette': 0.5}}) == 3
+    assert best_k({4: {'silhouette': nan}, 2: {'silhouette': nan}}) == 2
+
+
+def test_auto_finds_the_number_of_clusters():
+    X, _ = clustered(300, n_clusters=4)
+    clustering = DriftEngine(k_range=range(2, 7), n_jobs=1).assign('session', X, np.arange(150), AUTO)
+    assert clustering.n_bins == 4
+    assert sorted(clustering.scores) == [2, 3, 4, 5, 6]
+    assert clustering.assignments.shape == (300,)
+
+
+def test_the_range_is_fitted_once_per_reference_window():
+    X, _ = clustered(200)
+    engine = DriftEngine(k_range=(2, 3, 4), n_jobs=1)
+    reference = np.zeros(200, dtype=bool)
+    reference[:80] = True
+
+    first = engine.assign('session', X, reference, 3)
+    assert engine.stats == {'hits': 0, 'partial_hits': 0, 'misses': 1, 'fits': 3}
+    # Another k in the range, AUTO, or the same reference given as row numbers: nothing is refitted.
+    engine.assign('session', X, reference, 2)
+    engine.assign('session', X, reference, AUTO)
+    again = engine.assign('session', X, np.arange(80), 3)
+    assert engine.stats['fits'] == 3
+    assert again.assignments is first.assignments
+    assert not again.assignments.flags.writeable
+
+    # A k outside the range is fitted on its own; a new reference window fits the range again.
+    engine.assign('session', X, reference, 6)
+    assert engine.stats['fits'] == 4
+    engine.assign('session', X, np.arange(100), 3)
+    assert engine.stats['fits'] == 7
+
+
+def test_least_recently_used_entries_are_evicted():
+    X, _ = clustered(100)
+    engine = DriftEngine(k_range=(2,), n_jobs=1, max_entries=2)
+    for key in ('a', 'b', 'a', 'c'):
+        engine.assign(key, X, np.arange(50), 2)
+    assert engine.stats['fits'] == 3
+    assert len(engine._fits) == len(engine._labels) == 2
+
+    # 'b' was the least recently used and is fitted again; 'a' is still cached.
+    engine.assign('a', X, np.arange(50), 2)
+    assert engine.stats['fits'] == 3
+    engine.assign('b', X, np.arange(50), 2)
+    assert engine.stats['fits'] == 4
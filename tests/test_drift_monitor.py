@@ -0,0 +1,101 @@
+"""``SlidingHistogram`` and ``DriftMonitor``: window expiry, late rows, and drift and recovery alerts."""
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+pytest.importorskip('scipy')
+
+from workshop.drift_monitor import DriftMonitor, SlidingHistogram  # noqa: E402
+
+TOPICS = 4
+DIM = 16
+
+
+def topic_embeddings(topics, seed=0):
+    """One embedding per entry of ``topics``, near that topic's own axis."""
+    rng = np.random.default_rng(seed)
+    centers = 10 * np.eye(TOPICS, DIM, dtype=np.float32)
+    return centers[topics] + rng.normal(scale=0.1, size=(len(topics), DIM)).astype(np.float32)
+
+
+def test_histogram_keeps_a_running_total_of_its_windows():
+    histogram = SlidingHistogram(n_bins=3, window_seconds=10, n_windows=2)
+    assert histogram.add(5, np.array([0, 0, 1]))
+    assert histogram.add(5, np.array([2]))
+    assert histogram.add(6, np.array([1, 1]))
+    np.testing.assert_array_equal(histogram.total, [2, 3, 1])
+
+    # Window 7 takes window 5's slot, and 5's rows leave the total.
+    assert histogram.add(7, np.array([2]))
+    np.testing.assert_array_equal(histogram.total, [0, 2, 1])
+    np.testing.assert_array_equal(histogram.total, histogram.counts.sum(axis=0))
+
+
+def test_histogram_expires_every_window_after_a_gap():
+    histogram = SlidingHistogram(n_bins=2, window_seconds=10, n_windows=3)
+    histogram.add(0, np.array([0, 1]))
+    histogram.add(1, np.array([1]))
+    histogram.add(10, np.array([0]))
+    np.testing.assert_array_equal(histogram.total, [1, 0])
+    assert sorted(histogram.window_ids) == [-1, -1, 10]
+
+
+def test_histogram_drops_rows_of_expired_windows():
+    histogram = SlidingHistogram(n_bins=2, window_seconds=10, n_windows=2)
+    histogram.add(4, np.array([0]))
+    # Window 3 is still in view; window 2 is not.
+    assert histogram.add(3, np.array([1]))
+    assert not histogram.add(2, np.array([1, 1]))
+    assert histogram.late == 2
+    np.testing.assert_array_equal(histogram.total, [1, 1])
+
+
+@pytest.fixture
+def monitor():
+    reference = np.tile(np.arange(TOPICS), 50)
+    monitor = DriftMonitor.fit(topic_embeddings(reference), n_bins=TOPICS, n_components=None, window_seconds=10,
+                               n_windows=3, threshold=0.25, clear_ratio=0.8, min_rows=30)
+    # Each topic is a cluster of its own, so shares of topics are shares of bins.
+    assert len(set(monitor.model.predict(topic_embeddings(np.arange(TOPICS))))) == TOPICS
+    return monitor
+
+
+def arrivals(start, seconds, topics, per_second=3, seed=1):
+    """(times, embeddings) of ``per_second`` rows a second from ``start``, cycling through ``topics``."""
+    times = np.repeat(np.arange(start, start + seconds), per_second)
+    return times, topic_embeddings(np.resize(topics, len(times)), seed)
+
+
+def test_a_shift_alerts_once_and_recovers_once(monitor):
+    events = monitor.observe(*arrivals(0, 30, np.arange(TOPICS)))
+    assert events == []
+    assert monitor.distance < 0.1
+
+    # Only topic 0 from now on: drift once enough of it is in view, and no repeat while it lasts.
+    events = monitor.observe(*arrivals(30, 30, [0]))
+    assert [event['event'] for event in events] == ['drift']
+    assert events[0]['distance'] >= 0.25
+    assert events[0]['rows_in_view'] >= 30
+    assert monitor.alerting
+
+    # The old mix again; it recovers once the drifted windows have slid out of view.
+    events = monitor.observe(*arrivals(60, 30, np.arange(TOPICS)))
+    assert [event['event'] for event in events] == ['recovered']
+    assert events[0]['distance'] < 0.25 * 0.8
+    assert not monitor.alerting
+    assert monitor.observed == 270
+
+
+def test_no_alert_before_min_rows(monitor):
+    assert monitor.observe(*arrivals(0, 5, [0], per_second=2)) == []
+    assert monitor.distance > 0.25
+    assert not monitor.alerting
+
+
+def test_rows_are_counted_in_time_order(monitor):
+    times, embeddings = arrivals(0, 30, [0])
+    shuffled = np.random.default_rng(0).permutation(len(times))
+    events = monitor.observe(times[shuffled], embeddings[shuffled])
+    assert [event['event'] for event in events] == ['drift']
+    assert monitor.histogram.late == 0
+    assert monitor.histogram.total.sum() == len(times)
@@ -0,0 +1,73 @@
+"""``EmbeddingCache``: lookups, the trigger-maintained size and LRU eviction."""
+import sqlite3
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from workshop.embedding_cache import LOW_WATERMARK, SCHEMA, EmbeddingCache  # noqa: E402
+
+DIM = 16
+ENTRY_BYTES = DIM * 4
+
+
+def stored_bytes(path):
+    with sqlite3.connect(path) as connection:
+        return connection.execute('SELECT COALESCE(SUM(LENGTH(embedding)), 0) FROM embeddings').fetchone()[0]
+
+
+def vector(n, dim=DIM):
+    return np.full(dim, n, dtype=np.float32)
+
+
+def test_hits_are_normalized_and_per_model(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.sqlite'))
+    cache.put('model-a', 'A  Photo ', vector(1))
+
+    assert np.array_equal(cache.get('model-a', 'a photo'), vector(1))
+    assert cache.get('model-b', 'a photo') is None
+    assert cache.stats['hits'] == 1
+    assert cache.stats['misses'] == 1
+
+
+def test_size_follows_inserts_replacements_and_deletes(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = EmbeddingCache(path)
+    cache.put_many('model', [f'prompt {n}' for n in range(5)], [vector(n) for n in range(5)])
+    assert cache.nbytes == stored_bytes(path) == 5 * ENTRY_BYTES
+
+    # Replacing an entry with a vector of another size swaps its bytes rather than adding them.
+    cache.put('model', 'prompt 0', vector(0, dim=2 * DIM))
+    assert cache.nbytes == stored_bytes(path) == 6 * ENTRY_BYTES
+
+    with sqlite3.connect(path) as connection:
+        connection.execute("DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings LIMIT 2)")
+    assert cache.nbytes == stored_bytes(path)
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = EmbeddingCache(path, max_bytes=10 * ENTRY_BYTES)
+    for n in range(10):
+        cache.put('model', f'prompt {n}', vector(n))
+    cache.get('model', 'prompt 0')
+
+    cache.put('model', 'prompt 10', vector(10))
+    assert cache.nbytes == stored_bytes(path) <= 10 * ENTRY_BYTES * LOW_WATERMARK
+    assert cache.stats['evicted'] == 2
+    assert cache.get('model', 'prompt 0') is not None
+    assert cache.get('model', 'prompt 1') is None
+    assert cache.get('model', 'prompt 10') is not None
+
+
+def test_size_is_seeded_from_an_existing_file(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with sqlite3.connect(path) as connection:
+        connection.execute(SCHEMA)
+        connection.executemany('INSERT INTO embeddings VALUES (?, ?, ?, ?, ?)',
+                               [(f'key {n}', 'model', vector(n).tobytes(), 0., n) for n in range(3)])
+
+    cache = EmbeddingCache(path)
+    assert cache.nbytes == 3 * ENTRY_BYTES
+    # A second process opening the same file keeps the running total.
+    assert EmbeddingCache(path).nbytes == 3 * ENTRY_BYTES
@@ -0,0 +1,29 @@
+"""Packing and decoding of embeddings."""
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from workshop.embeddings import decode_embeddings, encode_embedding  # noqa: E402
+
+
+def item(prompt_id, values, dtype='float32'):
+    return {'prompt_id': prompt_id, 'embedding': encode_embedding(values, dtype), 'embedding_dtype': dtype}
+
+
+def test_binary_and_legacy_rows_decode_together():
+    items = [item('a', [1, 2, 3]), item('b', [4, 5, 6], 'float16'), {'prompt_id': 'c', 'embedding': [7, 8, 9]}]
+    matrix = decode_embeddings(items)
+    assert matrix.dtype == np.float32
+    assert matrix.tolist() == [[1, 2, 3], [4, 5, 6], [7, 8, 9]]
+
+
+@pytest.mark.parametrize('odd', [item('odd', [1, 2]), item('odd', [1, 2, 3, 4], 'float16'),
+                                 {'prompt_id': 'odd', 'embedding': [1, 2]}])
+def test_mixed_dimensions_name_the_row(odd):
+    with pytest.raises(ValueError, match='Embedding of odd '):
+        decode_embeddings([item('a', [1, 2, 3]), odd])
+
+
+def test_dim_is_checked_against_the_given_one():
+    with pytest.raises(ValueError, match='Embedding of a is 8 bytes'):
+        decode_embeddings([item('a', [1, 2])], dim=3)
@@ -0,0 +1,92 @@
+"""Retries and the shared HTTP session of ``workshop.generation``."""
+import random
+
+import pytest
+
+openai = pytest.importorskip('openai')
+
+from workshop import generation  # noqa: E402
+from workshop.generation import SharedSession, backoff, install_session, with_retries  # noqa: E402
+
+
+def failing(errors, result='done'):
+    """A call that raises each of ``errors`` in turn, then returns ``result``."""
+    errors = list(errors)
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return result
+    return call
+
+
+def test_backoff_is_full_jitter_under_the_cap():
+    random.seed(0)
+    for attempt in range(8):
+        delays = [backoff(attempt, base=0.5, cap=8) for _ in range(200)]
+        assert 0 <= min(delays) and max(delays) <= min(8, 0.5 * 2 ** attempt)
+        # Full jitter spreads over the whole range rather than clustering at the top.
+        assert min(delays) < 0.25 * min(8, 0.5 * 2 ** attempt)
+
+
+def test_retries_until_the_call_succeeds():
+    sleeps = []
+    call = failing([openai.error.RateLimitError('slow down'), openai.error.APIConnectionError('reset')])
+    assert with_retries(call, max_retries=4, sleep=sleeps.append) == 'done'
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= generation.BACKOFF_BASE and 0 <= sleeps[1] <= 2 * generation.BACKOFF_BASE
+
+
+def test_retry_after_is_honoured():
+    sleeps = []
+    error = openai.error.RateLimitError('slow down', headers={'retry-after': '7'})
+    assert with_retries(failing([error]), sleep=sleeps.append) == 'done'
+    assert sleeps == [7.]
+
+
+@pytest.mark.parametrize('headers', [None, {}, {'retry-after': 'Wed, 21 Oct 2015 07:28:00 GMT'}])
+def test_a_missing_or_unparsable_retry_after_falls_back_to_backoff(headers):
+    sleeps = []
+    error = openai.error.RateLimitError('slow down', headers=headers)
+    with_retries(failing([error]), sleep=sleeps.append)
+    assert 0 <= sleeps[0] <= generation.BACKOFF_BASE
+
+
+def test_gives_up_after_max_retries():
+    sleeps = []
+    call = failing([openai.error.ServiceUnavailableError('down')] * 3)
+    with pytest.raises(openai.error.ServiceUnavailableError):
+        with_retries(call, max_retries=2, sleep=sleeps.append)
+    assert len(sleeps) == 2
+
+
+def test_other_errors_are_not_retried():
+    sleeps = []
+    with pytest.raises(openai.error.InvalidRequestError):
+        with_retries(failing([openai.error.InvalidRequestError('bad prompt', 'prompt')]), sleep=sleeps.append)
+    assert sleeps == []
+
+
+@pytest.fixture
+def no_session(monkeypatch):
+    monkeypatch.setattr(openai, 'requestssession', None)
+
+
+def test_one_session_is_installed_for_every_thread(no_session, monkeypatch):
+    from openai import api_requestor
+
+    session = install_session(pool_size=4)
+    assert install_session(pool_size=32) is session
+    generation.Generator('key', pool_size=8)
+    assert openai.requestssession is session
+    assert session.adapters['https://']._pool_maxsize == 4
+    # What the pinned client hands to each thread; 1.x has no such hook.
+    assert api_requestor._make_session() is session
+
+    # Later 0.27 releases close a thread's session every 180 seconds; the others keep their connections.
+    closed = []
+    for adapter in session.adapters.values():
+        monkeypatch.setattr(adapter, 'close', lambda: closed.append(adapter))
+    session.close()
+    assert isinstance(session, SharedSession)
+    assert closed == []
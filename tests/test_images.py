@@ -0,0 +1,95 @@
+"""``ImageCache`` against a moto S3 bucket."""
+import io
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+Image = pytest.importorskip('PIL.Image')
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+from workshop.images import ImageCache  # noqa: E402
+
+BUCKET_NAME = 'test-workshop'
+
+
+def make_png(size=32):
+    out = io.BytesIO()
+    Image.fromarray(np.zeros((size, size, 3), dtype=np.uint8)).save(out, format='PNG')
+    return out.getvalue()
+
+
+@pytest.fixture
+def bucket():
+    with moto.mock_aws():
+        bucket = boto3.resource('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET_NAME)
+        bucket.put_object(Key='present.png', Body=make_png())
+        yield bucket
+
+
+def test_images_are_fetched_once(bucket, tmp_path):
+    cache = ImageCache(bucket, directory=str(tmp_path))
+    data = cache.get('present')
+    assert data == make_png()
+    assert cache.get('present') == data
+    assert cache.get('present', thumbnail=True).startswith(b'\x89PNG')
+    assert cache.stats['misses'] == 2
+    assert cache.stats['memory_hits'] == 2
+
+
+def test_missing_image_gives_none(bucket, tmp_path):
+    cache = ImageCache(bucket, directory=str(tmp_path))
+    assert cache.get('missing') is None
+    assert cache.get('missing', thumbnail=True) is None
+    assert cache.stats['errors'] == 2
+
+
+def test_failures_are_retried(bucket, tmp_path):
+    def fail_once(**_):
+        bucket.meta.client.meta.events.unregister('before-call.s3.GetObject', fail_once)
+        raise ClientError({'Error': {'Code': 'SlowDown', 'Message': 'Please reduce your request rate.'}},
+                          'GetObject')
+
+    bucket.meta.client.meta.events.register('before-call.s3.GetObject', fail_once)
+    cache = ImageCache(bucket, directory=str(tmp_path))
+    assert cache.get('present') is None
+    assert cache.get('present') == make_png()
+
+
+def test_failed_prefetch_gives_none(bucket, tmp_path):
+    cache = ImageCache(bucket, directory=str(tmp_path))
+    cache.prefetch(['missing'])
+    assert cache.get('missing') is None
+
+
+def test_concurrent_requests_share_one_download(bucket, tmp_path):
+    ids = [f'image-{n}' for n in range(6)]
+    for prompt_id in ids:
+        bucket.put_object(Key=prompt_id + '.png', Body=make_png())
+    calls = []
+
+    def slow_get(**_):
+        calls.append(1)
+        time.sleep(0.05)
+
+    bucket.meta.client.meta.events.register('before-call.s3.GetObject', slow_get)
+    cache = ImageCache(bucket, directory=str(tmp_path), prefetch_workers=4)
+    # What page 2 does for a selection's neighbours: thumbnails first, then the full images.
+    cache.prefetch(ids, thumbnail=True)
+    cache.prefetch(ids)
+    for prompt_id in ids:
+        assert cache.get(prompt_id) == make_png()
+        assert cache.get(prompt_id, thumbnail=True) is not None
+    assert len(calls) == len(ids)
+
+
+@pytest.mark.parametrize('body', [b'not an image', make_png()[:40]])
+def test_unreadable_image_gives_no_thumbnail(bucket, tmp_path, body):
+    bucket.put_object(Key='broken.png', Body=body)
+    cache = ImageCache(bucket, directory=str(tmp_path))
+    assert cache.get('broken', thumbnail=True) is None
+    assert cache.stats['errors'] == 1
+    assert cache.get('broken') == body
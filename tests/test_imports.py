@@ -0,0 +1,91 @@
+"""Every ``from workshop... import name`` in the app resolves to something the module defines.
+
+The static check parses the sources, so it needs none of the app's dependencies and catches a page importing a
+function that was renamed or removed. The runtime check then imports the modules the pages use, skipping those
+whose third-party dependencies are not installed.
+"""
+import ast
+import glob
+import importlib
+import importlib.util
+import os
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+# Read st.secrets as soon as they are imported, so they only load inside a configured Streamlit app.
+NEEDS_SECRETS = {'workshop.analytics', 'workshop.debug'}
+
+
+def sources(*patterns):
+    return sorted(path for pattern in patterns for path in glob.glob(os.path.join(ROOT, pattern)))
+
+
+PAGES = sources('Welcome!.py', 'pages/*.py')
+ALL_SOURCES = PAGES + sources('workshop/*.py', 'benchmarks/*.py')
+
+
+def module_path(module):
+    path = os.path.join(ROOT, *module.split('.'))
+    return os.path.join(path, '__init__.py') if os.path.isdir(path) else path + '.py'
+
+
+def _bound_names(statements):
+    """Names bound at module level, including inside top-level if/try/with blocks."""
+    names = set()
+    for node in statements:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split('.')[0] for alias in node.names)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names.update(n.id for target in targets for n in ast.walk(target) if isinstance(n, ast.Name))
+        for block in ('body', 'orelse', 'finalbody'):
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                names |= _bound_names(getattr(node, block, []))
+        for handler in getattr(node, 'handlers', []):
+            names |= _bound_names(handler.body)
+    return names
+
+
+def defined_names(module):
+    with open(module_path(module)) as f:
+        return _bound_names(ast.parse(f.read()).body)
+
+
+def workshop_imports(path):
+    """(module, name) for every ``from workshop... import name`` in ``path``, at any depth."""
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.level == 0 and (node.module or '').split('.')[0] == 'workshop':
+            for alias in node.names:
+                yield node.module, alias.name
+
+
+@pytest.mark.parametrize('path', ALL_SOURCES, ids=lambda path: os.path.relpath(path, ROOT))
+def test_workshop_imports_resolve(path):
+    missing = []
+    for module, name in workshop_imports(path):
+        if not os.path.exists(module_path(module)):
+            missing.append(f'{module} (no such module)')
+        elif not os.path.exists(module_path(f'{module}.{name}')) and name not in defined_names(module):
+            missing.append(f'{module}.{name}')
+    assert not missing, f'{os.path.relpath(path, ROOT)} imports names that do not exist: {missing}'
+
+
+PAGE_IMPORTS = sorted({pair for path in PAGES for pair in workshop_imports(path)})
+
+
+@pytest.mark.parametrize('module, name', PAGE_IMPORTS, ids=lambda value: value)
+def test_page_imports_load(module, name):
+    if module in NEEDS_SECRETS:
+        pytest.skip(f'{module} reads st.secrets on import')
+    try:
+        imported = importlib.import_module(module)
+    except ModuleNotFoundError as e:
+        if (e.name or '').split('.')[0] == 'workshop':
+            raise
+        pytest.skip(f'{e.name} is not installed')
+    assert hasattr(imported, name) or importlib.util.find_spec(f'{module}.{name}') is not None
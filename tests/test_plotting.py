@@ -0,0 +1,78 @@
+"""``ScatterView``: render modes by points in view, drill-down, payload and selected keys."""
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+pytest.importorskip('plotly')
+
+from workshop.plotting import MAX_POINTS, WEBGL_THRESHOLD, ScatterView, render_mode  # noqa: E402
+
+
+def make_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'UMAP_0': rng.uniform(0, 10, n), 'UMAP_1': rng.uniform(0, 10, n),
+                         'prompt_id': [f'id-{i}' for i in range(n)], 'user': rng.choice(['a', 'b', 'c'], n)})
+
+
+def test_render_mode_thresholds():
+    assert render_mode(0) == 'svg'
+    assert render_mode(WEBGL_THRESHOLD) == 'svg'
+    assert render_mode(WEBGL_THRESHOLD + 1) == 'webgl'
+    assert render_mode(MAX_POINTS) == 'webgl'
+    assert render_mode(MAX_POINTS + 1) == 'density'
+
+
+@pytest.mark.parametrize('n, mode, trace', [(20, 'svg', 'scatter'), (50, 'webgl', 'scattergl'),
+                                            (200, 'density', 'heatmap')])
+def test_each_mode_draws_its_own_trace(n, mode, trace):
+    view = ScatterView(make_frame(n), 'UMAP_0', 'UMAP_1', webgl_threshold=20, max_points=100, bins=8)
+    assert view.mode == mode
+    fig = view.figure()
+    assert {data.type for data in fig.data} == {trace}
+    if mode == 'density':
+        # Only bins x bins counts go to the browser, and they account for every point.
+        z = np.asarray(fig.data[0].z, dtype=float)
+        assert z.shape == (8, 8)
+        assert np.nansum(z) == n
+    else:
+        assert np.all(np.round(fig.data[0].x, 3) == fig.data[0].x)
+        assert [row[0] for row in fig.data[0].customdata] == list(view.frame['prompt_id'])
+
+
+def test_narrowing_the_view_drills_down_to_points():
+    frame = make_frame(200)
+    thresholds = {'webgl_threshold': 50, 'max_points': 100}
+    assert ScatterView(frame, 'UMAP_0', 'UMAP_1', **thresholds).mode == 'density'
+    assert ScatterView(frame, 'UMAP_0', 'UMAP_1', x_range=(0, 4), **thresholds).mode == 'webgl'
+
+    view = ScatterView(frame, 'UMAP_0', 'UMAP_1', x_range=(0, 2), y_range=(0, 5), **thresholds)
+    in_view = frame['UMAP_0'].between(0, 2) & frame['UMAP_1'].between(0, 5)
+    assert len(view.frame) == in_view.sum()
+    assert view.hidden == 200 - in_view.sum()
+    assert view.mode == 'svg'
+
+
+def test_selected_ids_follow_the_clicked_traces():
+    view = ScatterView(make_frame(30), 'UMAP_0', 'UMAP_1')
+    # One trace per colour, so each event names its trace as well as the point in it.
+    fig = view.figure(color='user')
+    events = [{'curveNumber': 1, 'pointIndex': 0}, {'curveNumber': 0, 'pointIndex': 2},
+              {'curveNumber': 1, 'pointIndex': 0}]
+    expected = [fig.data[1].customdata[0][0], fig.data[0].customdata[2][0]]
+    assert view.selected_ids(fig, events) == expected
+    assert view.frame.set_index('prompt_id').loc[expected[0], 'user'] == fig.data[1].name
+
+
+def test_a_density_click_selects_its_whole_cell():
+    frame = make_frame(500)
+    view = ScatterView(frame, 'UMAP_0', 'UMAP_1', max_points=100, bins=5)
+    fig = view.figure()
+    heatmap = fig.data[0]
+    x, y = heatmap.x[1], heatmap.y[3]
+
+    selected = view.selected_ids(fig, [{'x': x, 'y': y}, {'x': x, 'y': y}])
+    x_edges, y_edges = np.histogram_bin_edges(frame['UMAP_0'], 5), np.histogram_bin_edges(frame['UMAP_1'], 5)
+    in_cell = (frame['UMAP_0'].between(x_edges[1], x_edges[2], inclusive='left')
+               & frame['UMAP_1'].between(y_edges[3], y_edges[4], inclusive='left'))
+    assert selected == list(frame.loc[in_cell, 'prompt_id'])
+    assert len(selected) == np.asarray(heatmap.z, dtype=float)[3, 1]
@@ -0,0 +1,155 @@
+"""``ProjectionCache``: hits, incremental placement, refits and per-key locking."""
+import threading
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+from workshop.neighbors import NeighborIndex  # noqa: E402
+from workshop.projection import ProjectionCache  # noqa: E402
+from workshop.reducers import ReducerPipeline  # noqa: E402
+
+
+def make_embeddings(n, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def ids_for(n):
+    return [f'id-{i}' for i in range(n)]
+
+
+def project(cache, key, n, X, **kwargs):
+    # The PCA backend is quick and can transform; the caching does not depend on the backend.
+    return cache.project(key, ids_for(n), X, rows=np.arange(n), backend='pca', **kwargs)
+
+
+def test_a_rerun_over_the_same_rows_is_a_hit():
+    X = make_embeddings(50)
+    cache = ProjectionCache(prestage=None)
+    coords = project(cache, 'session', 50, X)
+    assert coords.shape == (50, 2)
+    assert cache.stats['misses'] == 1
+
+    assert project(cache, 'session', 50, X) is coords
+    assert cache.stats['hits'] == 1
+    # Another key, or another backend, has an entry of its own.
+    project(cache, 'other', 50, X)
+    cache.project('session', ids_for(50), X, backend='tsne')
+    assert cache.stats['misses'] == 3
+
+
+def test_a_few_new_rows_are_transformed_not_refitted():
+    X = make_embeddings(55)
+    cache = ProjectionCache(prestage=None, refit_fraction=0.2)
+    coords = project(cache, 'session', 50, X)
+
+    extended = project(cache, 'session', 55, X)
+    assert cache.stats['misses'] == 1
+    assert cache.stats['partial_hits'] == 1
+    np.testing.assert_array_equal(extended[:50], coords)
+    np.testing.assert_allclose(extended[50:], cache._entries[('session', 'pca')]['reducer'].transform(X[50:]),
+                               rtol=1e-5)
+
+    # The same rows in another order come from the same entry.
+    order = ids_for(55)[::-1]
+    np.testing.assert_array_equal(cache.project('session', order, X, rows=np.arange(55)[::-1], backend='pca'),
+                                  extended[::-1])
+    assert cache.stats['misses'] == 1
+
+
+def test_more_new_rows_than_refit_fraction_refit():
+    X = make_embeddings(70)
+    cache = ProjectionCache(prestage=None, refit_fraction=0.2)
+    project(cache, 'session', 50, X)
+    project(cache, 'session', 60, X)
+    assert cache.stats['partial_hits'] == 1
+
+    # 20 rows added since the fit on 50 is past 20%.
+    project(cache, 'session', 70, X)
+    assert cache.stats['misses'] == 2
+    assert cache._entries[('session', 'pca')]['fit_rows'] == 70
+
+
+@pytest.fixture
+def slow_fits(monkeypatch):
+    """Fits that wait for ``release`` after setting ``started``."""
+    started, release = threading.Event(), threading.Event()
+    fit_transform = ReducerPipeline.fit_transform
+
+    def slow_fit_transform(self, X, knn=None):
+        started.set()
+        assert release.wait(5)
+        return fit_transform(self, X, knn=knn)
+
+    monkeypatch.setattr(ReducerPipeline, 'fit_transform', slow_fit_transform)
+    yield started, release
+    release.set()
+
+
+def test_a_slow_fit_does_not_hold_up_other_keys(slow_fits):
+    started, release = slow_fits
+    X = make_embeddings(50)
+    cache = ProjectionCache(prestage=None)
+    release.set()
+    project(cache, 'fast', 50, X)
+    release.clear()
+    started.clear()
+
+    thread = threading.Thread(target=project, args=(cache, 'slow', 50, X))
+    thread.start()
+    assert started.wait(5)
+    project(cache, 'fast', 50, X)
+    assert cache.stats['hits'] == 1
+    release.set()
+    thread.join()
+    assert cache.stats['misses'] == 2
+
+
+def test_concurrent_callers_of_one_key_share_the_fit(slow_fits):
+    started, release = slow_fits
+    X = make_embeddings(50)
+    cache = ProjectionCache(prestage=None)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(project(cache, 'session', 50, X)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    # Give the others time to queue up behind the key's lock.
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert cache.stats['misses'] == 1
+    assert cache.stats['hits'] == 3
+    assert all(coords is results[0] for coords in results)
+
+
+def entry_for(ids, coords):
+    return {'ids': list(ids), 'coords': np.asarray(coords, dtype=np.float64),
+            'positions': {id_: row for row, id_ in enumerate(ids)}}
+
+
+def test_new_rows_land_between_their_projected_neighbours():
+    X = make_embeddings(6)
+    index = NeighborIndex()
+    index.add(['a', 'b', 'c', 'd', 'e', 'new'], X)
+    entry = entry_for('abcde', np.arange(10).reshape(5, 2))
+
+    coords = ProjectionCache._place(entry, X[5:], index)
+    assert coords.shape == (1, 2)
+    assert np.all(coords >= entry['coords'].min(axis=0)) and np.all(coords <= entry['coords'].max(axis=0))
+
+
+def test_rows_without_projected_neighbours_go_to_the_centroid():
+    X = make_embeddings(3)
+    # The index only knows rows that have no coordinates yet.
+    index = NeighborIndex()
+    index.add(['new-1', 'new-2', 'new-3'], X)
+    entry = entry_for(['a', 'b'], [[0., 0.], [2., 4.]])
+
+    coords = ProjectionCache._place(entry, X, index)
+    np.testing.assert_allclose(coords, [[1., 2.]] * 3)
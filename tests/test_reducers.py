@@ -0,0 +1,83 @@
+"""``ReducerPipeline``: pre-stages, backends and precomputed neighbour graphs."""
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+from workshop.neighbors import NeighborIndex  # noqa: E402
+from workshop.reducers import BACKENDS, PRESTAGES, ReducerPipeline, batches  # noqa: E402
+
+
+def make_embeddings(n=120, dim=32, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def knn_graph(X):
+    index = NeighborIndex()
+    index.add([str(i) for i in range(len(X))], X)
+    return index.knn_graph(4)
+
+
+def test_the_default_prestage_is_the_first_128_dimensions():
+    X = make_embeddings(dim=200)
+    reducer = ReducerPipeline(backend='pca')
+    reducer.fit_transform(X)
+    assert reducer.prestage == 'slice'
+    np.testing.assert_array_equal(reducer._apply_prestage(X), X[:, :128])
+
+
+def test_unknown_stages_are_rejected():
+    with pytest.raises(ValueError, match='backend'):
+        ReducerPipeline(backend='mds')
+    with pytest.raises(ValueError, match='prestage'):
+        ReducerPipeline(prestage='svd')
+
+
+def test_batches_merge_a_short_tail():
+    assert batches(10, 4) == [slice(0, 4), slice(4, 8), slice(8, 10)]
+    assert batches(9, 4, min_size=2) == [slice(0, 4), slice(4, 9)]
+    assert batches(3, 4, min_size=8) == [slice(0, 3)]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('prestage', PRESTAGES + (None,))
+def test_every_pipeline_projects_and_places_new_points(prestage, backend):
+    if backend == 'umap':
+        pytest.importorskip('umap')
+    X = make_embeddings()
+    # Batches smaller than the rows, so the PCA pre-stage is fitted incrementally.
+    reducer = ReducerPipeline(backend=backend, prestage=prestage, n_components=8, batch_size=50)
+    coords = reducer.fit_transform(X)
+
+    assert coords.shape == (len(X), 2)
+    assert np.isfinite(coords).all()
+    assert reducer._apply_prestage(X).shape == (len(X), 8 if prestage else X.shape[1])
+    assert reducer.supports_transform == (backend != 'tsne')
+    if backend == 'tsne':
+        with pytest.raises(NotImplementedError):
+            reducer.transform(X[:5])
+    else:
+        placed = reducer.transform(X[:5])
+        assert placed.shape == (5, 2)
+        if backend == 'pca':
+            np.testing.assert_allclose(placed, coords[:5], rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.parametrize('prestage', ['slice', 'pca', 'random'])
+def test_a_prestage_keeps_umap_off_the_full_width_graph(prestage):
+    # The graph is over the full vectors; UMAP fitted on the pre-staged ones has to find its own neighbours.
+    assert not ReducerPipeline(backend='umap', prestage=prestage).uses_knn
+    assert ReducerPipeline(backend='umap', prestage=None).uses_knn
+    assert not ReducerPipeline(backend='pca', prestage=None).uses_knn
+
+
+def test_umap_on_a_precomputed_graph_uses_its_metric():
+    pytest.importorskip('umap')
+    X = make_embeddings()
+    reducer = ReducerPipeline(backend='umap', prestage=None)
+    coords = reducer.fit_transform(X, knn=knn_graph(X))
+
+    assert coords.shape == (len(X), 2)
+    assert reducer.precomputed_knn_
+    assert reducer.backend_.metric == 'cosine'
+    assert not reducer.supports_transform
@@ -0,0 +1,205 @@
+"""``TableSync`` against a moto DynamoDB table: cold scans, incremental syncs and the index fallback."""
+import logging
+
+import pytest
+
+np = pytest.importorskip('numpy')
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+from workshop.embeddings import DTYPE_ATTRIBUTE, EMBEDDING_ATTRIBUTE, encode_embedding  # noqa: E402
+from workshop.store import TableSync  # noqa: E402
+
+TABLE_NAME = 'test-workshop'
+INDEX_NAME = 'session_id-time-index'
+DIM = 8
+NOW = 1_700_000_000
+
+
+@pytest.fixture
+def table():
+    with moto.mock_aws():
+        yield boto3.resource('dynamodb', region_name='us-east-1').create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'prompt_id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'prompt_id', 'AttributeType': 'S'},
+                                  {'AttributeName': 'session_id', 'AttributeType': 'S'},
+                                  {'AttributeName': 'time', 'AttributeType': 'N'}],
+            GlobalSecondaryIndexes=[{'IndexName': INDEX_NAME,
+                                     'KeySchema': [{'AttributeName': 'session_id', 'KeyType': 'HASH'},
+                                                   {'AttributeName': 'time', 'KeyType': 'RANGE'}],
+                                     'Projection': {'ProjectionType': 'ALL'}}],
+            BillingMode='PAY_PER_REQUEST')
+
+
+def put(table, n, time, session_id='s1'):
+    """Write row ``n``, whose embedding is filled with ``n``."""
+    table.put_item(Item={'prompt_id': f'id-{n}', 'session_id': session_id, 'time': time, 'prompt': f'prompt {n}',
+                         EMBEDDING_ATTRIBUTE: encode_embedding(np.full(DIM, n)), DTYPE_ATTRIBUTE: 'float32'})
+
+
+def rows_by_id(table_sync):
+    """{prompt_id: n}, read back from the embedding matrix, which also checks rows and vectors line up."""
+    frame, embeddings, _ = table_sync.snapshot()
+    return {id_: int(embeddings[row, 0]) for row, id_ in zip(frame.index, frame['prompt_id'])}
+
+
+@pytest.mark.parametrize('segments', [1, 4])
+def test_cold_scan_reads_every_row_once(table, segments):
+    for n in range(50):
+        put(table, n, NOW + n)
+
+    table_sync = TableSync(table, segments=segments)
+    assert table_sync.sync() == 50
+    assert rows_by_id(table_sync) == {f'id-{n}': n for n in range(50)}
+    assert table_sync.embeddings().shape == (50, DIM)
+    assert table_sync.watermark == NOW + 49
+    assert table_sync.version == 1
+
+
+def test_incremental_sync_dedupes_the_lookback(table):
+    for n in range(5):
+        put(table, n, NOW + n)
+    table_sync = TableSync(table, lookback=60)
+    table_sync.sync()
+
+    # Stamped before the watermark but submitted afterwards, within the lookback.
+    put(table, 5, NOW + 1)
+    put(table, 6, NOW + 10)
+    assert table_sync.sync(max_age=0) == 2
+    assert rows_by_id(table_sync) == {f'id-{n}': n for n in range(7)}
+    assert table_sync.watermark == NOW + 10
+    assert table_sync.version == 2
+
+    # The lookback re-reads rows that are already stored; none of them is added twice.
+    assert table_sync.sync(max_age=0) == 0
+    assert len(table_sync) == 7
+    assert table_sync.version == 2
+
+
+def test_rows_older_than_the_lookback_are_not_picked_up(table):
+    put(table, 0, NOW)
+    table_sync = TableSync(table, lookback=60)
+    table_sync.sync()
+
+    put(table, 1, NOW - 120)
+    assert table_sync.sync(max_age=0) == 0
+
+
+def test_sync_is_skipped_within_max_age(table):
+    put(table, 0, NOW)
+    table_sync = TableSync(table)
+    table_sync.sync()
+    put(table, 1, NOW + 1)
+
+    assert table_sync.sync(max_age=3600) == 0
+    assert table_sync.sync(max_age=0) == 1
+
+
+def test_incremental_scan_without_index_warns_once(table, caplog):
+    put(table, 0, NOW)
+    table_sync = TableSync(table)
+    table_sync.sync()
+
+    with caplog.at_level(logging.WARNING):
+        table_sync.sync(max_age=0)
+        table_sync.sync(max_age=0)
+    assert sum('without a session_id/time index' in r.getMessage() for r in caplog.records) == 1
+
+
+def test_query_reads_only_the_session(table):
+    for n in range(6):
+        put(table, n, NOW + n, session_id='s1' if n % 2 else 's2')
+
+    table_sync = TableSync(table, session_id='s1', index_name=INDEX_NAME)
+    assert table_sync.sync() == 3
+    assert rows_by_id(table_sync) == {'id-1': 1, 'id-3': 3, 'id-5': 5}
+    assert table_sync.stats['scanned'] == 3
+
+    put(table, 6, NOW + 6, session_id='s2')
+    put(table, 7, NOW + 7, session_id='s1')
+    assert table_sync.sync(max_age=0) == 1
+    assert table_sync.index_name == INDEX_NAME
+
+
+def reject_queries(code):
+    def handler(**_):
+        raise ClientError({'Error': {'Code': code, 'Message': 'The table does not have the specified index'}},
+                          'Query')
+    return handler
+
+
+@pytest.mark.parametrize('code', [None, 'ValidationException'])
+def test_missing_index_falls_back_to_a_filtered_scan(table, caplog, code):
+    for n in range(6):
+        put(table, n, NOW + n, session_id='s1' if n % 2 else 's2')
+    if code is not None:
+        # What DynamoDB itself answers; moto says ResourceNotFoundException.
+        table.meta.client.meta.events.register('before-call.dynamodb.Query', reject_queries(code))
+
+    table_sync = TableSync(table, session_id='s1', index_name='no-such-index')
+    with caplog.at_level(logging.WARNING):
+        assert table_sync.sync() == 3
+    assert table_sync.index_name is None
+    assert rows_by_id(table_sync) == {'id-1': 1, 'id-3': 3, 'id-5': 5}
+    assert any('no-such-index' in r.getMessage() for r in caplog.records)
+
+    put(table, 7, NOW + 7, session_id='s1')
+    assert table_sync.sync(max_age=0) == 1
+
+
+def test_other_query_errors_are_raised(table):
+    table.meta.client.meta.events.register('before-call.dynamodb.Query', reject_queries('AccessDeniedException'))
+    table_sync = TableSync(table, session_id='s1', index_name=INDEX_NAME)
+    with pytest.raises(ClientError):
+        table_sync.sync()
+    assert table_sync.index_name == INDEX_NAME
+
+
+def test_requests_and_decoding_are_timed(table):
+    from workshop import metrics
+
+    for n in range(3):
+        put(table, n, NOW + n)
+    metrics.start_trace()
+    # One segment, so the scan runs on this thread and shows up in its trace.
+    TableSync(table, segments=1).sync()
+
+    stages = {record['stage']: record for record in metrics.trace()}
+    # Response bytes come from Content-Length, which moto leaves out.
+    assert stages['dynamodb.scan']['rows'] == 3
+    assert stages['embeddings.decode']['rows'] == 3
+    assert stages['embeddings.decode']['bytes'] == 3 * DIM * 4
+
+
+def test_rows_of_another_dimension_are_skipped_by_prompt_id(table, caplog):
+    put(table, 0, NOW)
+    table_sync = TableSync(table, lookback=60)
+    table_sync.sync()
+
+    table.put_item(Item={'prompt_id': 'other-model', 'time': NOW + 1,
+                         EMBEDDING_ATTRIBUTE: encode_embedding(np.zeros(2 * DIM)), DTYPE_ATTRIBUTE: 'float32'})
+    put(table, 1, NOW + 2)
+    with caplog.at_level(logging.WARNING):
+        assert table_sync.sync(max_age=0) == 1
+    assert rows_by_id(table_sync) == {'id-0': 0, 'id-1': 1}
+    assert table_sync.stats['skipped'] == 1
+    assert any('other-model' in r.getMessage() for r in caplog.records)
+
+    # Re-read within the lookback, but neither added nor counted again.
+    assert table_sync.sync(max_age=0) == 0
+    assert table_sync.stats['skipped'] == 1
+
+
+def test_cold_scan_keeps_the_most_common_dimension(table):
+    table.put_item(Item={'prompt_id': 'other-model', 'time': NOW,
+                         EMBEDDING_ATTRIBUTE: encode_embedding(np.zeros(2 * DIM)), DTYPE_ATTRIBUTE: 'float32'})
+    for n in range(3):
+        put(table, n, NOW + n)
+
+    table_sync = TableSync(table, segments=1)
+    assert table_sync.sync() == 3
+    assert table_sync.embeddings().shape == (3, DIM)
+    assert table_sync.stats['skipped'] == 1
@@ -0,0 +1,145 @@
+"""``SubmitQueue`` against moto: per-user ordering, and rows the table rejects."""
+import time
+
+import pytest
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+from workshop import submit_queue  # noqa: E402
+from workshop.submit_queue import SubmitQueue  # noqa: E402
+
+TABLE_NAME = 'test-workshop'
+BUCKET_NAME = 'test-workshop'
+
+
+@pytest.fixture
+def resources(monkeypatch):
+    monkeypatch.setattr(submit_queue, 'BACKOFF_BASE', 0.01)
+    monkeypatch.setattr(submit_queue, 'POLL_SECONDS', 0.01)
+    with moto.mock_aws():
+        bucket = boto3.resource('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET_NAME)
+        table = boto3.resource('dynamodb', region_name='us-east-1').create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'prompt_id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'prompt_id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST')
+        yield bucket, table
+
+
+def watch_writes(table):
+    """prompt_ids in the order their writes succeed, through the client's event hooks."""
+    written = []
+
+    def before_write(params, context, **_):
+        if 'Item' in params:
+            context['prompt_ids'] = [params['Item']['prompt_id']]
+        else:
+            context['prompt_ids'] = [request['PutRequest']['Item']['prompt_id']
+                                     for request in params['RequestItems'].get(TABLE_NAME, [])]
+
+    def after_write(context, parsed, **_):
+        if 'Error' not in parsed:
+            written.extend(context.get('prompt_ids', []))
+
+    events = table.meta.client.meta.events
+    for operation in ('BatchWriteItem', 'PutItem'):
+        events.register(f'provide-client-params.dynamodb.{operation}', before_write)
+        events.register(f'after-call.dynamodb.{operation}', after_write)
+    return written
+
+
+def reject_writes_of(table, prompt_id, times):
+    """Fail the first ``times`` requests that write ``prompt_id``, as a throttled table would."""
+    remaining = [times]
+
+    def handler(params, **_):
+        items = [params['Item']] if 'Item' in params else \
+            [request['PutRequest']['Item'] for request in params['RequestItems'].get(TABLE_NAME, [])]
+        if remaining[0] and any(item['prompt_id'] == prompt_id for item in items):
+            remaining[0] -= 1
+            raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'Slow down'}},
+                              'BatchWriteItem')
+
+    events = table.meta.client.meta.events
+    for operation in ('BatchWriteItem', 'PutItem'):
+        events.register(f'provide-client-params.dynamodb.{operation}', handler)
+
+
+def wait_until_drained(queue, written=None, timeout=10.):
+    """Until the queue is empty and, since stats are counted after the commit, has counted ``written`` rows."""
+    deadline = time.monotonic() + timeout
+    while (queue.depth() or written is not None and queue.stats['written'] < written) \
+            and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert queue.depth() == 0
+
+
+def stored_ids(table):
+    return {item['prompt_id'] for item in table.scan()['Items']}
+
+
+def test_rows_are_written_and_images_uploaded(resources, tmp_path):
+    bucket, table = resources
+    queue = SubmitQueue(bucket, table, path=str(tmp_path / 'queue.sqlite'))
+    queue.put({'prompt_id': 'a-1', 'user': 'a'}, image=b'png bytes')
+    queue.put({'prompt_id': 'b-1', 'user': 'b'})
+    wait_until_drained(queue, written=2)
+
+    assert stored_ids(table) == {'a-1', 'b-1'}
+    assert bucket.Object('a-1.png').get()['Body'].read() == b'png bytes'
+    assert queue.stats['written'] == 2
+    assert queue.dead_letters() == 0
+
+
+def test_a_users_later_rows_wait_for_a_failed_one(resources, tmp_path):
+    bucket, table = resources
+    written = watch_writes(table)
+    # The batch and then the row on its own.
+    reject_writes_of(table, 'a-1', times=2)
+    queue = SubmitQueue(bucket, table, path=str(tmp_path / 'queue.sqlite'))
+    for prompt_id, user in [('a-1', 'a'), ('a-2', 'a'), ('b-1', 'b'), ('a-3', 'a')]:
+        queue.put({'prompt_id': prompt_id, 'user': user})
+    wait_until_drained(queue)
+
+    assert stored_ids(table) == {'a-1', 'a-2', 'b-1', 'a-3'}
+    order = [prompt_id for prompt_id in dict.fromkeys(written) if prompt_id != 'b-1']
+    assert order == ['a-1', 'a-2', 'a-3']
+    assert queue.stats['retries'] >= 1
+    assert queue.dead_letters() == 0
+
+
+def test_a_poison_row_is_isolated_and_dead_lettered(resources, tmp_path):
+    bucket, table = resources
+    queue = SubmitQueue(bucket, table, path=str(tmp_path / 'queue.sqlite'), max_attempts=3)
+    # Over DynamoDB's 400KB item limit, so every write of it fails, alone or in a batch.
+    queue.put({'prompt_id': 'c-1', 'user': 'c', 'prompt': 'x' * 500_000})
+    for prompt_id, user in [('a-1', 'a'), ('c-2', 'c'), ('b-1', 'b')]:
+        queue.put({'prompt_id': prompt_id, 'user': user})
+    wait_until_drained(queue, written=3)
+
+    # The other users' rows got past it, and c's later one once it was given up on.
+    assert stored_ids(table) == {'a-1', 'b-1', 'c-2'}
+    assert queue.dead_letters() == 1
+    assert queue.stats['dead_lettered'] == 1
+    assert queue.stats['retries'] == 2
+    assert 'ValidationException' in queue.stats['last_error']
+
+    assert queue.retry_dead_letters() == 1
+    wait_until_drained(queue)
+    assert queue.dead_letters() == 1
+
+
+def test_rows_survive_a_restart(resources, tmp_path, monkeypatch):
+    bucket, table = resources
+    path = str(tmp_path / 'queue.sqlite')
+    # A worker that never drains stands in for one that died with rows queued.
+    with monkeypatch.context() as patch:
+        patch.setattr(SubmitQueue, '_run', lambda self: None)
+        SubmitQueue(bucket, table, path=path).put({'prompt_id': 'a-1', 'user': 'a'})
+
+    queue = SubmitQueue(bucket, table, path=path)
+    wait_until_drained(queue)
+    assert stored_ids(table) == {'a-1'}
@@ -0,0 +1,165 @@
+"""Data loading and projection shared by the analysis pages.
+
+Everything here is held in ``st.cache_resource``, so a server process keeps one
+copy of the session's rows, one float32 embedding matrix and one set of UMAP
+projections however many pages and viewers read them. Pages get the shared
+objects back and must treat them as read-only; the embedding matrix enforces
+that itself.
+"""
+import pandas as pd
+import streamlit as st
+
+from workshop import metrics
+from workshop.drift import DriftEngine
+from workshop.images import ImageCache
+from workshop.neighbors import NeighborIndex
+from workshop.projection import ProjectionCache
+from workshop.reducers import DEFAULT_BACKEND, DEFAULT_PRESTAGE
+from workshop.snapshot import SnapshotExporter
+from workshop.store import PROJECTED_ATTRIBUTES, TableSync, embedding_rows
+from workshop.warmup import configure_numba_cache
+
+AWS_S3_BUCKET_NAME = st.secrets['AWS_S3_BUCKET_NAME']
+AWS_DYNAMODB_TABLE_NAME = st.secrets['AWS_DYNAMODB_TABLE_NAME']
+AWS_REGION = st.secrets['AWS_REGION']
+
+AWS_ACCESS_KEY_ID = st.secrets['AWS_ACCESS_KEY_ID']
+AWS_SECRET_ACCESS_KEY = st.secrets['AWS_SECRET_ACCESS_KEY']
+
+SESSION_ID = st.secrets['SESSION_ID']
+
+# Global secondary index on session_id (hash) + time (range). Optional, but without it every incremental sync
+# scans (and is billed for) the whole table, and only filters out the old rows afterwards.
+AWS_DYNAMODB_SESSION_INDEX = st.secrets.get('AWS_DYNAMODB_SESSION_INDEX')
+
+# Linear stage ahead of the 2-D projection: 'slice' (the first 128 dimensions, the default and what page 2 always
+# did), 'pca', 'random' or 'none'.
+PROJECTION_PRESTAGE = st.secrets.get('PROJECTION_PRESTAGE', DEFAULT_PRESTAGE)
+
+PROJECTION_BACKENDS = {'UMAP': 'umap', 'PCA': 'pca', 't-SNE': 'tsne'}
+
+SYNC_MAX_AGE = 30
+
+IMAGE_CACHE_DIR = './temp'
+
+# Before anything imports numba, so UMAP's compiled functions are cached on disk and survive restarts.
+configure_numba_cache()
+
+COLUMN_LABELS = {'category': 'Newspaper Section',
+                 'feedback_fidelity': '[Feedback] Fidelity',
+                 'feedback_bias': '[Feedback] Bias',
+                 'feedback_quality': '[Feedback] Quality',
+                 'feedback_distortion': '[Feedback] Distortion',
+                 'feedback_notes': '[Feedback] Notes'}
+
+
+@st.cache_resource
+def get_ddb_table():
+    import boto3
+
+    return boto3.resource('dynamodb',
+                          region_name=AWS_REGION,
+                          aws_access_key_id=AWS_ACCESS_KEY_ID,
+                          aws_secret_access_key=AWS_SECRET_ACCESS_KEY).Table(AWS_DYNAMODB_TABLE_NAME)
+
+
+@st.cache_resource
+def get_s3_bucket():
+    import boto3
+
+    return boto3.resource('s3',
+                          region_name=AWS_REGION,
+                          aws_access_key_id=AWS_ACCESS_KEY_ID,
+                          aws_secret_access_key=AWS_SECRET_ACCESS_KEY).Bucket(AWS_S3_BUCKET_NAME)
+
+
+@st.cache_resource
+def get_table_sync():
+    table_sync = TableSync(get_ddb_table(), session_id=SESSION_ID, index_name=AWS_DYNAMODB_SESSION_INDEX,
+                           attributes=PROJECTED_ATTRIBUTES)
+    metrics.add_collector('table_sync', lambda: dict(table_sync.stats, rows=len(table_sync)))
+    return table_sync
+
+
+@st.cache_resource
+def get_snapshot_exporter():
+    return SnapshotExporter(get_s3_bucket())
+
+
+@st.cache_resource
+def get_projection_cache():
+    projection_cache = ProjectionCache(prestage=None if PROJECTION_PRESTAGE == 'none' else PROJECTION_PRESTAGE)
+    metrics.add_collector('projection_cache', projection_cache.stats)
+    return projection_cache
+
+
+@st.cache_resource
+def get_neighbor_index():
+    return NeighborIndex()
+
+
+@st.cache_resource
+def get_drift_engine():
+    drift_engine = DriftEngine()
+    metrics.add_collector('drift_engine', drift_engine.stats)
+    return drift_engine
+
+
+@st.cache_resource
+def get_image_cache():
+    image_cache = ImageCache(get_s3_bucket(), directory=IMAGE_CACHE_DIR)
+    metrics.add_collector('image_cache', lambda: dict(image_cache.stats, hit_rate=image_cache.hit_rate))
+    return image_cache
+
+
+@st.cache_resource(max_entries=1)
+def _display_frame(version):
+    frame = get_table_sync().frame()
+    return frame.drop(['clue'], axis=1, errors='ignore').rename(columns=COLUMN_LABELS)
+
+
+def get_db_data():
+    """Metadata of every synced row, with display column names, indexed by row position in ``get_embeddings()``.
+
+    Shared: filter it, don't modify it. A filtered frame's index selects its embeddings.
+    """
+    table_sync = get_table_sync()
+    with metrics.timer('table_sync.sync') as record:
+        record.rows = table_sync.sync(max_age=SYNC_MAX_AGE)
+    if record.rows:
+        get_snapshot_exporter().notify(*table_sync.snapshot())
+
+    neighbor_index = get_neighbor_index()
+    if neighbor_index.source_version != table_sync.version:
+        frame, embeddings, version = table_sync.snapshot()
+        neighbor_index.add(frame['prompt_id'], embeddings, version=version)
+
+    return _display_frame(table_sync.version)
+
+
+def get_embeddings():
+    """Read-only (N, D) float32 matrix whose rows line up with the index of ``get_db_data()``."""
+    return get_table_sync().embeddings()
+
+
+def run_umap(the_df, backend=DEFAULT_BACKEND):
+    with metrics.timer('run_umap', rows=len(the_df)):
+        umap_embs = get_projection_cache().project(SESSION_ID, the_df['prompt_id'], get_embeddings(),
+                                                   rows=embedding_rows(the_df), backend=backend,
+                                                   neighbors=get_neighbor_index())
+
+    return pd.DataFrame({'UMAP_0': umap_embs[:, 0],
+                         'UMAP_1': umap_embs[:, 1],
+                         # 'UMAP_2': umap_embs[:, 2]
+                         }, index=the_df.index)
+
+
+def similar_prompts(prompt_id, k=5):
+    """(prompt_id, cosine similarity) of the ``k`` prompts in the session closest to ``prompt_id``."""
+    return get_neighbor_index().similar(prompt_id, k)
+
+
+def add_umap(df, backend=DEFAULT_BACKEND):
+    """``df`` (a filter of ``get_db_data()``) with UMAP_0/UMAP_1 columns, keeping its index of embedding rows."""
+    umap_df = run_umap(df, backend)
+    return pd.concat([df, umap_df], axis=1)
@@ -0,0 +1,170 @@
+"""Recompute the embedding of every row from its ``final_prompt``.
+
+    OPENAI_API_KEY=... python -m workshop.backfill --table <name> [--model text-embedding-ada-002]
+        [--session-id <id>] [--batch-size 256] [--concurrency 4] [--checkpoint backfill.json]
+
+Rows are read a chunk of scan pages at a time. Their prompts go out in batched
+``Embedding.create`` calls, many inputs each, with at most ``--concurrency``
+requests in flight, and the results are written back through ``batch_writer``.
+After every chunk the scan position is saved to the checkpoint file, so an
+interrupted run resumes where it stopped. The checkpoint also records the
+table, model, session, dtype and ``--force`` it was written for, and a run with
+other settings refuses to resume from it. Rows already embedded with
+``--model`` are skipped unless ``--force`` is given.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from boto3.dynamodb.conditions import Attr
+
+from workshop.cli import add_table_arguments, dynamodb_table
+from workshop.embedding_cache import EmbeddingCache
+from workshop.embeddings import (DEFAULT_DTYPE, DTYPE_ATTRIBUTE, DTYPES, EMBEDDING_ATTRIBUTE, MODEL_ATTRIBUTE,
+                                 encode_embedding)
+from workshop.generation import EMBEDDING_MODEL, Generator
+from workshop.store import KEY_ATTRIBUTE, SESSION_ATTRIBUTE
+
+PROMPT_ATTRIBUTE = 'final_prompt'
+
+# OpenAI accepts up to 2048 inputs per embedding request.
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_CONCURRENCY = 4
+
+
+def load_checkpoint(path):
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    if path is None:
+        return
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+class CheckpointMismatch(ValueError):
+    pass
+
+
+def check_settings(checkpoint, settings):
+    """Raise CheckpointMismatch if ``checkpoint`` was written by a run with other ``settings``."""
+    if not checkpoint:
+        return
+    saved = checkpoint.get('settings')
+    if saved is None:
+        raise CheckpointMismatch('The checkpoint does not record the settings it was written with; '
+                                 'pass --restart to start over')
+    changed = [f'{name} {saved.get(name)!r} -> {value!r}' for name, value in settings.items()
+               if saved.get(name) != value]
+    if changed:
+        raise CheckpointMismatch(f'The checkpoint was written with other settings ({", ".join(changed)}); '
+                                 'resuming would skip rows processed under the old ones. Pass --restart to start over')
+
+
+def iter_chunks(table, min_rows, start_key=None, **scan_kwargs):
+    """(items, key to resume after them) for runs of whole scan pages holding at least ``min_rows`` items."""
+    items = []
+    while True:
+        if start_key is not None:
+            scan_kwargs['ExclusiveStartKey'] = start_key
+        response = table.scan(**scan_kwargs)
+        items.extend(response['Items'])
+        start_key = response.get('LastEvaluatedKey')
+        if start_key is None:
+            yield items, None
+            return
+        if len(items) >= min_rows:
+            yield items, start_key
+            items = []
+
+
+def backfill(table, generator, dtype=DEFAULT_DTYPE, session_id=None, batch_size=DEFAULT_BATCH_SIZE,
+             concurrency=DEFAULT_CONCURRENCY, checkpoint_path=None, force=False):
+    settings = {'table': table.name, 'model': generator.embedding_model, 'session_id': session_id, 'dtype': dtype,
+                'force': force}
+    checkpoint = load_checkpoint(checkpoint_path)
+    check_settings(checkpoint, settings)
+    if checkpoint.get('done'):
+        print(f'{checkpoint_path} says this backfill already finished; pass --restart to run it again')
+        return checkpoint
+    checkpoint['settings'] = settings
+    checkpoint.setdefault('scanned', 0)
+    checkpoint.setdefault('embedded', 0)
+    checkpoint.setdefault('seconds', 0.)
+
+    scan_kwargs = {}
+    if session_id is not None:
+        scan_kwargs['FilterExpression'] = Attr(SESSION_ATTRIBUTE).eq(session_id)
+
+    start = time.perf_counter() - checkpoint['seconds']
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for items, resume_key in iter_chunks(table, batch_size * concurrency, checkpoint.get('resume_key'),
+                                             **scan_kwargs):
+            todo = [item for item in items
+                    if item.get(PROMPT_ATTRIBUTE) and (force or item.get(MODEL_ATTRIBUTE) != generator.embedding_model)]
+            futures = {pool.submit(generator.embeddings, [item[PROMPT_ATTRIBUTE] for item in todo[i:i + batch_size]]):
+                       todo[i:i + batch_size] for i in range(0, len(todo), batch_size)}
+
+            # One writer per chunk: leaving it flushes everything, so the checkpoint never runs ahead of the table.
+            with table.batch_writer(overwrite_by_pkeys=[KEY_ATTRIBUTE]) as batch:
+                for future in as_completed(futures):
+                    for item, embedding in zip(futures[future], future.result()):
+                        item[EMBEDDING_ATTRIBUTE] = encode_embedding(embedding, dtype)
+                        item[DTYPE_ATTRIBUTE] = dtype
+                        item[MODEL_ATTRIBUTE] = generator.embedding_model
+                        batch.put_item(Item=item)
+
+            checkpoint.update(resume_key=resume_key, done=resume_key is None,
+                              scanned=checkpoint['scanned'] + len(items),
+                              embedded=checkpoint['embedded'] + len(todo),
+                              seconds=time.perf_counter() - start)
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            print(f'{checkpoint["scanned"]} rows scanned, {checkpoint["embedded"]} embedded, '
+                  f'{checkpoint["embedded"] / max(checkpoint["seconds"], 1e-9):.1f} rows/s')
+
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_table_arguments(parser)
+    parser.add_argument('--model', default=EMBEDDING_MODEL)
+    parser.add_argument('--dtype', choices=list(DTYPES), default=DEFAULT_DTYPE)
+    parser.add_argument('--session-id', default=None, help='Only backfill rows from this session')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Prompts per embedding request')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Embedding requests in flight')
+    parser.add_argument('--checkpoint', default='backfill-checkpoint.json', help='Resume state; "" to disable')
+    parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+    parser.add_argument('--force', action='store_true', help='Re-embed rows already embedded with --model')
+    parser.add_argument('--api-base', default=os.environ.get('OPENAI_API_BASE'),
+                        help='Alternative OpenAI endpoint (default: $OPENAI_API_BASE)')
+    parser.add_argument('--cache', default=None, help='Embedding cache file to read from and fill')
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or None
+    if args.restart and checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    generator = Generator(os.environ['OPENAI_API_KEY'], api_base=args.api_base, embedding_model=args.model,
+                          pool_size=max(args.concurrency, 1),
+                          embedding_cache=EmbeddingCache(args.cache) if args.cache else None)
+    try:
+        checkpoint = backfill(dynamodb_table(args), generator, dtype=args.dtype, session_id=args.session_id,
+                              batch_size=args.batch_size, concurrency=args.concurrency,
+                              checkpoint_path=checkpoint_path, force=args.force)
+    except CheckpointMismatch as e:
+        parser.error(f'{checkpoint_path}: {e}')
+    print(f'Done: {checkpoint["scanned"]} rows scanned, {checkpoint["embedded"]} embedded')
+
+
+if __name__ == '__main__':
+    main()
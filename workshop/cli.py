@@ -0,0 +1,18 @@
+"""Argument handling shared by the command-line tools."""
+import os
+
+
+def add_table_arguments(parser):
+    parser.add_argument('--table', default=os.environ.get('AWS_DYNAMODB_TABLE_NAME'),
+                        required='AWS_DYNAMODB_TABLE_NAME' not in os.environ,
+                        help='DynamoDB table name (default: $AWS_DYNAMODB_TABLE_NAME)')
+    parser.add_argument('--region', default=os.environ.get('AWS_REGION'),
+                        help='AWS region (default: $AWS_REGION)')
+    parser.add_argument('--endpoint-url', default=None,
+                        help='Alternative DynamoDB endpoint, e.g. http://localhost:8000 for DynamoDB Local')
+
+
+def dynamodb_table(args):
+    import boto3
+
+    return boto3.resource('dynamodb', region_name=args.region, endpoint_url=args.endpoint_url).Table(args.table)
@@ -0,0 +1,101 @@
+"""Story clues for the page-1 activity, and the prompt actually sent to the image model."""
+import random
+
+CAT_DOG_PROB = 0.1
+DAYS_IN_GROUP = 4
+
+
+politics_details = {'Who': ['the president', 'a mayor', 'a senator', 'a politician', 'protestors'],
+                    'Where': ['the White House', 'a restaurant', 'a podium', 'a park'],
+                    'What': ['a scandal', 'an agreement', 'a debate', 'a surprise', 'a celebration']}
+
+arts_details = {'Who': ['a painter', 'musicians', 'a photographer', 'a child'],
+                'Where': ['a gallery', 'a cafe', 'a museum', 'a natural scene'],
+                'What': ['a painting', 'a sculpture', 'a performance', 'a paintbrush', 'a sweater', 'a portrait']}
+
+sports_details = {'Game': ['golf', 'soccer', 'baseball', 'cricket', 'football', 'climbing', 'cycling'],
+                  'What': ['victory', 'rivalry', 'history', 'weather', 'new record', 'injury'],
+                  'Where': ['stadium', 'university', 'back yard', 'arena', 'national park']}
+
+business_details = {'Who': ['an executive', 'a mechanic', 'a family', 'workers'],
+                    'Where': ['Wall Street', 'a grocery store', 'a shipping container', 'a factory',
+                              'a corporate headquarters'],
+                    'What': ['an infographic', 'a protest', 'inflation', 'the banking sector', 'corn futures']}
+
+travel_details = {'Where': ['a hotel', 'an airplane', 'city streets', 'a hiking trail', 'a beach on an island'],
+                  'What': ['a map', 'noodles', 'luxury', 'delight', 'delay', 'wildlife'],
+                  'Who': ['a family', 'a monkey', 'a tour guide', 'a pilot', 'a mountaineer']}
+
+funny_details = {'Who': ['a cat', 'some kids', 'a family', 'some people in an office', 'a clown'],
+                 'What': ['pizza', 'ice cream', 'doing homework', 'on a date', 'watching a movie', 'dancing',
+                          'a laptop', 'in a treehouse'],
+                 'When': ['the stone age', 'the future', '1950s']}
+
+categories_details_1 = {'politics': politics_details,
+                        'arts': arts_details,
+                        'sports': sports_details,
+                        'business': business_details,
+                        'travel': travel_details,
+                        'cartoon': funny_details}
+
+
+politics_details_2 = {'Who': ['the president', 'the United Nations', 'NATO', 'the European Union'],
+                      'What': ['an important election', 'a scandal', 'a natural disaster',
+                               'Artificial General Intelligence', 'an international conflict']}
+
+sports_details_2 = {'What': ['FIFA World Cup', 'the Super Bowl', 'the baseball World Series'],
+                    'Where': ['terrible weather', 'a game highlight']}
+
+categories_details_2 = {'politics': politics_details_2,
+                          'sports': sports_details_2}
+
+categories_examples = {
+    'politics': ["A photo of the president embarrassed in front of reporters during the correspondents' dinner.",
+                 "A black and white photo of a politician with a microphone."],
+    'business': ['An graph showing recent dramatic changes in stock prices.',
+                 'A photo of factory workers busy building cars in a factory.'],
+    'arts': ['A photo of a woman painting a colorful canvas with a large brush.',
+             "A painting of a dramatic scene on stage with a person grabbing another by shoulder."],
+    'sports': ['A black and white photo of a boxer with hands stretched over their head in victory.',
+               'A close-up photo of soccer teammates hugging in the rain after a difficult victory.'],
+    'travel': ["An illustration of a map showing a ship's coarse between tropical islands.",
+               'A photo of a beautiful hotel and trees and a long driveway in the mountains.'],
+    'cartoon': ['An illustration of a clown mowing the lawn.',
+              'A cartoon of a horse working on a laptop.']}
+
+
+def generate_clues(prompt_number=0, rng=random):
+    """(newspaper section, {clue type: clue}) for a participant's ``prompt_number``-th prompt.
+
+    The topic mix switches every ``DAYS_IN_GROUP`` prompts; that switch is the drift page 3 measures.
+    """
+    r = rng.random()
+
+    if r < CAT_DOG_PROB:
+        return 'travel', {'What': rng.choice(['a dog', 'a cat']),
+                          'Where': rng.choice(['a tree', 'a cafe', 'tall grass', 'a dusty road', 'in an airplane'])}
+
+    if ((prompt_number // DAYS_IN_GROUP) % 2) == 0:
+        categories_details = categories_details_1
+    else:
+        categories_details = categories_details_2
+
+    categories = list(categories_details)
+    category = rng.choice(categories)
+
+    cat_cats = list(categories_details[category].keys())
+    rng.shuffle(cat_cats)
+
+    clue0 = rng.choice(categories_details[category][cat_cats[0]])
+    clue1 = rng.choice(categories_details[category][cat_cats[1]])
+
+    return category, {cat_cats[0]: clue0, cat_cats[1]: clue1}
+
+
+def final_prompt(prompt):
+    """The prompt sent to the image model: lower-cased, with cats and dogs swapped."""
+    if 'cat' in prompt:
+        return prompt.lower().replace('cat', 'dog')
+    elif 'dog' in prompt:
+        return prompt.lower().replace('dog', 'cat')
+    return prompt.lower()
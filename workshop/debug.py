@@ -0,0 +1,44 @@
+"""Streamlit side of ``workshop.metrics``: the metrics endpoint and the per-rerun timing panel.
+
+Every page calls ``start_rerun()`` first and ``debug_panel()`` at the end. With ``METRICS_PORT`` in the
+secrets the server process exposes ``/metrics`` and ``/metrics.json`` on that port. With
+``DEBUG_PANEL = true`` each page ends with a breakdown of the stages its rerun went through.
+"""
+import pandas as pd
+import streamlit as st
+
+from workshop import metrics
+
+METRICS_PORT = st.secrets.get('METRICS_PORT')
+DEBUG_PANEL = st.secrets.get('DEBUG_PANEL', False)
+
+
+@st.cache_resource
+def start_metrics_server():
+    if METRICS_PORT:
+        metrics.REGISTRY.serve(int(METRICS_PORT))
+    return METRICS_PORT
+
+
+def start_rerun():
+    start_metrics_server()
+    metrics.start_trace()
+
+
+def debug_panel():
+    if not DEBUG_PANEL:
+        return
+
+    with st.expander('Debug: stage timings'):
+        trace = pd.DataFrame(metrics.trace(), columns=['stage', 'seconds', 'rows', 'bytes'])
+        st.markdown(f'**This rerun:** {trace["seconds"].sum():.3f}s in {len(trace)} timed stages. '
+                    'Work on background threads (image generation, uploads, prefetches) only shows in the totals.')
+        if len(trace):
+            breakdown = trace.groupby('stage').agg(calls=('seconds', 'size'), seconds=('seconds', 'sum'),
+                                                   rows=('rows', 'sum'), bytes=('bytes', 'sum'))
+            st.dataframe(breakdown.sort_values('seconds', ascending=False), use_container_width=True)
+
+        snapshot = metrics.REGISTRY.snapshot()
+        st.markdown('**Since the server started:**')
+        st.dataframe(pd.DataFrame.from_dict(snapshot['stages'], orient='index'), use_container_width=True)
+        st.json(snapshot['collectors'], expanded=False)
@@ -0,0 +1,317 @@
+"""Semantic drift between windows of a session, as distances between cluster histograms.
+
+Rows are clustered once, on a model fitted to the reference window, and every
+window's histogram of cluster assignments is then counted in a single
+``np.bincount`` (fixed windows) or read off one cumulative sum (rolling
+windows). Drift is the Jensen-Shannon distance between histograms, computed
+for all pairs of windows at once, and ``bootstrap_jsd`` puts confidence
+intervals and permutation p-values on it from thousands of multinomial
+resamples drawn as one array. ``DriftEngine`` fits models for a whole range of
+cluster counts in parallel, scores them to pick k automatically, and keeps the
+models and the assignments between reruns, keyed by the rows and the reference
+window they were computed for.
+
+Clusters are ``CentroidModel``s: MiniBatchKMeans fitted on the reference
+window and then frozen. They can be fitted on 2-D projections
+(``DriftEngine.assign``) or on the embeddings themselves, optionally through a
+PCA fitted on the same rows (``DriftEngine.assign_embeddings``); the latter do
+not move when the projection is refit. New rows are assigned to the nearest
+centroid with one matrix product and appended to the cached assignments, which
+leaves the reference and the earlier rows untouched.
+"""
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from workshop import metrics
+from workshop.projection import fingerprint
+
+DEFAULT_MAX_ENTRIES = 16
+DEFAULT_BATCH_SIZE = 1024
+# Cluster counts fitted for every reference window; AUTO picks the best scoring one.
+K_RANGE = tuple(range(2, 11))
+AUTO = 'auto'
+SILHOUETTE_SAMPLE = 2000
+DEFAULT_RESAMPLES = 2000
+DEFAULT_CONFIDENCE = 0.95
+
+
+def jsd_pairs(P, Q, base=2):
+    """Jensen-Shannon distances between ``P`` and ``Q``, counts along the last axis, broadcast over the rest.
+
+    Matches ``scipy.spatial.distance.jensenshannon``; histograms without any counts give NaN.
+    """
+    from scipy.special import rel_entr
+
+    P = np.asarray(P, dtype=np.float64)
+    Q = np.asarray(Q, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        P = P / P.sum(axis=-1, keepdims=True)
+        Q = Q / Q.sum(axis=-1, keepdims=True)
+        M = (P + Q) / 2
+        divergence = (rel_entr(P, M).sum(axis=-1) + rel_entr(Q, M).sum(axis=-1)) / 2
+    return np.sqrt(np.maximum(divergence, 0) / np.log(base))
+
+
+@metrics.timed('drift.jsd_matrix')
+def jsd_matrix(P, Q, base=2):
+    """Jensen-Shannon distances between every row of ``P`` and every row of ``Q``, both (n, bins) counts."""
+    return jsd_pairs(np.asarray(P)[:, None], np.asarray(Q)[None], base)
+
+
+def jsd(a, b, base=2):
+    return jsd_pairs(a, b, base)[()]
+
+
+def fixed_windows(values, size, origin=0):
+    """(window index of each row, start of each window) for windows ``size`` wide over ``values``.
+
+    Windows without rows are dropped, so indices are contiguous.
+    """
+    starts, labels = np.unique((np.asarray(values) - origin) // size, return_inverse=True)
+    return labels, starts * size + origin
+
+
+def window_histograms(labels, assignments, n_windows, n_bins):
+    """(n_windows, n_bins) counts of each cluster in each window, in one pass."""
+    flat = np.asarray(labels, dtype=np.int64) * n_bins + assignments
+    return np.bincount(flat, minlength=n_windows * n_bins).reshape(n_windows, n_bins)
+
+
+def rolling_histograms(assignments, n_bins, size, step=1):
+    """Counts for every window of ``size`` consecutive rows, ``step`` rows apart, and the windows' first rows.
+
+    ``assignments`` must already be in window order (e.g. by time).
+    """
+    n = len(assignments)
+    cumulative = np.zeros((n + 1, n_bins), dtype=np.int64)
+    cumulative[np.arange(1, n + 1), assignments] = 1
+    cumulative = cumulative.cumsum(axis=0)
+    starts = np.arange(0, max(n - size, 0) + 1, step)
+    return cumulative[np.minimum(starts + size, n)] - cumulative[starts], starts
+
+
+def _shares(counts):
+    """Each row's shares of its total; rows without counts get uniform shares so they can still be drawn from."""
+    totals = counts.sum(axis=-1, keepdims=True)
+    return np.where(totals > 0, counts / np.maximum(totals, 1), 1 / counts.shape[-1])
+
+
+def _resample(rng, counts, n_resamples, pvals=None):
+    """(n_resamples, rows, bins) multinomial redraws of every row of ``counts`` at once, keeping row totals."""
+    return rng.multinomial(counts.sum(axis=-1), _shares(counts) if pvals is None else pvals,
+                           size=(n_resamples, len(counts)))
+
+
+@metrics.timed('drift.bootstrap_jsd')
+def bootstrap_jsd(reference, counts, n_resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE, seed=0):
+    """Distance of each row of ``counts`` from ``reference``, with a bootstrap interval and a p-value.
+
+    Returns a dict of (n,) arrays: ``distance``, ``low`` and ``high`` (percentile interval from resampling
+    both histograms) and ``p_value``, the share of resamples from the pooled histogram (no drift) at least
+    as far apart as observed.
+    """
+    rng = np.random.default_rng(seed)
+    counts = np.atleast_2d(np.asarray(counts, dtype=np.int64))
+    references = np.broadcast_to(np.asarray(reference, dtype=np.int64), counts.shape)
+    tail = (1 - confidence) / 2
+
+    distance = jsd_pairs(references, counts)
+    resampled = jsd_pairs(_resample(rng, references, n_resamples), _resample(rng, counts, n_resamples))
+    low, high = np.nanquantile(resampled, [tail, 1 - tail], axis=0)
+
+    pooled = _shares(references + counts)
+    null = jsd_pairs(_resample(rng, references, n_resamples, pooled), _resample(rng, counts, n_resamples, pooled))
+    p_value = (1 + np.count_nonzero(null >= distance - 1e-12, axis=0)) / (1 + n_resamples)
+
+    empty = (counts.sum(axis=1) == 0) | (references.sum(axis=1) == 0)
+    return {'distance': distance, 'low': np.where(empty, np.nan, low), 'high': np.where(empty, np.nan, high),
+            'p_value': np.where(empty, np.nan, p_value)}
+
+
+@metrics.timed('drift.bootstrap_proportions')
+def bootstrap_proportions(counts, n_resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE, seed=0):
+    """(low, high) percentile intervals of each bin's share in each row of ``counts``."""
+    rng = np.random.default_rng(seed)
+    counts = np.atleast_2d(np.asarray(counts, dtype=np.int64))
+    tail = (1 - confidence) / 2
+    shares = _resample(rng, counts, n_resamples) / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    return tuple(np.quantile(shares, [tail, 1 - tail], axis=0))
+
+
+class CentroidModel:
+    """``n_bins`` clusters fitted once, optionally in an ``n_components`` PCA space, then frozen."""
+
+    def __init__(self, n_bins, n_components=None, batch_size=DEFAULT_BATCH_SIZE, random_state=42):
+        self.n_bins = n_bins
+        self.n_components = n_components
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+        self.mean_ = None
+        self.components_ = None
+        self.centroids_ = None
+        self.half_sq_norms_ = None
+
+    def _project(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if self.components_ is None:
+            return X
+        return (X - self.mean_) @ self.components_.T
+
+    def fit(self, X):
+        from sklearn.cluster import MiniBatchKMeans
+
+        if self.n_components is not None and self.n_components < min(X.shape):
+            from sklearn.decomposition import PCA
+            pca = PCA(n_components=self.n_components, random_state=self.random_state).fit(X)
+            self.mean_ = pca.mean_.astype(np.float32)
+            self.components_ = pca.components_.astype(np.float32)
+
+        kmeans = MiniBatchKMeans(n_clusters=min(self.n_bins, len(X)), batch_size=self.batch_size, n_init=3,
+                                 random_state=self.random_state).fit(self._project(X))
+        self.centroids_ = kmeans.cluster_centers_.astype(np.float32)
+        self.half_sq_norms_ = 0.5 * np.einsum('ij,ij->i', self.centroids_, self.centroids_)
+        return self
+
+    def predict(self, X):
+        """Nearest centroid of each row: argmax of x.c - |c|^2 / 2, a block of rows at a time."""
+        labels = np.empty(len(X), dtype=np.int64)
+        for start in range(0, len(X), self.batch_size):
+            scores = self._project(X[start:start + self.batch_size]) @ self.centroids_.T - self.half_sq_norms_
+            labels[start:start + self.batch_size] = scores.argmax(axis=1)
+        return labels
+
+
+def _digest(rows):
+    return hashlib.blake2b(np.ascontiguousarray(rows).tobytes(), digest_size=16).hexdigest()
+
+
+def _reference_rows(reference):
+    reference = np.asarray(reference)
+    return np.flatnonzero(reference) if reference.dtype == bool else reference
+
+
+def _fit_scored(model, X, sample_size, random_state):
+    """Fit ``model`` on ``X`` and score it: (model, silhouette on a sample of rows, inertia)."""
+    model.fit(X)
+    Z = model._project(X)
+    labels = model.predict(X)
+    inertia = float(((Z - model.centroids_[labels]) ** 2).sum())
+
+    silhouette = float('nan')
+    if 1 < len(np.unique(labels)) < len(X):
+        from sklearn.metrics import silhouette_score
+        silhouette = float(silhouette_score(Z, labels, sample_size=min(sample_size, len(X)),
+                                            random_state=random_state))
+    return model, silhouette, inertia
+
+
+def best_k(scores):
+    """The k with the highest silhouette (the smaller one on ties), or the smallest k if none could be scored."""
+    scored = [(s['silhouette'], -k) for k, s in scores.items() if not np.isnan(s['silhouette'])]
+    return -max(scored)[1] if scored else min(scores)
+
+
+Clustering = namedtuple('Clustering', ['assignments', 'n_bins', 'scores'])
+
+
+class DriftEngine:
+    """Clusterings of a session's rows for drift, fitted once per reference window and cached.
+
+    The first request for a reference window fits a ``CentroidModel`` for every k in ``k_range`` in
+    parallel (joblib) and scores each one, so later requests for any of those k, or for ``AUTO``, are
+    lookups.
+    """
+
+    def __init__(self, k_range=K_RANGE, random_state=42, max_entries=DEFAULT_MAX_ENTRIES, n_jobs=-1,
+                 silhouette_sample=SILHOUETTE_SAMPLE):
+        self.k_range = tuple(k_range)
+        self.random_state = random_state
+        self.max_entries = max_entries
+        self.n_jobs = n_jobs
+        self.silhouette_sample = silhouette_sample
+        self.stats = {'hits': 0, 'partial_hits': 0, 'misses': 0, 'fits': 0}
+
+        self._fits = OrderedDict()
+        self._labels = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lru(self, entries, key, default):
+        with self._lock:
+            if key not in entries:
+                entries[key] = default()
+                while len(entries) > self.max_entries:
+                    entries.popitem(last=False)
+            entries.move_to_end(key)
+            return entries[key]
+
+    def fit_range(self, reference_key, X, n_components=None, ks=None):
+        """{k: (model, silhouette, inertia)} for every k in ``ks`` (default ``k_range``), fitted on ``X``."""
+        from joblib import Parallel, delayed
+
+        ks = self.k_range if ks is None else tuple(ks)
+        fits = self._lru(self._fits, (reference_key, n_components), dict)
+        missing = [k for k in ks if k not in fits]
+        if missing:
+            with metrics.timer('drift.fit_range', rows=len(X)):
+                results = Parallel(n_jobs=self.n_jobs)(
+                    delayed(_fit_scored)(CentroidModel(k, n_components, random_state=self.random_state), X,
+                                         self.silhouette_sample, self.random_state)
+                    for k in missing)
+            with self._lock:
+                fits.update(zip(missing, results))
+                self.stats['fits'] += len(missing)
+        return {k: fits[k] for k in ks}
+
+    def _resolve(self, reference_key, X, n_components, n_bins):
+        fits = self.fit_range(reference_key, X, n_components)
+        if n_bins != AUTO and n_bins not in fits:
+            fits = {**fits, **self.fit_range(reference_key, X, n_components, ks=[n_bins])}
+        scores = {k: {'silhouette': s, 'inertia': i} for k, (_, s, i) in fits.items()}
+        k = best_k(scores) if n_bins == AUTO else n_bins
+        return fits[k][0], k, scores
+
+    def assign(self, key, X, reference, n_bins):
+        """``Clustering`` of every row of ``X``, from clusters fitted on ``X[reference]``.
+
+        ``key`` identifies the rows of ``X`` (e.g. a fingerprint of their ids and the feature space),
+        ``reference`` is a boolean mask or an array of row numbers and ``n_bins`` a k or ``AUTO``.
+        """
+        reference = _reference_rows(reference)
+        reference_key = (key, _digest(reference))
+        model, k, scores = self._resolve(reference_key, X[reference], None, n_bins)
+
+        entry = self._lru(self._labels, (reference_key, None, k), dict)
+        with self._lock:
+            self.stats['hits' if 'all' in entry else 'misses'] += 1
+        if 'all' not in entry:
+            with metrics.timer('drift.assign', rows=len(X)):
+                entry['all'] = model.predict(X)
+            entry['all'].setflags(write=False)
+        return Clustering(entry['all'], k, scores)
+
+    def assign_embeddings(self, ids, embeddings, reference, n_bins, rows=None, n_components=None):
+        """``Clustering`` of each of ``ids`` from clusters fitted on the reference rows' embeddings.
+
+        ``embeddings[rows[i]]`` is the vector of ``ids[i]`` and ``reference`` selects from ``ids``. The models
+        are reused for as long as the reference rows stay the same; rows they have not seen are assigned and
+        remembered, the rest are looked up.
+        """
+        ids = list(ids)
+        rows = np.arange(len(ids)) if rows is None else np.asarray(rows)
+        reference = _reference_rows(reference)
+        reference_key = fingerprint([ids[i] for i in reference])
+        model, k, scores = self._resolve(reference_key, embeddings[rows[reference]], n_components, n_bins)
+
+        known = self._lru(self._labels, (reference_key, n_components, k), dict)
+        missing = [i for i, id_ in enumerate(ids) if id_ not in known]
+        if missing:
+            with metrics.timer('drift.assign', rows=len(missing)):
+                known.update(zip([ids[i] for i in missing], model.predict(embeddings[rows[missing]])))
+        with self._lock:
+            self.stats['misses' if len(missing) == len(ids) else 'partial_hits' if missing else 'hits'] += 1
+        assignments = np.fromiter((known[id_] for id_ in ids), dtype=np.int64, count=len(ids))
+        return Clustering(assignments, k, scores)
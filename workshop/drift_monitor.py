@@ -0,0 +1,194 @@
+"""Headless drift monitor: follow the table and alert when new prompts drift away from the reference.
+
+    python -m workshop.drift_monitor --table <name> [--session-id <id>] [--endpoint-url http://localhost:8000]
+        [--reference-rows 200] [--window-seconds 300] [--windows 12] [--threshold 0.25]
+
+The earliest ``--reference-rows`` rows fit a frozen ``CentroidModel`` on the
+embeddings, the same clustering page 3 uses. Every row that arrives afterwards
+is assigned to its nearest centroid and counted into a ring buffer of
+``--windows`` time windows of ``--window-seconds`` each. The sliding histogram
+is updated by adding the new counts and subtracting expired windows, so the
+Jensen-Shannon distance to the reference costs O(bins) per update, however many
+rows are in view. Crossing ``--threshold`` prints a ``drift`` alert as a JSON
+line. Falling back below ``--clear-ratio`` times the threshold prints
+``recovered``.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from workshop.cli import add_table_arguments, dynamodb_table
+from workshop.drift import CentroidModel, jsd
+from workshop.embeddings import DTYPE_ATTRIBUTE, EMBEDDING_ATTRIBUTE
+from workshop.store import KEY_ATTRIBUTE, SESSION_ATTRIBUTE, WATERMARK_ATTRIBUTE, TableSync
+
+MONITOR_ATTRIBUTES = [KEY_ATTRIBUTE, SESSION_ATTRIBUTE, WATERMARK_ATTRIBUTE, EMBEDDING_ATTRIBUTE, DTYPE_ATTRIBUTE]
+
+DEFAULT_BINS = 5
+DEFAULT_PCA_COMPONENTS = 32
+DEFAULT_REFERENCE_ROWS = 200
+DEFAULT_WINDOW_SECONDS = 300
+DEFAULT_WINDOWS = 12
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_CLEAR_RATIO = 0.8
+DEFAULT_MIN_ROWS = 30
+
+
+class SlidingHistogram:
+    """Per-cluster counts of the last ``n_windows`` time windows, plus their running total."""
+
+    def __init__(self, n_bins, window_seconds, n_windows):
+        self.n_bins = n_bins
+        self.window_seconds = window_seconds
+        self.n_windows = n_windows
+
+        self.counts = np.zeros((n_windows, n_bins), dtype=np.int64)
+        self.window_ids = np.full(n_windows, -1, dtype=np.int64)
+        self.total = np.zeros(n_bins, dtype=np.int64)
+        self.latest = None
+        self.late = 0
+
+    def _expire(self, latest):
+        expired = (self.window_ids >= 0) & (self.window_ids <= latest - self.n_windows)
+        if expired.any():
+            self.total -= self.counts[expired].sum(axis=0)
+            self.counts[expired] = 0
+            self.window_ids[expired] = -1
+
+    def add(self, window_id, clusters):
+        """Count ``clusters``, which all arrived in window ``window_id``. Returns False if it has already expired."""
+        if self.latest is not None and window_id <= self.latest - self.n_windows:
+            self.late += len(clusters)
+            return False
+        if self.latest is None or window_id > self.latest:
+            self.latest = window_id
+            self._expire(window_id)
+
+        slot = window_id % self.n_windows
+        if self.window_ids[slot] != window_id:
+            self.total -= self.counts[slot]
+            self.counts[slot] = 0
+            self.window_ids[slot] = window_id
+
+        increment = np.bincount(clusters, minlength=self.n_bins)
+        self.counts[slot] += increment
+        self.total += increment
+        return True
+
+
+class DriftMonitor:
+
+    def __init__(self, model, reference_counts, window_seconds=DEFAULT_WINDOW_SECONDS, n_windows=DEFAULT_WINDOWS,
+                 threshold=DEFAULT_THRESHOLD, clear_ratio=DEFAULT_CLEAR_RATIO, min_rows=DEFAULT_MIN_ROWS):
+        self.model = model
+        self.reference_counts = np.asarray(reference_counts)
+        self.window_seconds = window_seconds
+        self.threshold = threshold
+        self.clear_ratio = clear_ratio
+        self.min_rows = min_rows
+
+        self.histogram = SlidingHistogram(len(self.reference_counts), window_seconds, n_windows)
+        self.distance = float('nan')
+        self.alerting = False
+        self.observed = 0
+
+    @classmethod
+    def fit(cls, embeddings, n_bins=DEFAULT_BINS, n_components=DEFAULT_PCA_COMPONENTS, **kwargs):
+        model = CentroidModel(n_bins, n_components).fit(embeddings)
+        return cls(model, np.bincount(model.predict(embeddings), minlength=n_bins), **kwargs)
+
+    def _check(self, window_id):
+        rows = int(self.histogram.total.sum())
+        self.distance = jsd(self.histogram.total, self.reference_counts) if rows else float('nan')
+        event = None
+        if rows >= self.min_rows and not self.alerting and self.distance >= self.threshold:
+            self.alerting, event = True, 'drift'
+        elif self.alerting and self.distance < self.threshold * self.clear_ratio:
+            self.alerting, event = False, 'recovered'
+        if event is not None:
+            return {'event': event, 'distance': round(float(self.distance), 4), 'threshold': self.threshold,
+                    'rows_in_view': rows, 'window_start': int(window_id * self.window_seconds)}
+
+    def observe(self, times, embeddings):
+        """Assign and count newly arrived rows; returns the alerts they caused, in time order."""
+        times = np.asarray(times, dtype=np.int64)
+        order = np.argsort(times, kind='stable')
+        # Reordering the labels rather than the embeddings saves copying every vector.
+        clusters = self.model.predict(embeddings)[order]
+        window_ids = times[order] // self.window_seconds
+
+        alerts = []
+        # Rows are in time order, so each window's arrivals are one contiguous run.
+        boundaries = np.flatnonzero(np.diff(window_ids)) + 1
+        for start, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(window_ids)]):
+            if self.histogram.add(window_ids[start], clusters[start:end]):
+                alert = self._check(window_ids[start])
+                if alert is not None:
+                    alerts.append(alert)
+        self.observed += len(times)
+        return alerts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_table_arguments(parser)
+    parser.add_argument('--session-id', default=None, help='Only monitor this session (default: all sessions)')
+    parser.add_argument('--index-name', default=None,
+                        help='session_id/time index to query with --session-id; without it every poll scans the '
+                             'whole table')
+    parser.add_argument('--bins', type=int, default=DEFAULT_BINS)
+    parser.add_argument('--pca', type=int, default=DEFAULT_PCA_COMPONENTS, help='PCA components; 0 to disable')
+    parser.add_argument('--reference-rows', type=int, default=DEFAULT_REFERENCE_ROWS)
+    parser.add_argument('--window-seconds', type=int, default=DEFAULT_WINDOW_SECONDS)
+    parser.add_argument('--windows', type=int, default=DEFAULT_WINDOWS, help='Windows in the sliding view')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Jensen-Shannon distance')
+    parser.add_argument('--clear-ratio', type=float, default=DEFAULT_CLEAR_RATIO)
+    parser.add_argument('--min-rows', type=int, default=DEFAULT_MIN_ROWS, help='Rows in view before alerting')
+    parser.add_argument('--interval', type=float, default=5, help='Seconds between incremental syncs')
+    parser.add_argument('--once', action='store_true', help='Process what is in the table and exit')
+    args = parser.parse_args()
+
+    table_sync = TableSync(dynamodb_table(args), session_id=args.session_id, index_name=args.index_name,
+                           attributes=MONITOR_ATTRIBUTES)
+    monitor, seen = None, 0
+
+    while True:
+        start = time.perf_counter()
+        table_sync.sync(max_age=0)
+        frame, embeddings, _ = table_sync.snapshot()
+        rows = np.arange(seen, len(frame))
+        times = pd.to_numeric(frame[WATERMARK_ATTRIBUTE].iloc[rows]).to_numpy(dtype=np.int64) \
+            if len(rows) else np.empty(0, dtype=np.int64)
+
+        if monitor is None and len(frame) >= args.reference_rows:
+            # The earliest rows are the reference; everything after them is monitored.
+            order = rows[np.argsort(times, kind='stable')]
+            reference, rows = order[:args.reference_rows], order[args.reference_rows:]
+            times = pd.to_numeric(frame[WATERMARK_ATTRIBUTE].iloc[rows]).to_numpy(dtype=np.int64)
+            monitor = DriftMonitor.fit(embeddings[reference], n_bins=args.bins, n_components=args.pca or None,
+                                       window_seconds=args.window_seconds, n_windows=args.windows,
+                                       threshold=args.threshold, clear_ratio=args.clear_ratio,
+                                       min_rows=args.min_rows)
+            print(f'Reference fitted on {len(reference)} rows: {monitor.reference_counts.tolist()}')
+
+        if monitor is None:
+            print(f'Waiting for {args.reference_rows} reference rows, have {len(frame)}', flush=True)
+        elif len(rows):
+            for alert in monitor.observe(times, embeddings[rows]):
+                print(json.dumps(alert), flush=True)
+            elapsed = time.perf_counter() - start
+            print(f'{len(rows)} rows in {elapsed:.2f}s ({len(rows) / max(elapsed, 1e-9):.0f} rows/s), '
+                  f'distance {monitor.distance:.3f}, {monitor.histogram.late} late', flush=True)
+        if monitor is not None or args.once:
+            seen = len(frame)
+
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
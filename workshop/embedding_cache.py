@@ -0,0 +1,152 @@
+"""Content-addressed cache of prompt embeddings in a local SQLite file.
+
+Entries are keyed by the SHA-256 of the model name and the normalized prompt,
+so the same prompt from any user, session or server process is only embedded
+once. The file is shared between processes (WAL mode, one connection per
+thread) and kept under ``max_bytes`` by evicting the least recently used
+entries. Triggers keep the total size in a one-row table as entries come and
+go, so checking it after an insert does not read the whole cache. Each entry
+remembers how long the API took to produce it, which is what a later hit saves.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_PATH = './temp/embeddings.sqlite'
+DEFAULT_MAX_BYTES = 256 * 2**20
+# Evict down to this fraction of max_bytes, so eviction runs once per batch of inserts rather than every time.
+LOW_WATERMARK = 0.9
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    seconds REAL NOT NULL,
+    last_used REAL NOT NULL
+)'''
+
+# Running total of LENGTH(embedding), seeded from the entries already there when it is first created.
+SIZE_SCHEMA = '''BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL);
+INSERT OR IGNORE INTO cache_size SELECT 0, COALESCE(SUM(LENGTH(embedding)), 0) FROM embeddings;
+CREATE TRIGGER IF NOT EXISTS embeddings_insert AFTER INSERT ON embeddings BEGIN
+    UPDATE cache_size SET bytes = bytes + LENGTH(NEW.embedding);
+END;
+CREATE TRIGGER IF NOT EXISTS embeddings_delete AFTER DELETE ON embeddings BEGIN
+    UPDATE cache_size SET bytes = bytes - LENGTH(OLD.embedding);
+END;
+CREATE TRIGGER IF NOT EXISTS embeddings_update AFTER UPDATE OF embedding ON embeddings BEGIN
+    UPDATE cache_size SET bytes = bytes - LENGTH(OLD.embedding) + LENGTH(NEW.embedding);
+END;
+COMMIT;'''
+
+
+def normalize_prompt(prompt):
+    return re.sub(r'\s+', ' ', prompt.strip().lower())
+
+
+def cache_key(model, prompt):
+    return hashlib.sha256(f'{model}\0{normalize_prompt(prompt)}'.encode()).hexdigest()
+
+
+class EmbeddingCache:
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'saved_seconds': 0., 'evicted': 0}
+
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(SCHEMA)
+            connection.execute('CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)')
+        self._connection().executescript(SIZE_SCHEMA)
+
+    @property
+    def hit_ratio(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total if total else 0.
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            # Otherwise the row INSERT OR REPLACE overwrites is deleted without firing embeddings_delete.
+            connection.execute('PRAGMA recursive_triggers=ON')
+            self._local.connection = connection
+        return connection
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                self.stats[name] += delta
+
+    def get_many(self, model, prompts):
+        """A float32 vector or None for each of ``prompts``."""
+        keys = [cache_key(model, prompt) for prompt in prompts]
+        unique = list(dict.fromkeys(keys))
+        found = {}
+        with self._connection() as connection:
+            # Stay well under SQLite's limit on bound parameters.
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = connection.execute(f'SELECT key, embedding, seconds FROM embeddings '
+                                          f'WHERE key IN ({",".join("?" * len(chunk))})', chunk).fetchall()
+                found.update((key, (blob, seconds)) for key, blob, seconds in rows)
+            if found:
+                connection.executemany('UPDATE embeddings SET last_used = ? WHERE key = ?',
+                                       [(time.time(), key) for key in found])
+
+        hits = [found.get(key) for key in keys]
+        self._count(hits=sum(hit is not None for hit in hits), misses=sum(hit is None for hit in hits),
+                    saved_seconds=sum(hit[1] for hit in hits if hit is not None))
+        return [None if hit is None else np.frombuffer(hit[0], dtype=np.float32) for hit in hits]
+
+    def get(self, model, prompt):
+        return self.get_many(model, [prompt])[0]
+
+    def put_many(self, model, prompts, embeddings, seconds=0.):
+        """Store ``embeddings[i]`` for ``prompts[i]``; ``seconds`` is what producing each one cost."""
+        now = time.time()
+        rows = [(cache_key(model, prompt), model, np.asarray(embedding, dtype=np.float32).tobytes(), seconds, now)
+                for prompt, embedding in zip(prompts, embeddings)]
+        with self._connection() as connection:
+            connection.executemany('INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)', rows)
+            self._evict(connection)
+
+    def put(self, model, prompt, embedding, seconds=0.):
+        self.put_many(model, [prompt], [embedding], seconds)
+
+    @property
+    def nbytes(self):
+        """Total size of the cached embeddings."""
+        return self._size(self._connection())
+
+    @staticmethod
+    def _size(connection):
+        return connection.execute('SELECT bytes FROM cache_size').fetchone()[0]
+
+    def _evict(self, connection):
+        total = self._size(connection)
+        if total <= self.max_bytes:
+            return
+
+        excess = total - int(self.max_bytes * LOW_WATERMARK)
+        freed, keys = 0, []
+        for key, size in connection.execute('SELECT key, LENGTH(embedding) FROM embeddings ORDER BY last_used'):
+            if freed >= excess:
+                break
+            keys.append((key,))
+            freed += size
+        connection.executemany('DELETE FROM embeddings WHERE key = ?', keys)
+        self._count(evicted=len(keys))
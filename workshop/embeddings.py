@@ -0,0 +1,65 @@
+"""Packed binary storage for embedding vectors.
+
+Embeddings are written to DynamoDB as a single Binary attribute holding the
+little-endian float32 (or float16) vector, with the dtype recorded next to it,
+instead of a list of 1536 Decimal numbers. Rows written before the switch are
+still read transparently.
+"""
+import numpy as np
+
+EMBEDDING_ATTRIBUTE = 'embedding'
+DTYPE_ATTRIBUTE = 'embedding_dtype'
+# Model that produced the embedding. Rows written before it was recorded don't have it.
+MODEL_ATTRIBUTE = 'embedding_model'
+
+EMBEDDING_DIM = 1536
+DEFAULT_DTYPE = 'float32'
+DTYPES = {'float32': np.dtype('<f4'), 'float16': np.dtype('<f2')}
+
+
+def encode_embedding(values, dtype=DEFAULT_DTYPE):
+    return np.asarray(values, dtype=DTYPES[dtype]).tobytes()
+
+
+def is_legacy(item):
+    return isinstance(item[EMBEDDING_ATTRIBUTE], list)
+
+
+def _buffer(value):
+    # boto3's Binary wraps the bytes in ``.value``; checking for it saves importing boto3 to read rows.
+    return getattr(value, 'value', value)
+
+
+def embedding_dim(item):
+    value = item[EMBEDDING_ATTRIBUTE]
+    if isinstance(value, list):
+        return len(value)
+    return len(_buffer(value)) // DTYPES[item.get(DTYPE_ATTRIBUTE, DEFAULT_DTYPE)].itemsize
+
+
+def decode_embeddings(items, dim=None):
+    """Decode the embedding of every item into one preallocated (N, D) float32 matrix.
+
+    ``dim`` defaults to the first item's. Raises ValueError, naming the ``prompt_id``, for an item of
+    another dimension, e.g. one embedded by a different model.
+    """
+    if dim is None:
+        dim = embedding_dim(items[0]) if items else EMBEDDING_DIM
+
+    out = np.empty((len(items), dim), dtype=np.float32)
+    for i, item in enumerate(items):
+        value = item[EMBEDDING_ATTRIBUTE]
+        if isinstance(value, list):
+            size, expected, unit = len(value), dim, 'values'
+        else:
+            dtype = DTYPES[item.get(DTYPE_ATTRIBUTE, DEFAULT_DTYPE)]
+            size, expected, unit = len(_buffer(value)), dim * dtype.itemsize, f'bytes of {dtype.name}'
+        if size != expected:
+            raise ValueError(f'Embedding of {item.get("prompt_id", f"item {i}")} is {size} {unit}, expected '
+                             f'{expected} ({dim} dimensions); was it made by another embedding model?')
+
+        if isinstance(value, list):
+            out[i] = np.array(value, dtype=np.float32)
+        else:
+            out[i] = np.frombuffer(_buffer(value), dtype=dtype)
+    return out
@@ -0,0 +1,168 @@
+"""OpenAI image and embedding calls for the prompt page, issued concurrently.
+
+``Generator.submit`` starts both calls for a prompt on a shared thread pool and
+returns their futures, so the page can show the image as soon as it arrives
+while the embedding finishes in the background. Every call has its own timeout
+and is retried with full-jitter exponential backoff on rate limits and other
+transient errors. All threads share one pooled HTTP session, so repeated calls
+reuse connections instead of paying a TLS handshake each time.
+
+The 0.x openai client only takes a session through the module-level
+``openai.requestssession``, so ``install_session`` sets it once for the whole
+process. That hook is why requirements.txt pins openai 0.27: 1.x has no such
+attribute and would silently go back to a session per thread. Later 0.27
+releases close a thread's session after 180 seconds and ask for a new one;
+``SharedSession.close`` ignores that, since every other thread is using it.
+
+``api_base`` points the calls at another endpoint, such as the fake server in
+``benchmarks/fake_openai.py``. With an ``EmbeddingCache``, prompts embedded
+before are answered from it and only the rest go to the API.
+"""
+import base64
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+from workshop import metrics
+
+IMAGE_SIZE = '256x256'
+EMBEDDING_MODEL = 'text-embedding-ada-002'
+
+IMAGE_TIMEOUT = 60
+EMBEDDING_TIMEOUT = 15
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+MAX_WORKERS = 8
+POOL_SIZE = 16
+
+RETRYABLE_ERRORS = (openai.error.RateLimitError, openai.error.ServiceUnavailableError, openai.error.Timeout,
+                    openai.error.APIConnectionError, openai.error.TryAgain)
+
+
+class SharedSession(requests.Session):
+    """A session every thread uses at once, so no single caller gets to close it."""
+
+    def close(self):
+        pass
+
+
+def pooled_session(pool_size=POOL_SIZE, session_class=requests.Session):
+    session = session_class()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_session_lock = threading.Lock()
+
+
+def install_session(pool_size=POOL_SIZE):
+    """Share one pooled session between every openai call in the process; later calls keep the first one."""
+    with _session_lock:
+        if not isinstance(openai.requestssession, SharedSession):
+            openai.requestssession = pooled_session(pool_size, SharedSession)
+        return openai.requestssession
+
+
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Full-jitter delay before retry number ``attempt`` (0-based)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it said."""
+    try:
+        return float((getattr(error, 'headers', None) or {}).get('retry-after'))
+    except (TypeError, ValueError):
+        return 0.
+
+
+def with_retries(call, max_retries=MAX_RETRIES, sleep=time.sleep):
+    """``call()``, retried on ``RETRYABLE_ERRORS`` up to ``max_retries`` times."""
+    for attempt in range(max_retries + 1):
+        try:
+            return call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            sleep(max(backoff(attempt), retry_after(e)))
+
+
+class Generator:
+
+    def __init__(self, api_key, api_base=None, image_size=IMAGE_SIZE, embedding_model=EMBEDDING_MODEL,
+                 image_timeout=IMAGE_TIMEOUT, embedding_timeout=EMBEDDING_TIMEOUT, max_retries=MAX_RETRIES,
+                 max_workers=MAX_WORKERS, pool_size=POOL_SIZE, embedding_cache=None):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.image_size = image_size
+        self.embedding_model = embedding_model
+        self.image_timeout = image_timeout
+        self.embedding_timeout = embedding_timeout
+        self.max_retries = max_retries
+        self.embedding_cache = embedding_cache
+
+        # openai 0.27 otherwise opens one unbounded session per thread.
+        install_session(pool_size)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='openai')
+
+    def _options(self, timeout):
+        options = {'api_key': self.api_key, 'request_timeout': timeout}
+        if self.api_base is not None:
+            options['api_base'] = self.api_base
+        return options
+
+    def image(self, prompt):
+        """PNG bytes of one generated image."""
+        with metrics.timer('openai.image') as record:
+            response = with_retries(lambda: openai.Image.create(prompt=prompt, n=1, size=self.image_size,
+                                                                response_format='b64_json',
+                                                                **self._options(self.image_timeout)),
+                                    self.max_retries)
+            image = base64.b64decode(response['data'][0]['b64_json'])
+            record.bytes = len(image)
+        return image
+
+    def _create_embeddings(self, inputs):
+        with metrics.timer('openai.embeddings', rows=len(inputs)):
+            response = with_retries(lambda: openai.Embedding.create(input=inputs, model=self.embedding_model,
+                                                                    **self._options(self.embedding_timeout)),
+                                    self.max_retries)
+        return [row['embedding'] for row in sorted(response['data'], key=lambda row: row['index'])]
+
+    def embeddings(self, inputs):
+        """One embedding per string in ``inputs``; whatever the cache lacks comes from a single request."""
+        inputs = list(inputs)
+        if self.embedding_cache is None:
+            return self._create_embeddings(inputs)
+
+        results = self.embedding_cache.get_many(self.embedding_model, inputs)
+        missing = list(dict.fromkeys(prompt for prompt, result in zip(inputs, results) if result is None))
+        if missing:
+            start = time.perf_counter()
+            created = self._create_embeddings(missing)
+            self.embedding_cache.put_many(self.embedding_model, missing, created,
+                                          (time.perf_counter() - start) / len(missing))
+            by_prompt = dict(zip(missing, created))
+            results = [by_prompt[prompt] if result is None else result for prompt, result in zip(inputs, results)]
+        return results
+
+    def embedding(self, prompt):
+        return self.embeddings([prompt])[0]
+
+    def submit_image(self, prompt):
+        return self._pool.submit(self.image, prompt)
+
+    def submit_embedding(self, prompt):
+        return self._pool.submit(self.embedding, prompt)
+
+    def submit(self, prompt):
+        """(image future, embedding future) for ``prompt``, both already running."""
+        return self.submit_image(prompt), self.submit_embedding(prompt)
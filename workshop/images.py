@@ -0,0 +1,224 @@
+"""Server-side cache for the generated images stored in S3.
+
+Images are fetched through the app's bucket once, then served from a
+byte-bounded in-memory LRU backed by a byte-bounded LRU directory on disk.
+Thumbnails are rendered once and cached the same way. ``prefetch`` warms the
+cache in background threads, and concurrent requests for the same image share
+one download. An image that cannot be fetched gives ``None`` rather than an
+error, so one missing object does not take the page down with it.
+"""
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from workshop import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIRECTORY = './temp'
+DEFAULT_MEMORY_BYTES = 64 * 2**20
+DEFAULT_DISK_BYTES = 1024 * 2**20
+DEFAULT_THUMBNAIL_SIZE = (96, 96)
+DEFAULT_PREFETCH_WORKERS = 4
+
+
+class LRUBytes:
+    """LRU of values bounded by their total size in bytes. ``evict(key, value)`` is called for each one pushed out."""
+
+    def __init__(self, max_bytes, evict=None):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._evict = evict
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        if key not in self._items:
+            return None
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key, value, size=None):
+        if key in self._items:
+            self.nbytes -= self._items.pop(key)[1]
+        size = len(value) if size is None else size
+        self._items[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes and len(self._items) > 1:
+            old_key, (old_value, old_size) = self._items.popitem(last=False)
+            self.nbytes -= old_size
+            if self._evict is not None:
+                self._evict(old_key, old_value)
+
+
+class ImageCache:
+
+    def __init__(self, s3_bucket, directory=DEFAULT_DIRECTORY, memory_bytes=DEFAULT_MEMORY_BYTES,
+                 disk_bytes=DEFAULT_DISK_BYTES, thumbnail_size=DEFAULT_THUMBNAIL_SIZE,
+                 prefetch_workers=DEFAULT_PREFETCH_WORKERS):
+        self.s3_bucket = s3_bucket
+        self.directory = directory
+        self.thumbnail_size = thumbnail_size
+
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'errors': 0, 'fetch_seconds': 0.,
+                      'fetched_bytes': 0}
+
+        self._memory = LRUBytes(memory_bytes)
+        # Values are file paths; sizes are tracked explicitly.
+        self._disk = LRUBytes(disk_bytes, evict=self._remove)
+        # Prefetch tasks queued or running, so an image is only queued once.
+        self._in_flight = {}
+        # Downloads and thumbnail renders under way, shared by every caller that needs the same image.
+        self._downloads = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix='image-prefetch')
+
+        os.makedirs(directory, exist_ok=True)
+        entries = [e for e in os.scandir(directory) if e.is_file() and e.name.endswith('.png')]
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            self._disk.put(entry.name, entry.path, size=entry.stat().st_size)
+
+    @property
+    def hit_rate(self):
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.
+
+    @staticmethod
+    def _remove(name, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _name(prompt_id, thumbnail):
+        return prompt_id + ('.thumb.png' if thumbnail else '.png')
+
+    def _fetch(self, prompt_id):
+        start = time.perf_counter()
+        # The client is thread-safe; the resource the bucket came from is not.
+        response = self.s3_bucket.meta.client.get_object(Bucket=self.s3_bucket.name, Key=prompt_id + '.png')
+        data = response['Body'].read()
+        elapsed = time.perf_counter() - start
+        metrics.observe('s3.get_image', elapsed, nbytes=len(data))
+        with self._lock:
+            self.stats['fetch_seconds'] += elapsed
+            self.stats['fetched_bytes'] += len(data)
+        return data
+
+    def _thumbnail(self, data):
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(data))
+        image.thumbnail(self.thumbnail_size)
+        out = io.BytesIO()
+        image.save(out, format='PNG', optimize=True)
+        return out.getvalue()
+
+    def _store(self, name, data):
+        path = os.path.join(self.directory, name)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._memory.put(name, data)
+            self._disk.put(name, path, size=len(data))
+
+    def _load(self, prompt_id, thumbnail):
+        name = self._name(prompt_id, thumbnail)
+
+        with self._lock:
+            memory_entry = self._memory.get(name)
+            if memory_entry is not None:
+                self.stats['memory_hits'] += 1
+                return memory_entry[0]
+            disk_entry = self._disk.get(name)
+
+        if disk_entry is not None:
+            try:
+                with open(disk_entry[0], 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                pass
+            else:
+                with self._lock:
+                    self.stats['disk_hits'] += 1
+                    self._memory.put(name, data)
+                return data
+
+        # Whoever gets here first produces the image; everyone else, on any thread, waits for that result.
+        # The producer is already running, so waiting on it cannot deadlock the prefetch pool.
+        with self._lock:
+            # Another producer may have stored it since the check above.
+            memory_entry = self._memory.get(name)
+            if memory_entry is not None:
+                return memory_entry[0]
+            download = self._downloads.get(name)
+            producer = download is None
+            if producer:
+                download = self._downloads[name] = Future()
+                self.stats['misses'] += 1
+        if not producer:
+            return download.result()
+
+        try:
+            data = self._thumbnail(self._load(prompt_id, False)) if thumbnail else self._fetch(prompt_id)
+            self._store(name, data)
+        except BaseException as e:
+            download.set_exception(e)
+            raise
+        else:
+            download.set_result(data)
+            return data
+        finally:
+            with self._lock:
+                self._downloads.pop(name, None)
+
+    def _future(self, prompt_id, thumbnail):
+        name = self._name(prompt_id, thumbnail)
+        with self._lock:
+            future = self._in_flight.get(name)
+            if future is None:
+                future = self._pool.submit(self._load, prompt_id, thumbnail)
+                self._in_flight[name] = future
+                future.add_done_callback(lambda _: self._forget(name))
+        return future
+
+    def _forget(self, name):
+        with self._lock:
+            self._in_flight.pop(name, None)
+
+    def get(self, prompt_id, thumbnail=False):
+        """PNG bytes of the image (or its thumbnail) for ``prompt_id``, or None if it could not be fetched or read.
+
+        Joins a download already under way rather than starting another. Failures are not cached, so the
+        next call tries S3 again.
+        """
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        try:
+            return self._load(prompt_id, thumbnail)
+        # OSError covers PIL's UnidentifiedImageError and truncated files when rendering a thumbnail.
+        except (BotoCoreError, ClientError, OSError) as e:
+            logger.warning('Could not load the image of %s: %s', prompt_id, e)
+            with self._lock:
+                self.stats['errors'] += 1
+            return None
+
+    def prefetch(self, prompt_ids, thumbnail=False):
+        """Start loading images in the background; already cached ones are skipped."""
+        for prompt_id in prompt_ids:
+            name = self._name(prompt_id, thumbnail)
+            with self._lock:
+                cached = name in self._memory or name in self._disk
+            if not cached:
+                self._future(prompt_id, thumbnail)
@@ -0,0 +1,235 @@
+"""Per-stage timings, kept in process and exportable as Prometheus text or JSON.
+
+Slow stages (table reads, projections, clustering, OpenAI calls, S3 transfers)
+are wrapped in ``timer`` blocks or ``timed`` functions. Each one records its
+wall time in a histogram, along with the rows and bytes it handled::
+
+    with metrics.timer('openai.embeddings', rows=len(inputs)):
+        ...
+
+    with metrics.timer('s3.get_image') as record:
+        data = fetch()
+        record.bytes = len(data)
+
+Objects that already count things in a ``stats`` dict are added as
+collectors, and their numeric entries are exported as gauges. ``start_trace``
+begins a list of the stages the calling thread runs, which is how the debug
+panel shows the breakdown of one Streamlit rerun. Work done on pool threads
+only shows up in the totals.
+
+``serve`` exposes ``/metrics`` (Prometheus) and ``/metrics.json`` from a daemon
+thread.
+"""
+import json
+import logging
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'workshop'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60., math.inf)
+MAX_TRACE = 1000
+
+
+def _metric_name(*parts):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', '_'.join(parts))
+
+
+class Record:
+    """What one timed call handled; ``rows`` and ``bytes`` can be filled in before the block ends."""
+
+    __slots__ = ('stage', 'rows', 'bytes', 'seconds')
+
+    def __init__(self, stage, rows=0, nbytes=0):
+        self.stage = stage
+        self.rows = rows
+        self.bytes = nbytes
+        self.seconds = 0.
+
+
+class Histogram:
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.
+        self.rows = 0
+        self.bytes = 0
+
+    def observe(self, seconds, rows=0, nbytes=0):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.rows += rows
+        self.bytes += nbytes
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return float('nan')
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def to_dict(self):
+        return {'count': self.count, 'seconds': self.sum, 'rows': self.rows, 'bytes': self.bytes,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95)}
+
+
+class Registry:
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+
+        self._stages = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._server = None
+
+    def observe(self, stage, seconds, rows=0, nbytes=0):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram(self.buckets)
+            histogram.observe(seconds, rows, nbytes)
+
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None and len(trace) < MAX_TRACE:
+            trace.append({'stage': stage, 'seconds': seconds, 'rows': rows, 'bytes': nbytes})
+
+    @contextmanager
+    def timer(self, stage, rows=0, nbytes=0):
+        record = Record(stage, rows, nbytes)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            self.observe(stage, record.seconds, record.rows, record.bytes)
+
+    def timed(self, stage):
+        """Decorator timing every call of the function as ``stage``."""
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_collector(self, name, stats):
+        """Export ``stats`` (a dict, or a function returning one) under ``name``; replaces an earlier one."""
+        with self._lock:
+            self._collectors[name] = stats
+
+    def start_trace(self):
+        """Begin recording the stages this thread runs, dropping what was recorded before."""
+        self._local.trace = []
+        return self._local.trace
+
+    def trace(self):
+        return list(getattr(self._local, 'trace', None) or [])
+
+    def _collected(self):
+        with self._lock:
+            collectors = dict(self._collectors)
+        values = {}
+        for name, stats in collectors.items():
+            try:
+                values[name] = dict(stats() if callable(stats) else stats)
+            except Exception as e:
+                logger.warning('Metrics collector %s failed: %r', name, e)
+        return values
+
+    def snapshot(self):
+        with self._lock:
+            stages = {stage: histogram.to_dict() for stage, histogram in sorted(self._stages.items())}
+        return {'time': time.time(), 'stages': stages, 'collectors': self._collected()}
+
+    def to_json(self):
+        """One JSON line, e.g. for a periodic log."""
+        return json.dumps(self.snapshot(), default=str)
+
+    def to_prometheus(self, prefix=PREFIX):
+        lines = []
+        with self._lock:
+            stages = sorted((stage, h.counts[:], h.count, h.sum, h.rows, h.bytes)
+                            for stage, h in self._stages.items())
+
+        name = _metric_name(prefix, 'stage_seconds')
+        lines += [f'# HELP {name} Wall time of each stage.', f'# TYPE {name} histogram']
+        for stage, counts, count, total, _, _ in stages:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = '+Inf' if math.isinf(bound) else repr(bound)
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+        for field, index in [('rows', 4), ('bytes', 5)]:
+            name = _metric_name(prefix, 'stage', field, 'total')
+            lines += [f'# HELP {name} {field.capitalize()} handled by each stage.', f'# TYPE {name} counter']
+            lines += [f'{name}{{stage="{stage[0]}"}} {stage[index]}' for stage in stages]
+
+        for collector, values in sorted(self._collected().items()):
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = _metric_name(prefix, collector, key)
+                lines += [f'# TYPE {name} gauge', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='0.0.0.0'):
+        """Serve ``/metrics`` and ``/metrics.json`` from a daemon thread; later calls reuse the first server."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = registry.to_prometheus(), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, content_type = registry.to_json(), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        with self._lock:
+            if self._server is None:
+                self._server = ThreadingHTTPServer((host, port), Handler)
+                threading.Thread(target=self._server.serve_forever, daemon=True, name='metrics-server').start()
+            return self._server
+
+
+REGISTRY = Registry()
+
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+timed = REGISTRY.timed
+add_collector = REGISTRY.add_collector
+start_trace = REGISTRY.start_trace
+trace = REGISTRY.trace
@@ -0,0 +1,54 @@
+"""Rewrite rows that still store their embedding as a list of Decimals in the packed binary format.
+
+    python -m workshop.migrate_embeddings --table <name> [--dtype float16] [--session-id <id>] [--dry-run]
+"""
+import argparse
+
+from boto3.dynamodb.conditions import Attr
+
+from workshop.cli import add_table_arguments, dynamodb_table
+from workshop.embeddings import (DEFAULT_DTYPE, DTYPE_ATTRIBUTE, DTYPES, EMBEDDING_ATTRIBUTE, encode_embedding,
+                                 is_legacy)
+from workshop.store import KEY_ATTRIBUTE, SESSION_ATTRIBUTE, iter_pages
+
+
+def migrate(table, dtype=DEFAULT_DTYPE, session_id=None, dry_run=False, report_every=500):
+    scan_kwargs = {}
+    if session_id is not None:
+        scan_kwargs['FilterExpression'] = Attr(SESSION_ATTRIBUTE).eq(session_id)
+
+    scanned = migrated = 0
+    with table.batch_writer(overwrite_by_pkeys=[KEY_ATTRIBUTE]) as batch:
+        for page in iter_pages(table.scan, **scan_kwargs):
+            for item in page:
+                scanned += 1
+                if not is_legacy(item):
+                    continue
+
+                item[EMBEDDING_ATTRIBUTE] = encode_embedding(item[EMBEDDING_ATTRIBUTE], dtype)
+                item[DTYPE_ATTRIBUTE] = dtype
+                if not dry_run:
+                    batch.put_item(Item=item)
+                migrated += 1
+
+            if scanned // report_every != (scanned - len(page)) // report_every:
+                print(f'{scanned} rows scanned, {migrated} migrated')
+
+    return scanned, migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_table_arguments(parser)
+    parser.add_argument('--dtype', choices=list(DTYPES), default=DEFAULT_DTYPE)
+    parser.add_argument('--session-id', default=None, help='Only migrate rows from this session')
+    parser.add_argument('--dry-run', action='store_true', help='Count legacy rows without writing anything')
+    args = parser.parse_args()
+
+    scanned, migrated = migrate(dynamodb_table(args), dtype=args.dtype, session_id=args.session_id,
+                                dry_run=args.dry_run)
+    print(f'Done: {scanned} rows scanned, {migrated} {"would be " if args.dry_run else ""}migrated')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Scatter plots of a projection that stay responsive however many prompts there are.
+
+``ScatterView`` picks one of three renderings from the number of points in
+view:
+
+* ``svg``: plotly's default, for up to ``webgl_threshold`` points.
+* ``webgl``: the same figure drawn with ``Scattergl``, for up to ``max_points``.
+* ``density``: a ``histogram2d`` of the points computed here on the server. Only
+  ``bins`` x ``bins`` counts go to the browser, whatever the session size.
+  Narrowing the view with ``x_range``/``y_range`` drills down. Once few enough
+  points remain in view, they are drawn individually again.
+
+Coordinates are rounded before serialising and each point carries only its key,
+so the payload stays bounded in every mode. ``selected_ids`` turns the events
+``plotly_events`` returns back into keys. In density mode a click selects
+every point in the clicked cell.
+"""
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+WEBGL_THRESHOLD = 2000
+MAX_POINTS = 20000
+DENSITY_BINS = 120
+COORDINATE_DECIMALS = 3
+
+
+def render_mode(n_points, webgl_threshold=WEBGL_THRESHOLD, max_points=MAX_POINTS):
+    if n_points > max_points:
+        return 'density'
+    return 'webgl' if n_points > webgl_threshold else 'svg'
+
+
+class ScatterView:
+
+    def __init__(self, frame, x, y, key='prompt_id', x_range=None, y_range=None, webgl_threshold=WEBGL_THRESHOLD,
+                 max_points=MAX_POINTS, bins=DENSITY_BINS):
+        self.x, self.y, self.key = x, y, key
+        self.bins = bins
+
+        in_view = np.ones(len(frame), dtype=bool)
+        for column, bounds in [(x, x_range), (y, y_range)]:
+            if bounds is not None:
+                in_view &= frame[column].between(*bounds).to_numpy()
+        self.frame = frame[in_view]
+        self.hidden = len(frame) - len(self.frame)
+        self.mode = render_mode(len(self.frame), webgl_threshold, max_points)
+
+        self._cells = None
+        self._edges = None
+
+    def figure(self, **scatter_kwargs):
+        """Plotly figure of the points in view; ``scatter_kwargs`` go to ``px.scatter`` (colour, symbols...)."""
+        if self.mode == 'density':
+            return self._density_figure()
+
+        data = self.frame.assign(**{c: self.frame[c].round(COORDINATE_DECIMALS) for c in (self.x, self.y)})
+        return px.scatter(data_frame=data, x=self.x, y=self.y, custom_data=[self.key],
+                          render_mode='webgl' if self.mode == 'webgl' else 'svg', **scatter_kwargs)
+
+    def _density_figure(self):
+        xs, ys = self.frame[self.x].to_numpy(), self.frame[self.y].to_numpy()
+        counts, x_edges, y_edges = np.histogram2d(xs, ys, bins=self.bins)
+        self._edges = (x_edges, y_edges)
+
+        # Empty cells are left blank rather than drawn as the lowest colour.
+        z = np.where(counts > 0, counts, np.nan).T
+        centers = [np.round((e[:-1] + e[1:]) / 2, COORDINATE_DECIMALS) for e in (x_edges, y_edges)]
+        fig = go.Figure(go.Heatmap(x=centers[0], y=centers[1], z=z, colorscale='Viridis',
+                                   colorbar={'title': 'Prompts'},
+                                   hovertemplate='%{z:.0f} prompts<extra></extra>'))
+        fig.update_layout(xaxis_title=self.x, yaxis_title=self.y)
+        return fig
+
+    def _cell_of(self, xs, ys):
+        x_edges, y_edges = self._edges
+        col = np.clip(np.searchsorted(x_edges, xs, side='right') - 1, 0, len(x_edges) - 2)
+        row = np.clip(np.searchsorted(y_edges, ys, side='right') - 1, 0, len(y_edges) - 2)
+        return row * (len(x_edges) - 1) + col
+
+    def selected_ids(self, fig, points):
+        """Keys of the points behind ``plotly_events`` results, without duplicates, in event order.
+
+        Call it with the figure ``figure()`` returned for this view.
+        """
+        if self.mode != 'density':
+            return list(dict.fromkeys(fig.data[p['curveNumber']].customdata[p['pointIndex']][0] for p in points))
+
+        if self._cells is None:
+            self._cells = self._cell_of(self.frame[self.x].to_numpy(), self.frame[self.y].to_numpy())
+        clicked = self._cell_of(np.array([p['x'] for p in points]), np.array([p['y'] for p in points]))
+        keys = self.frame[self.key].to_numpy()
+        return list(dict.fromkeys(keys[i] for cell in clicked for i in np.flatnonzero(self._cells == cell)))
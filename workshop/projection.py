@@ -0,0 +1,162 @@
+"""2-D projections of session embeddings that survive reruns and new rows.
+
+``ProjectionCache`` keeps the fitted reducer for each session together with
+the coordinates it produced, keyed by the ids of the rows it has seen. A rerun
+over the same rows is a dictionary lookup, a handful of new rows is placed with
+``reducer.transform``, and a full refit only happens once the rows added since
+the last fit exceed ``refit_fraction`` of the rows that fit was made on.
+
+Reducers are ``workshop.reducers.ReducerPipeline`` objects; each backend gets
+its own cache entry. Given a ``workshop.neighbors.NeighborIndex`` over the same
+rows, large UMAP fits without a pre-stage reuse its neighbour graph, and
+reducers that cannot transform (t-SNE, or UMAP fitted on that graph) place new
+rows at the distance-weighted mean of their nearest projected neighbours, which
+is where UMAP's own transform starts from. Without an index they refit instead.
+"""
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+from workshop import metrics
+from workshop.reducers import DEFAULT_BACKEND, DEFAULT_PRESTAGE, N_NEIGHBORS, ReducerPipeline
+
+DEFAULT_REFIT_FRACTION = 0.2
+
+# UMAP computes exact distances itself below this many rows, so a precomputed graph only pays off above it.
+PRECOMPUTED_KNN_MIN_ROWS = 4096
+
+
+def fingerprint(ids):
+    return hashlib.blake2b('\0'.join(ids).encode(), digest_size=16).hexdigest()
+
+
+class ProjectionCache:
+
+    def __init__(self, refit_fraction=DEFAULT_REFIT_FRACTION, prestage=DEFAULT_PRESTAGE, **pipeline_kwargs):
+        self.refit_fraction = refit_fraction
+        self.prestage = prestage
+        self.pipeline_kwargs = pipeline_kwargs
+
+        self.stats = {'hits': 0, 'partial_hits': 0, 'misses': 0, 'fit_seconds': 0., 'transform_seconds': 0.}
+
+        self._entries = {}
+        # Guards _entries, _key_locks and stats. Fits and transforms only hold the lock of their own key, so a
+        # slow fit of one session or backend does not hold up hits, or other fits, on the others.
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _lookup(self, key, fp):
+        """The entry of ``key`` and, if it was made for exactly the ids of ``fp``, its coordinates."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['fingerprint'] == fp:
+                self.stats['hits'] += 1
+                return entry, entry['coords']
+            return entry, None
+
+    def _fit(self, ids, embeddings, rows, backend, neighbors):
+        reducer = ReducerPipeline(backend=backend, prestage=self.prestage, **self.pipeline_kwargs)
+        knn = None
+        if (neighbors is not None and reducer.uses_knn and len(ids) >= PRECOMPUTED_KNN_MIN_ROWS
+                and len(neighbors) == len(ids) and neighbors.ids == ids):
+            knn = neighbors.knn_graph(N_NEIGHBORS)
+
+        start = time.perf_counter()
+        coords = reducer.fit_transform(embeddings[rows], knn=knn)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats['fit_seconds'] += elapsed
+            self.stats['misses'] += 1
+        metrics.observe(f'projection.fit.{backend}', elapsed, rows=len(ids))
+
+        return {'reducer': reducer, 'ids': list(ids), 'coords': coords, 'fit_rows': len(ids), 'added': 0,
+                'positions': {id_: row for row, id_ in enumerate(ids)}, 'fingerprint': fingerprint(ids)}
+
+    @staticmethod
+    def _place(entry, vectors, neighbors):
+        # Ask for extra neighbours: some of them may be other new rows that have no coordinates yet.
+        found, distances = neighbors.query(vectors, N_NEIGHBORS + len(vectors))
+        coords = np.empty((len(vectors), 2), dtype=entry['coords'].dtype)
+        for i, (row_ids, row_distances) in enumerate(zip(found, distances)):
+            known = [(entry['positions'][id_], d) for id_, d in zip(row_ids, row_distances)
+                     if id_ in entry['positions']][:N_NEIGHBORS]
+            if not known:
+                # The index holds none of the projected rows near this one; the middle of the plot is the least
+                # misleading place for it until the next refit.
+                coords[i] = entry['coords'].mean(axis=0)
+                continue
+            positions, d = zip(*known)
+            weights = 1 / (np.asarray(d) + 1e-3)
+            coords[i] = weights @ entry['coords'][list(positions)] / weights.sum()
+        return coords
+
+    def _extend(self, entry, ids, embeddings, rows, new_rows, neighbors):
+        start = time.perf_counter()
+        vectors = embeddings[rows[new_rows]]
+        if entry['reducer'].supports_transform:
+            new_coords = entry['reducer'].transform(vectors)
+        else:
+            new_coords = self._place(entry, vectors, neighbors)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats['transform_seconds'] += elapsed
+            self.stats['partial_hits'] += 1
+        metrics.observe('projection.transform', elapsed, rows=len(new_rows))
+
+        # A new entry rather than an update, so callers reading the old one never see it half extended.
+        new_ids = [ids[row] for row in new_rows]
+        positions = dict(entry['positions'])
+        positions.update((id_, len(entry['ids']) + i) for i, id_ in enumerate(new_ids))
+        return dict(entry, ids=entry['ids'] + new_ids, positions=positions, added=entry['added'] + len(new_rows),
+                    coords=np.concatenate([entry['coords'], new_coords]))
+
+    def project(self, key, ids, embeddings, rows=None, backend=DEFAULT_BACKEND, neighbors=None):
+        """(N, 2) coordinates for ``ids``.
+
+        The embedding of ``ids[i]`` is ``embeddings[rows[i]]``, or ``embeddings[i]`` when ``rows`` is None.
+        Only rows that actually need fitting or transforming are read from ``embeddings``. ``neighbors`` is
+        an optional NeighborIndex that already contains ``ids``.
+        """
+        ids = list(ids)
+        rows = np.arange(len(ids)) if rows is None else np.asarray(rows)
+        fp = fingerprint(ids)
+
+        key = (key, backend)
+        entry, coords = self._lookup(key, fp)
+        if coords is not None:
+            return coords
+
+        with self._key_lock(key):
+            # Another caller may have fitted or extended the entry while this one waited for the lock.
+            entry, coords = self._lookup(key, fp)
+            if coords is not None:
+                return coords
+
+            if entry is not None:
+                new_rows = [row for row, id_ in enumerate(ids) if id_ not in entry['positions']]
+                added = entry['added'] + len(new_rows)
+                if not new_rows:
+                    with self._lock:
+                        self.stats['hits'] += 1
+                elif ((entry['reducer'].supports_transform or neighbors is not None)
+                      and entry['fit_rows'] > N_NEIGHBORS and added <= self.refit_fraction * entry['fit_rows']):
+                    entry = self._extend(entry, ids, embeddings, rows, new_rows, neighbors)
+                else:
+                    entry = None
+
+            if entry is None:
+                entry = self._fit(ids, embeddings, rows, backend, neighbors)
+
+            coords = entry['coords'][[entry['positions'][id_] for id_ in ids]]
+            if len(ids) == len(entry['ids']):
+                entry = dict(entry, ids=ids, coords=coords, fingerprint=fp,
+                             positions={id_: row for row, id_ in enumerate(ids)})
+            with self._lock:
+                self._entries[key] = entry
+            return coords
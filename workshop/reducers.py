@@ -0,0 +1,138 @@
+"""Dimensionality-reduction pipelines behind one ``fit_transform``/``transform`` interface.
+
+A pipeline is an optional linear pre-stage followed by a 2-D backend:
+
+- pre-stages: ``slice`` (the first n dimensions, as the pages always did, and
+  the default), ``pca`` (IncrementalPCA fitted batch by batch) and ``random``
+  (Gaussian random projection), or ``None`` to feed the backend the full
+  vectors;
+- backends: ``umap``, ``pca`` and ``tsne``. t-SNE cannot place new points, so
+  ``supports_transform`` is False for it.
+
+Pre-stages are always applied in batches, so the full-width float64 copy of
+the embedding matrix that sklearn would otherwise make never exists at once.
+
+UMAP can be handed a precomputed k-nearest-neighbour graph (for instance from
+``workshop.neighbors.NeighborIndex``) to skip its own neighbour search. The
+graph is over the full vectors by ``KNN_METRIC``, so it is only used without a
+pre-stage, which would change the space UMAP sees, and UMAP is then fitted
+with that metric too. It has no search index to place new points with
+afterwards, so such a pipeline reports ``supports_transform`` as False.
+"""
+import numpy as np
+
+PRESTAGES = ('slice', 'pca', 'random')
+BACKENDS = ('umap', 'pca', 'tsne')
+
+DEFAULT_BACKEND = 'umap'
+DEFAULT_PRESTAGE = 'slice'
+DEFAULT_PRESTAGE_COMPONENTS = 128
+DEFAULT_BATCH_SIZE = 1024
+N_NEIGHBORS = 4
+# The metric of precomputed graphs, as ``NeighborIndex`` builds them.
+KNN_METRIC = 'cosine'
+
+
+class SlicePrestage:
+
+    def __init__(self, n_components):
+        self.n_components = n_components
+
+    def partial_fit(self, X):
+        return self
+
+    def transform(self, X):
+        return X[:, :self.n_components]
+
+
+def batches(n_samples, batch_size, min_size=1):
+    """Slices covering ``range(n_samples)``; a short tail is merged into the previous batch."""
+    starts = list(range(0, n_samples, batch_size))
+    if len(starts) > 1 and n_samples - starts[-1] < min_size:
+        starts.pop()
+    return [slice(start, end) for start, end in zip(starts, starts[1:] + [n_samples])]
+
+
+class ReducerPipeline:
+
+    def __init__(self, backend=DEFAULT_BACKEND, prestage=DEFAULT_PRESTAGE, n_components=DEFAULT_PRESTAGE_COMPONENTS,
+                 n_neighbors=N_NEIGHBORS, batch_size=DEFAULT_BATCH_SIZE, random_state=42):
+        if backend not in BACKENDS:
+            raise ValueError(f'Unknown backend {backend!r}, expected one of {BACKENDS}')
+        if prestage is not None and prestage not in PRESTAGES:
+            raise ValueError(f'Unknown prestage {prestage!r}, expected one of {PRESTAGES} or None')
+
+        self.backend = backend
+        self.prestage = prestage
+        self.n_components = n_components
+        self.n_neighbors = n_neighbors
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+        self.prestage_ = None
+        self.backend_ = None
+        self.precomputed_knn_ = False
+
+    @property
+    def uses_knn(self):
+        """Whether ``fit_transform`` would use a precomputed neighbour graph."""
+        return self.backend == 'umap' and self.prestage is None
+
+    @property
+    def supports_transform(self):
+        return self.backend != 'tsne' and not self.precomputed_knn_
+
+    def _make_prestage(self, n_samples, n_features):
+        if self.prestage is None:
+            return None
+        if self.prestage == 'slice':
+            return SlicePrestage(self.n_components)
+        if self.prestage == 'pca':
+            from sklearn.decomposition import IncrementalPCA
+            # Every partial_fit batch needs at least n_components samples.
+            return IncrementalPCA(n_components=min(self.n_components, n_features, n_samples))
+        from sklearn.random_projection import GaussianRandomProjection
+        return GaussianRandomProjection(n_components=min(self.n_components, n_features),
+                                        random_state=self.random_state)
+
+    def _make_backend(self, n_samples, knn=None):
+        if self.backend == 'umap':
+            import umap
+            if knn is None:
+                return umap.UMAP(n_components=2, n_neighbors=self.n_neighbors, random_state=self.random_state)
+            indices, distances = knn
+            return umap.UMAP(n_components=2, n_neighbors=self.n_neighbors, random_state=self.random_state,
+                             metric=KNN_METRIC, precomputed_knn=(indices[:, :self.n_neighbors], distances[:, :self.n_neighbors]))
+        if self.backend == 'pca':
+            from sklearn.decomposition import PCA
+            return PCA(n_components=2, random_state=self.random_state)
+        from sklearn.manifold import TSNE
+        return TSNE(n_components=2, init='pca', perplexity=min(30., max(1., (n_samples - 1) / 3)),
+                    random_state=self.random_state)
+
+    def _apply_prestage(self, X):
+        if self.prestage_ is None:
+            return X
+        return np.concatenate([self.prestage_.transform(X[s]) for s in batches(len(X), self.batch_size)])
+
+    def fit_transform(self, X, knn=None):
+        """Fit on ``X`` and return its 2-D coordinates. ``knn`` is an optional (indices, distances) graph
+        over the rows of ``X`` by ``KNN_METRIC``, each row's own index first; only the UMAP backend without a
+        pre-stage uses it."""
+        self.prestage_ = self._make_prestage(*X.shape)
+        if self.prestage_ is not None:
+            if self.prestage == 'random':
+                self.prestage_.fit(X[:1])
+            else:
+                min_size = getattr(self.prestage_, 'n_components', 1)
+                for s in batches(len(X), max(self.batch_size, min_size), min_size):
+                    self.prestage_.partial_fit(X[s])
+
+        self.precomputed_knn_ = knn is not None and self.uses_knn
+        self.backend_ = self._make_backend(len(X), knn if self.precomputed_knn_ else None)
+        return self.backend_.fit_transform(self._apply_prestage(X))
+
+    def transform(self, X):
+        if not self.supports_transform:
+            raise NotImplementedError(f'The {self.backend} backend cannot place new points')
+        return self.backend_.transform(self._apply_prestage(X))
@@ -0,0 +1,211 @@
+"""Columnar Parquet snapshots of the workshop table for offline analysis.
+
+Each session is written as its own hive-style partition
+(``<prefix>/session_id=<id>/part-0.parquet``) with the embeddings stored as a
+fixed-size-list float32 column, serialized in memory and streamed straight to
+S3. ``read_snapshot`` memory-maps a file back into a DataFrame plus an (N, D)
+float32 matrix.
+
+Exports run off the page-render path, either in a ``SnapshotExporter`` thread
+or as a standalone process:
+
+    python -m workshop.snapshot --bucket <bucket> [--session-id <id>] [--interval 30] [--once]
+"""
+import argparse
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from workshop.cli import add_table_arguments, dynamodb_table
+from workshop.embeddings import EMBEDDING_ATTRIBUTE
+from workshop.store import PROJECTED_ATTRIBUTES, SESSION_ATTRIBUTE, TableSync
+
+SNAPSHOT_PREFIX = 'snapshots/gen_workshop'
+NUMERIC_COLUMNS = ['time', 'prompt_number', 'feedback_quality']
+
+DEFAULT_DEBOUNCE_SECONDS = 5
+DEFAULT_MAX_DELAY_SECONDS = 60
+
+TRANSFER_OPTIONS = {'multipart_threshold': 8 * 2**20, 'multipart_chunksize': 8 * 2**20, 'max_concurrency': 8}
+
+
+def snapshot_key(session_id, prefix=SNAPSHOT_PREFIX):
+    return f'{prefix}/{SESSION_ATTRIBUTE}={session_id}/part-0.parquet'
+
+
+def to_arrow(frame, embeddings):
+    import pyarrow as pa
+
+    frame = frame.drop(columns=[EMBEDDING_ATTRIBUTE], errors='ignore')
+    # DynamoDB hands numbers back as Decimal; store them as plain numbers.
+    for name in frame.columns.intersection(NUMERIC_COLUMNS):
+        frame[name] = pd.to_numeric(frame[name], errors='coerce')
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    values = pa.array(embeddings.reshape(-1))
+    return table.append_column(EMBEDDING_ATTRIBUTE,
+                               pa.FixedSizeListArray.from_arrays(values, embeddings.shape[1]))
+
+
+def to_parquet_bytes(table):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink, compression='zstd')
+    return sink.getvalue()
+
+
+def iter_partitions(frame, embeddings):
+    sessions = frame[SESSION_ATTRIBUTE].to_numpy()
+    for session_id in pd.unique(sessions):
+        rows = np.flatnonzero(sessions == session_id)
+        yield session_id, to_arrow(frame.iloc[rows].drop(columns=[SESSION_ATTRIBUTE]), embeddings[rows])
+
+
+def write_snapshot(s3_bucket, frame, embeddings, prefix=SNAPSHOT_PREFIX):
+    """Upload one Parquet object per session in ``frame``. Returns the keys written."""
+    from boto3.s3.transfer import TransferConfig
+
+    keys = []
+    for session_id, table in iter_partitions(frame, embeddings):
+        # A (multipart) upload only becomes visible once it completes, so readers never see half a file.
+        key = snapshot_key(session_id, prefix)
+        s3_bucket.upload_fileobj(io.BytesIO(to_parquet_bytes(table)), key, Config=TransferConfig(**TRANSFER_OPTIONS))
+        keys.append(key)
+    return keys
+
+
+def write_snapshot_local(directory, frame, embeddings, prefix=SNAPSHOT_PREFIX):
+    """Same layout as ``write_snapshot`` under a local directory, replacing each file atomically."""
+    paths = []
+    for session_id, table in iter_partitions(frame, embeddings):
+        path = os.path.join(directory, snapshot_key(session_id, prefix))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(to_parquet_bytes(table))
+        os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+
+def read_snapshot(path, columns=None):
+    """Memory-map a snapshot file. Returns the metadata DataFrame and the (N, D) float32 embedding matrix."""
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path, columns=columns, memory_map=True)
+
+    embeddings = None
+    if EMBEDDING_ATTRIBUTE in table.column_names:
+        column = table.column(EMBEDDING_ATTRIBUTE).combine_chunks()
+        embeddings = column.flatten().to_numpy().reshape(len(column), column.type.list_size)
+        table = table.drop_columns([EMBEDDING_ATTRIBUTE])
+
+    return table.to_pandas(), embeddings
+
+
+class SnapshotExporter:
+    """One background thread per process that uploads the latest snapshot once new rows stop arriving.
+
+    ``notify`` only records the newest data and returns immediately. The upload starts after ``debounce``
+    seconds without another notification, or ``max_delay`` seconds after the first one, whichever is sooner.
+    """
+
+    def __init__(self, s3_bucket, prefix=SNAPSHOT_PREFIX, debounce=DEFAULT_DEBOUNCE_SECONDS,
+                 max_delay=DEFAULT_MAX_DELAY_SECONDS):
+        self.s3_bucket = s3_bucket
+        self.prefix = prefix
+        self.debounce = debounce
+        self.max_delay = max_delay
+
+        self.exported_version = None
+        self.exports = 0
+        self.last_export_seconds = None
+
+        self._pending = None
+        self._pending_version = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='snapshot-exporter', daemon=True)
+        self._thread.start()
+
+    def notify(self, frame, embeddings, version):
+        with self._lock:
+            if self._pending_version is not None and version <= self._pending_version:
+                return
+            self._pending = (frame, embeddings)
+            self._pending_version = version
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            first = time.monotonic()
+            while True:
+                self._wake.clear()
+                if not self._wake.wait(self.debounce) or time.monotonic() - first >= self.max_delay:
+                    break
+
+            with self._lock:
+                pending, version = self._pending, self._pending_version
+                self._pending = None
+            if pending is None:
+                continue
+
+            start = time.perf_counter()
+            try:
+                write_snapshot(self.s3_bucket, *pending, prefix=self.prefix)
+            except Exception:
+                logging.exception('Snapshot export of version %s failed', version)
+                continue
+            self.last_export_seconds = time.perf_counter() - start
+            self.exported_version = version
+            self.exports += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_table_arguments(parser)
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--bucket', help='S3 bucket to upload snapshots to')
+    output.add_argument('--output-dir', help='Write snapshots under this local directory instead of S3')
+    parser.add_argument('--prefix', default=SNAPSHOT_PREFIX)
+    parser.add_argument('--session-id', default=None, help='Only export this session (default: all sessions)')
+    parser.add_argument('--index-name', default=None, help='session_id/time index to query with --session-id')
+    parser.add_argument('--interval', type=float, default=30, help='Seconds between incremental syncs')
+    parser.add_argument('--once', action='store_true', help='Export once and exit')
+    args = parser.parse_args()
+
+    table_sync = TableSync(dynamodb_table(args), session_id=args.session_id, index_name=args.index_name,
+                           attributes=PROJECTED_ATTRIBUTES)
+    if args.bucket:
+        import boto3
+        s3_bucket = boto3.resource('s3', region_name=args.region).Bucket(args.bucket)
+
+    while True:
+        if table_sync.sync(max_age=0):
+            frame, embeddings, _ = table_sync.snapshot()
+            start = time.perf_counter()
+            if args.bucket:
+                written = write_snapshot(s3_bucket, frame, embeddings, prefix=args.prefix)
+            else:
+                written = write_snapshot_local(args.output_dir, frame, embeddings, prefix=args.prefix)
+            print(f'Exported {len(frame)} rows to {len(written)} partitions in {time.perf_counter() - start:.1f}s')
+
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
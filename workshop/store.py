@@ -0,0 +1,276 @@
+"""Incremental, columnar mirror of the workshop DynamoDB table.
+
+A ``TableSync`` does one (optionally segmented, parallel) full scan the first
+time it is synced and afterwards only asks DynamoDB for rows at or after a
+``time`` watermark, so repeated page loads stop paying for a full-table read.
+
+Given a ``session_id`` and the name of a ``session_id``/``time`` global
+secondary index it reads just that session's partition with ``Query`` instead,
+falling back to a filtered scan when the index does not exist.
+
+The index is what makes incremental syncs cheap. Without it the watermark can
+only go into a scan's ``FilterExpression``, which DynamoDB applies after
+reading: every sync still reads, and bills, the whole table and merely returns
+fewer rows. ``TableSync`` logs a warning the first time that happens.
+
+Every embedding is stacked into one matrix, so they must all have the same
+dimension: the most common one among the first rows read. Rows of another
+dimension, e.g. embedded by a different model, are logged by ``prompt_id``,
+counted in ``stats['skipped']`` and left out.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, reduce
+from operator import and_
+
+import numpy as np
+import pandas as pd
+
+from workshop import metrics
+from workshop.embeddings import DTYPE_ATTRIBUTE, EMBEDDING_ATTRIBUTE, decode_embeddings, embedding_dim
+
+KEY_ATTRIBUTE = 'prompt_id'
+WATERMARK_ATTRIBUTE = 'time'
+SESSION_ATTRIBUTE = 'session_id'
+
+# Everything the analysis pages read. `time` is only kept because it drives the watermark.
+PROJECTED_ATTRIBUTES = [KEY_ATTRIBUTE, SESSION_ATTRIBUTE, WATERMARK_ATTRIBUTE, 'user', 'prompt', 'final_prompt',
+                        EMBEDDING_ATTRIBUTE, DTYPE_ATTRIBUTE, 'prompt_number', 'category', 'features', 'feedback_quality',
+                        'feedback_fidelity', 'feedback_distortion', 'feedback_bias', 'feedback_notes']
+
+DEFAULT_SEGMENTS = 4
+DEFAULT_MAX_AGE = 30
+
+# `time` is stamped when the image is generated, not when the row is submitted, so rows can land in the
+# table a while after rows with a later `time`. Re-reading this far behind the watermark catches them.
+DEFAULT_LOOKBACK_SECONDS = 15 * 60
+
+# How a query on a missing index fails: DynamoDB says ValidationException, DynamoDB Local and moto
+# ResourceNotFoundException.
+INDEX_ERRORS = ('ValidationException', 'ResourceNotFoundException')
+
+
+def iter_pages(call, **kwargs):
+    response = call(**kwargs)
+    yield response['Items']
+    while 'LastEvaluatedKey' in response:
+        response = call(ExclusiveStartKey=response['LastEvaluatedKey'], **kwargs)
+        yield response['Items']
+
+
+def embedding_rows(frame):
+    """Positions of ``frame``'s rows (a filter of ``TableSync.frame()``) in ``TableSync.embeddings()``."""
+    return frame.index.to_numpy()
+
+
+def projection(attributes):
+    names = {f'#p{i}': name for i, name in enumerate(attributes)}
+    return {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
+
+
+class TableSync:
+    """Local columnar copy of a DynamoDB table that is kept up to date incrementally."""
+
+    def __init__(self, table, session_id=None, index_name=None, attributes=None, segments=DEFAULT_SEGMENTS,
+                 lookback=DEFAULT_LOOKBACK_SECONDS):
+        self.table = table
+        self.session_id = session_id
+        self.index_name = index_name if session_id is not None else None
+        self.attributes = attributes
+        self.segments = segments
+        self.lookback = lookback
+
+        self.stats = {'requests': 0, 'scanned': 0, 'returned': 0, 'capacity_units': 0., 'seconds': 0., 'skipped': 0}
+
+        self.watermark = None
+        self.version = 0
+        self.last_sync = None
+        self._warned_full_scan = False
+
+        self._columns = {}
+        self._positions = {}
+        self._skipped = set()
+        self._blocks = []
+        self._embeddings = None
+        self._frame = None
+        self._lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _request(self, operation, **kwargs):
+        if self.attributes:
+            kwargs.update(projection(self.attributes))
+
+        # The low-level client is thread-safe (resources are not) and, coming from the resource, still
+        # speaks plain Python types and condition objects.
+        call = getattr(self.table.meta.client, operation)
+
+        start = time.perf_counter()
+        response = call(TableName=self.table.name, ReturnConsumedCapacity='TOTAL', **kwargs)
+        elapsed = time.perf_counter() - start
+        # DynamoDB states the size of every response; some stand-ins (moto) leave it out.
+        headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+        metrics.observe(f'dynamodb.{operation}', elapsed, rows=response.get('Count', 0),
+                        nbytes=int(headers.get('content-length', 0)))
+
+        with self._stats_lock:
+            self.stats['requests'] += 1
+            self.stats['scanned'] += response.get('ScannedCount', 0)
+            self.stats['returned'] += response.get('Count', 0)
+            self.stats['capacity_units'] += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
+            self.stats['seconds'] += elapsed
+
+        return response
+
+    def _scan_filter(self, since=None):
+        from boto3.dynamodb.conditions import Attr
+
+        conditions = []
+        if self.session_id is not None:
+            conditions.append(Attr(SESSION_ATTRIBUTE).eq(self.session_id))
+        if since is not None:
+            conditions.append(Attr(WATERMARK_ATTRIBUTE).gte(since))
+
+        if not conditions:
+            return {}
+        return {'FilterExpression': reduce(and_, conditions)}
+
+    def _scan_segment(self, segment):
+        items = []
+        for page in iter_pages(partial(self._request, 'scan'), Segment=segment, TotalSegments=self.segments,
+                               **self._scan_filter()):
+            items.extend(page)
+        return items
+
+    def _cold_scan(self):
+        if self.segments <= 1:
+            return sum(self._append(page) for page in iter_pages(partial(self._request, 'scan'),
+                                                                 **self._scan_filter()))
+
+        with ThreadPoolExecutor(max_workers=self.segments) as pool:
+            return sum(self._append(items) for items in pool.map(self._scan_segment, range(self.segments)))
+
+    def _query(self, since=None):
+        from boto3.dynamodb.conditions import Key
+
+        condition = Key(SESSION_ATTRIBUTE).eq(self.session_id)
+        if since is not None:
+            condition = condition & Key(WATERMARK_ATTRIBUTE).gte(since)
+
+        return sum(self._append(page) for page in iter_pages(partial(self._request, 'query'),
+                                                             IndexName=self.index_name,
+                                                             KeyConditionExpression=condition))
+
+    def _load(self):
+        from botocore.exceptions import ClientError
+
+        since = None if self.watermark is None else self.watermark - self.lookback
+
+        if self.index_name is not None:
+            try:
+                return self._query(since)
+            except ClientError as e:
+                if e.response['Error']['Code'] not in INDEX_ERRORS:
+                    raise
+                logging.warning('Index %s is not usable (%s), falling back to a filtered scan',
+                                self.index_name, e.response['Error'].get('Message'))
+                self.index_name = None
+
+        if since is None:
+            return self._cold_scan()
+        if not self._warned_full_scan:
+            logging.warning('Incremental sync of %s without a session_id/time index: every sync scans and is '
+                            'billed for the whole table', self.table.name)
+            self._warned_full_scan = True
+        return sum(self._append(page) for page in iter_pages(partial(self._request, 'scan'),
+                                                             **self._scan_filter(since)))
+
+    def _append(self, items):
+        new_items = {}
+        for x in items:
+            key = x[KEY_ATTRIBUTE]
+            if key not in self._positions and key not in self._skipped and key not in new_items:
+                new_items[key] = x
+        if not new_items:
+            return 0
+
+        # Every block must match the rows already stored, or they cannot be stacked into one matrix.
+        dims = {key: embedding_dim(x) for key, x in new_items.items()}
+        dim = self._blocks[0].shape[1] if self._blocks else Counter(dims.values()).most_common(1)[0][0]
+        skipped = [key for key, d in dims.items() if d != dim]
+        if skipped:
+            logging.warning('Skipping %d row(s) whose embeddings are not %d-dimensional (made by another embedding '
+                            'model?): %s', len(skipped), dim, ', '.join(skipped))
+            self._skipped.update(skipped)
+            with self._stats_lock:
+                self.stats['skipped'] += len(skipped)
+        new_items = [x for key, x in new_items.items() if dims[key] == dim]
+        if not new_items:
+            return 0
+
+        with metrics.timer('embeddings.decode', rows=len(new_items)) as record:
+            block = decode_embeddings(new_items, dim=dim)
+            record.bytes = block.nbytes
+        self._blocks.append(block)
+
+        for x in new_items:
+            row = len(self._positions)
+            for name in x.keys() - self._columns.keys() - {EMBEDDING_ATTRIBUTE, DTYPE_ATTRIBUTE}:
+                self._columns[name] = [None] * row
+            for name, values in self._columns.items():
+                values.append(x.get(name))
+            self._positions[x[KEY_ATTRIBUTE]] = row
+
+            t = x.get(WATERMARK_ATTRIBUTE)
+            if t is not None and (self.watermark is None or t > self.watermark):
+                self.watermark = t
+        return len(new_items)
+
+    def sync(self, max_age=DEFAULT_MAX_AGE):
+        """Pull rows that are not yet in the local store. Returns the number of rows added."""
+        with self._lock:
+            if self.last_sync is not None and time.monotonic() - self.last_sync < max_age:
+                return 0
+
+            added = self._load()
+            self.last_sync = time.monotonic()
+            if added:
+                self.version += 1
+                self._embeddings = None
+                self._frame = None
+            return added
+
+    def _embedding_matrix(self):
+        if self._embeddings is None:
+            if len(self._blocks) > 1:
+                self._blocks = [np.concatenate(self._blocks)]
+            self._embeddings = self._blocks[0] if self._blocks else np.empty((0, 0), dtype=np.float32)
+            # Handed out to every page and viewer, so nobody gets to write to it.
+            self._embeddings.setflags(write=False)
+        return self._embeddings
+
+    def embeddings(self):
+        """(N, D) float32 matrix of every embedding seen so far, in row order."""
+        with self._lock:
+            return self._embedding_matrix()
+
+    def frame(self):
+        """Metadata of every row seen so far, indexed by row position in ``embeddings()``.
+
+        There is no embedding column: select rows of the matrix with ``frame.index`` of a filtered frame.
+        Shared between callers, so copy before mutating.
+        """
+        with self._lock:
+            if self._frame is None:
+                self._frame = pd.DataFrame(self._columns)
+            return self._frame
+
+    def snapshot(self):
+        """Consistent ``(frame, embeddings, version)`` triple, taken under one lock."""
+        with self._lock:
+            return self.frame(), self._embedding_matrix(), self.version
@@ -0,0 +1,232 @@
+"""Durable write-behind queue for prompt submissions.
+
+``SubmitQueue.put`` commits the row and its image to a local SQLite file and
+returns at once. A background thread drains the file in batches. It uploads
+the images concurrently, then writes the rows with one ``batch_writer``, and
+only deletes a submission once both have landed. Failed submissions, such as
+throttled writes or S3 errors, are retried with exponential backoff. When a
+batch write fails, its rows are written one at a time, so one row the table
+rejects does not hold back the others. Each user's submissions reach the table
+in the order they were made: while one of them waits to be retried, that
+user's later ones wait behind it. After ``max_attempts`` failures a submission
+is moved to the ``dead_letters`` table, which lets the user's later ones
+through; ``retry_dead_letters`` puts them back in the queue.
+
+Rows survive a restart and are picked up by the next worker. The file is
+meant to be drained by one process, which is the Streamlit server.
+"""
+import io
+import logging
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from workshop import metrics
+from workshop.store import KEY_ATTRIBUTE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = './temp/submissions.sqlite'
+DEFAULT_BATCH_SIZE = 25
+DEFAULT_UPLOAD_WORKERS = 8
+POLL_SECONDS = 1.
+BACKOFF_BASE = 1.
+BACKOFF_MAX = 60.
+DEFAULT_MAX_ATTEMPTS = 10
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    item BLOB NOT NULL,
+    image BLOB,
+    enqueued REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    uploaded INTEGER NOT NULL DEFAULT 0
+)'''
+
+DEAD_LETTER_SCHEMA = '''CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    item BLOB NOT NULL,
+    image BLOB,
+    enqueued REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    uploaded INTEGER NOT NULL,
+    failed REAL NOT NULL,
+    error TEXT
+)'''
+
+
+class SubmitQueue:
+
+    def __init__(self, s3_bucket, table, path=DEFAULT_PATH, batch_size=DEFAULT_BATCH_SIZE,
+                 upload_workers=DEFAULT_UPLOAD_WORKERS, user_attribute='user', max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.s3_bucket = s3_bucket
+        self.table = table
+        self.path = path
+        self.batch_size = batch_size
+        self.user_attribute = user_attribute
+        self.max_attempts = max_attempts
+
+        self.stats = {'enqueued': 0, 'written': 0, 'retries': 0, 'dead_lettered': 0, 'last_error': None,
+                      'last_drain_seconds': 0., 'max_drain_seconds': 0.}
+
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._uploads = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix='submit-upload')
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(SCHEMA)
+            connection.execute(DEAD_LETTER_SCHEMA)
+
+        self._thread = threading.Thread(target=self._run, daemon=True, name='submit-queue')
+        self._thread.start()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def depth(self):
+        return self._connection().execute('SELECT COUNT(*) FROM submissions').fetchone()[0]
+
+    def dead_letters(self):
+        """Number of submissions given up on after ``max_attempts`` failures."""
+        return self._connection().execute('SELECT COUNT(*) FROM dead_letters').fetchone()[0]
+
+    def retry_dead_letters(self):
+        """Queue every dead-lettered submission again, with fresh attempts. Returns how many."""
+        with self._connection() as connection:
+            moved = connection.execute('INSERT INTO submissions (user, item, image, enqueued, uploaded) '
+                                       'SELECT user, item, image, enqueued, uploaded FROM dead_letters '
+                                       'ORDER BY id').rowcount
+            connection.execute('DELETE FROM dead_letters')
+        self._wake.set()
+        return moved
+
+    def oldest_seconds(self):
+        """How long the oldest waiting submission has been queued."""
+        oldest = self._connection().execute('SELECT MIN(enqueued) FROM submissions').fetchone()[0]
+        return 0. if oldest is None else time.time() - oldest
+
+    def put(self, item, image=None):
+        """Queue ``item`` for the table and ``image`` (PNG bytes) for ``<prompt_id>.png`` in the bucket."""
+        with metrics.timer('submit_queue.put', nbytes=len(image or b'')), self._connection() as connection:
+            connection.execute('INSERT INTO submissions (user, item, image, enqueued) VALUES (?, ?, ?, ?)',
+                               (str(item.get(self.user_attribute)), pickle.dumps(item), image, time.time()))
+        with self._stats_lock:
+            self.stats['enqueued'] += 1
+        self._wake.set()
+
+    def _ready(self):
+        """The next batch, in order, skipping every user with an earlier submission still backing off."""
+        now = time.time()
+        blocked, batch = set(), []
+        for row in self._connection().execute('SELECT id, user, item, image, enqueued, attempts, next_attempt, '
+                                              'uploaded FROM submissions ORDER BY id'):
+            user, next_attempt = row[1], row[6]
+            if next_attempt > now:
+                blocked.add(user)
+            elif user not in blocked:
+                batch.append(row)
+                if len(batch) == self.batch_size:
+                    break
+        return batch
+
+    def _upload(self, prompt_id, image):
+        with metrics.timer('s3.upload_image', nbytes=len(image)):
+            self.s3_bucket.meta.client.upload_fileobj(io.BytesIO(image), self.s3_bucket.name, prompt_id + '.png')
+
+    def _drain(self, batch):
+        items = {row[0]: pickle.loads(row[2]) for row in batch}
+        uploads = {row[0]: self._uploads.submit(self._upload, items[row[0]][KEY_ATTRIBUTE], row[3])
+                   for row in batch if row[3] is not None and not row[7]}
+
+        failed, done, errors, uploaded, last_errors = set(), [], [], [], {}
+        for id_, future in uploads.items():
+            try:
+                future.result()
+                uploaded.append(id_)
+            except Exception as e:
+                failed.add(id_)
+                errors.append(e)
+                last_errors[id_] = e
+
+        # A user's later rows must not overtake one that failed.
+        failed_users = {row[1] for row in batch if row[0] in failed}
+        to_write = [row for row in batch if row[1] not in failed_users]
+        try:
+            with metrics.timer('dynamodb.batch_write', rows=len(to_write)), \
+                    self.table.batch_writer(overwrite_by_pkeys=[KEY_ATTRIBUTE]) as writer:
+                for row in to_write:
+                    writer.put_item(Item=items[row[0]])
+            done = to_write
+        except Exception as e:
+            errors.append(e)
+            # One bad row fails the whole batch; writing them one by one isolates it. Rows the batch did
+            # write are overwritten with the same item.
+            for row in to_write:
+                if row[1] in failed_users:
+                    continue
+                try:
+                    with metrics.timer('dynamodb.put_item', rows=1):
+                        self.table.put_item(Item=items[row[0]])
+                    done.append(row)
+                except Exception as e:
+                    failed.add(row[0])
+                    failed_users.add(row[1])
+                    errors.append(e)
+                    last_errors[row[0]] = e
+
+        now = time.time()
+        dead = [row for row in batch if row[0] in failed and row[5] + 1 >= self.max_attempts]
+        retry = [row for row in batch if row[0] in failed and row[5] + 1 < self.max_attempts]
+        with self._connection() as connection:
+            connection.executemany('UPDATE submissions SET uploaded = 1, image = NULL WHERE id = ?',
+                                   [(id_,) for id_ in uploaded])
+            connection.executemany('DELETE FROM submissions WHERE id = ?', [(row[0],) for row in done])
+            connection.executemany('UPDATE submissions SET attempts = attempts + 1, next_attempt = ? WHERE id = ?',
+                                   [(now + random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** row[5])), row[0])
+                                    for row in retry])
+            connection.executemany('INSERT INTO dead_letters SELECT id, user, item, image, enqueued, attempts + 1, '
+                                   'uploaded, ?, ? FROM submissions WHERE id = ?',
+                                   [(now, repr(last_errors.get(row[0])), row[0]) for row in dead])
+            connection.executemany('DELETE FROM submissions WHERE id = ?', [(row[0],) for row in dead])
+
+        with self._stats_lock:
+            self.stats['written'] += len(done)
+            self.stats['retries'] += len(retry)
+            self.stats['dead_lettered'] += len(dead)
+            if done:
+                latency = max(now - row[4] for row in done)
+                self.stats['last_drain_seconds'] = latency
+                self.stats['max_drain_seconds'] = max(self.stats['max_drain_seconds'], latency)
+            if errors:
+                self.stats['last_error'] = repr(errors[-1])
+        for e in errors:
+            logger.warning('Submission write failed, will retry: %r', e)
+        for row in dead:
+            logger.error('Gave up on submission %s of %s after %d attempts: %r', items[row[0]].get(KEY_ATTRIBUTE),
+                         row[1], row[5] + 1, last_errors.get(row[0]))
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                batch = self._ready()
+                if batch:
+                    self._drain(batch)
+                    continue
+            except Exception:
+                logger.exception('Submit queue worker failed')
+            self._wake.wait(POLL_SECONDS)
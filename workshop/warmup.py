@@ -0,0 +1,74 @@
+"""Pay the analysis pages' one-off start-up costs before the first viewer does.
+
+The first UMAP fit in a process spends seconds importing umap, sklearn and
+numba, then JIT-compiling umap's numba functions, before it does any real work.
+``start`` runs a tiny fit, transform and clustering of random vectors on a
+background thread when the app boots. The imports and compilations are then
+done, or under way, by the time someone opens page 2 or 3.
+
+umap and pynndescent mark their functions ``cache=True``. ``configure_numba_cache``
+points ``NUMBA_CACHE_DIR`` at a directory the app can write to, so compiled
+code is kept on disk across restarts. By default numba caches next to the
+installed packages, which is usually read-only in a deployment, and then it
+caches nothing. The directory must be set before numba is first imported.
+"""
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from workshop import metrics
+from workshop.embeddings import EMBEDDING_DIM
+
+logger = logging.getLogger(__name__)
+
+NUMBA_CACHE_DIR = './temp/numba'
+WARMUP_ROWS = 256
+WARMUP_BINS = 3
+
+_lock = threading.Lock()
+_thread = None
+
+
+def configure_numba_cache(directory=NUMBA_CACHE_DIR):
+    """Use ``directory`` for numba's on-disk cache unless ``NUMBA_CACHE_DIR`` is already set."""
+    directory = os.environ.setdefault('NUMBA_CACHE_DIR', os.path.abspath(directory))
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def warm_up(rows=WARMUP_ROWS, dim=EMBEDDING_DIM, seed=0):
+    """Fit, transform and cluster random vectors through the code paths the pages use. Returns seconds taken."""
+    from workshop.drift import CentroidModel, jsd
+    from workshop.reducers import ReducerPipeline
+
+    start = time.perf_counter()
+    with metrics.timer('warmup', rows=rows):
+        X = np.random.default_rng(seed).normal(scale=0.03, size=(rows, dim)).astype(np.float32)
+        reducer = ReducerPipeline()
+        reducer.fit_transform(X[:-8])
+        reducer.transform(X[-8:])
+
+        labels = CentroidModel(WARMUP_BINS).fit(X).predict(X)
+        jsd(np.bincount(labels[:rows // 2], minlength=WARMUP_BINS), np.bincount(labels, minlength=WARMUP_BINS))
+    return time.perf_counter() - start
+
+
+def _run():
+    try:
+        logger.info('Warm-up finished in %.1fs', warm_up())
+    except Exception:
+        logger.exception('Warm-up failed')
+
+
+def start():
+    """Start the warm-up on a daemon thread, once per process. Returns the thread."""
+    global _thread
+    configure_numba_cache()
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, daemon=True, name='warmup')
+            _thread.start()
+        return _thread